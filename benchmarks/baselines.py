@@ -0,0 +1,74 @@
+""" Saved benchmark baselines and comparison against them """
+import json
+import platform
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+# Metrics with these suffixes are better higher, all others lower
+HIGHER_IS_BETTER = ("_per_sec",)
+
+
+def baseline_path(name: str) -> Path:
+    return BASELINES_DIR / f"{name}.json"
+
+
+def save(name: str, results: Dict[str, float]) -> Path:
+    """ Save the results as a named baseline (with the machine they ran). """
+    BASELINES_DIR.mkdir(exist_ok=True)
+    path = baseline_path(name)
+    path.write_text(json.dumps({
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "results": results,
+    }, indent=2))
+    return path
+
+
+def compare(name: str, results: Dict[str, float],
+            tolerance: float) -> bool:
+    """
+    Print every metric next to its baseline value.
+
+    :param name: The baseline name.
+    :param results: The current results.
+    :param tolerance: Change ratio (e.g. 0.2 for 20%) worse than the
+    baseline a metric may be before it's reported as a regression.
+    :return: True if no metric regressed.
+    """
+    baseline = json.loads(baseline_path(name).read_text())
+    print(f"Compared to baseline {name} ({baseline['created_at']}, "
+          f"{baseline['machine']}):")
+    passed = True
+    for metric, value in results.items():
+        base: Optional[float] = baseline["results"].get(metric)
+        if not base:
+            print(f"    {metric:<48} {value:>14.3f} (no baseline)")
+            continue
+        change = (value - base) / base
+        worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+        verdict = "REGRESSION" if worse > tolerance else ""
+        passed &= not verdict
+        print(f"    {metric:<48} {value:>14.3f} {base:>14.3f} "
+              f"{change:>+8.1%} {verdict}")
+    return passed
+
+
+def report(results: Dict[str, float], save_as: Optional[str] = None,
+           compare_to: Optional[str] = None,
+           tolerance: float = 0.2) -> bool:
+    """
+    Print the results, then save them and/or compare to a baseline.
+
+    :return: True if no metric regressed.
+    """
+    for metric, value in results.items():
+        print(f"    {metric:<48} {value:>14.3f}")
+    passed = True
+    if compare_to:
+        passed = compare(compare_to, results, tolerance)
+    if save_as:
+        print(f"Saved baseline {save(save_as, results)}")
+    return passed
@@ -0,0 +1,82 @@
+""" Pcap handlers throughput benchmarks on synthetic captures """
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Union
+
+import fire
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent /
+                       "pcap_parser"))
+
+from analytics import PcapAnalytics  # noqa: E402
+from fastpath import FastPcapHandler  # noqa: E402
+from index import FlowIndex, IndexedPcapHandler, build  # noqa: E402
+from main import PcapHandler, StreamingPcapHandler  # noqa: E402
+from parallel import ParallelPcapHandler  # noqa: E402
+
+import baselines  # noqa: E402
+from synthetic import pcap_fixture  # noqa: E402
+
+
+def indexed_report(capture_path: str) -> None:
+    with FlowIndex(capture_path) as flow_index:
+        IndexedPcapHandler(flow_index)
+
+
+def handlers(workers: int) -> Dict[str, Callable[[str], object]]:
+    """ :returns: Mapping of handler name to a report of a capture. """
+    return {
+        "rdpcap": PcapHandler,
+        "streaming": StreamingPcapHandler,
+        "fast": FastPcapHandler,
+        f"parallel_{workers}": lambda path: ParallelPcapHandler(
+            [path], workers=workers),
+        "index_build": build,
+        "indexed": indexed_report,
+        "analytics": lambda path: PcapAnalytics([path]),
+    }
+
+
+def best_time(run: Callable[[str], object], path: str,
+              repeat: int) -> float:
+    """ :returns: The fastest of the runs in seconds. """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(path)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main(sizes: Union[int, Sequence[int]] = (1000, 10000), seed: int = 0,
+         repeat: int = 3, workers: int = 2, save: Optional[str] = None,
+         compare: Optional[str] = None, tolerance: float = 0.2) -> None:
+    """
+    Benchmark the pcap handlers throughput on synthetic captures (HTTP,
+    DNS, UDP and ICMP conversations), written once to fixtures/.
+
+    :param sizes: Packets per capture, e.g. --sizes=1000,100000
+    :param seed: The captures random seed.
+    :param repeat: Runs per handler, the fastest counts.
+    :param workers: Processes of the parallel handler.
+    :param save: Save the results as this baseline name.
+    :param compare: Compare the results to this baseline name.
+    :param tolerance: Change ratio worse than the baseline reported as a
+    regression.
+    """
+    sizes = (sizes,) if isinstance(sizes, int) else tuple(sizes)
+    results = {}
+    for packets in sizes:
+        path = str(pcap_fixture(packets, seed))
+        build(path)
+        print(f"Pcap benchmarks: {path}")
+        for name, run in handlers(workers).items():
+            seconds = best_time(run, path, repeat)
+            results[f"{name}_{packets}_packets_per_sec"] = packets / seconds
+    if not baselines.report(results, save, compare, tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
@@ -0,0 +1,251 @@
+""" Sampler, ingest and query paths benchmarks of the server, offline """
+import asyncio
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import fire
+import httpx
+from beanie import init_beanie
+from fastapi import FastAPI
+from loguru import logger
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "server"))
+
+from api import (  # noqa: E402
+    nics_router, bandwidth_router, stats_router,
+)
+from config import settings  # noqa: E402
+from counters import counters_source  # noqa: E402
+from ingest import IngestedSample, ingest_pipeline  # noqa: E402
+from models import (  # noqa: E402
+    NIC, BandwidthRollup, BandwidthSample, LeaderLease, NicLinkEvent,
+)
+from ring_buffer import RingBufferStore, recent_samples  # noqa: E402
+from rollups import RollupStore, RollupTier, rollups  # noqa: E402
+from sampler import NicSampler  # noqa: E402
+from thresholds import ThresholdEngine, threshold_engine  # noqa: E402
+from writer import sample_writer  # noqa: E402
+
+import baselines  # noqa: E402
+from synthetic import SyntheticCounters  # noqa: E402
+
+SECONDS_IN_HOUR = 3600
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def init_database(nic_names: List[str]) -> None:
+    """ Init the models on an in-memory Mongo stand-in with the nics. """
+    await init_beanie(database=AsyncMongoMockClient(tz_aware=True)["bench"],
+                      document_models=[NIC, BandwidthSample,
+                                       BandwidthRollup, LeaderLease,
+                                       NicLinkEvent])
+    await NIC.insert_many([NIC(name=name) for name in nic_names])
+
+
+def bench_counters(ticks: int) -> float:
+    """ :returns: Microseconds per counters read of this host. """
+    counters = counters_source()
+    started = time.perf_counter()
+    for _ in range(ticks):
+        counters.read()
+    return (time.perf_counter() - started) / ticks * 10 ** 6
+
+
+def bench_sampler(nic_names: List[str], ticks: int) -> float:
+    """ :returns: Milliseconds per sampler tick over all the nics. """
+    sampler = NicSampler()
+    sampler.counters = SyntheticCounters(len(nic_names))
+    sampler.sample(nic_names)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        sampler.sample(nic_names)
+    return (time.perf_counter() - started) / ticks * 1000
+
+
+async def bench_ingest(nic_names: List[str], ticks: int) -> float:
+    """
+    Ingest ticks of samples of all the nics (a tick every sampling
+    interval, the last one now) and flush them to db.
+
+    :return: Samples per second, from sampling to written.
+    """
+    sampler = NicSampler()
+    sampler.counters = SyntheticCounters(len(nic_names))
+    sampler.sample(nic_names)
+    interval = settings.INTERVAL_TASK_BW_SAMPLE
+    first_timestamp = time.time() - (ticks - 1) * interval
+
+    await sample_writer.start()
+    started = time.perf_counter()
+    for tick in range(ticks):
+        timestamp = first_timestamp + tick * interval
+        await ingest_pipeline.ingest(
+            IngestedSample(nic_name, settings.HOST_NAME, timestamp, upload,
+                           download)
+            for nic_name, (upload, download) in sampler.sample(
+                nic_names).items()
+        )
+    await sample_writer.stop()
+    return len(nic_names) * ticks / (time.perf_counter() - started)
+
+
+async def ingest_now(nic_names: List[str], in_memory: bool) -> None:
+    """
+    Ingest and flush a tick of now, so the threshold windows (the last
+    minute) have samples, to memory and db or to db only.
+    """
+    await sample_writer.start()
+    await ingest_pipeline.ingest(
+        (IngestedSample(nic_name, settings.HOST_NAME, time.time(), 1.0, 2.0)
+         for nic_name in nic_names),
+        in_memory=in_memory,
+    )
+    await sample_writer.stop()
+
+
+def bench_memory(nics: int) -> float:
+    """
+    Fill fresh memory stores (recent samples, rollups and thresholds) with
+    an hour of samples of the nics.
+
+    :return: Bytes they hold per nic hour.
+    """
+    samples_per_hour = int(SECONDS_IN_HOUR / settings.INTERVAL_TASK_BW_SAMPLE)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    samples = RingBufferStore(capacity=settings.RING_BUFFER_CAPACITY)
+    rollup_store = RollupStore(tiers=[
+        RollupTier(60, settings.ROLLUP_MINUTE_RETENTION, keep_sketches=False),
+        RollupTier(3600, settings.ROLLUP_HOUR_RETENTION, keep_sketches=True),
+    ])
+    engine = ThresholdEngine(window_seconds=settings.THRESHOLD_WINDOW_SECONDS)
+    nic_names = [f"veth{index}" for index in range(nics)]
+    first_timestamp = time.time() - SECONDS_IN_HOUR
+    for tick in range(samples_per_hour):
+        timestamp = first_timestamp + tick * settings.INTERVAL_TASK_BW_SAMPLE
+        for nic_name in nic_names:
+            samples.append(nic_name, timestamp, 1.5, 3.5)
+            rollup_store.add(nic_name, timestamp, 1.5, 3.5)
+            engine.add(nic_name, timestamp, 1.5, 3.5)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(
+        before, "filename"))
+    return allocated / nics
+
+
+async def load(client: httpx.AsyncClient, path: str, requests: int,
+               concurrency: int) -> List[float]:
+    """
+    Send the requests from concurrent clients.
+
+    :return: Every request's latency in seconds.
+    """
+    latencies = []
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def bench_endpoints(nic_names: List[str], requests: int,
+                          concurrency: int, source: str) -> Dict[str, float]:
+    """
+    :param source: Where the queries are served from, memory or db.
+    :returns: p50/p99 latency (ms) and throughput per endpoint.
+    """
+    nic_name = nic_names[0]
+    app = FastAPI()
+    for router in (nics_router, bandwidth_router, stats_router):
+        app.include_router(router)
+    endpoints = {
+        "bandwidth_nic": f"/bandwidth/{nic_name}?last_minutes=5",
+        "bandwidth_nic_rollups":
+            f"/bandwidth/{nic_name}?last_minutes=60&max_points=60",
+        "bandwidth_all": "/bandwidth/?last_minutes=1",
+        "threshold_nic": f"/nics/check_nic_rate_threshold/{nic_name}",
+        "threshold_all": "/nics/check_nic_rate_threshold/",
+        "stats_nic": f"/stats/{nic_name}?last_minutes=60",
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url="http://bench") as client:
+        for name, path in endpoints.items():
+            await ingest_now(nic_names, in_memory=source == "memory")
+            started = time.perf_counter()
+            latencies = await load(client, path, requests, concurrency)
+            elapsed = time.perf_counter() - started
+            results[f"{source}_{name}_p50_ms"] = percentile(
+                latencies, 0.5) * 1000
+            results[f"{source}_{name}_p99_ms"] = percentile(
+                latencies, 0.99) * 1000
+            results[f"{source}_{name}_requests_per_sec"] = requests / elapsed
+    return results
+
+
+async def run(nics: int, ticks: int, requests: int,
+              concurrency: int) -> Dict[str, float]:
+    nic_names = [f"veth{index}" for index in range(nics)]
+    await init_database(nic_names)
+
+    results = {
+        "counters_read_us": bench_counters(1000),
+        "sampler_tick_ms": bench_sampler(nic_names, 100),
+        "ingest_samples_per_sec": await bench_ingest(nic_names, ticks),
+    }
+    results.update(await bench_endpoints(nic_names, requests, concurrency,
+                                         "memory"))
+    # Same queries once nothing is in memory (e.g. another worker)
+    recent_samples.reset()
+    rollups.reset()
+    threshold_engine.reset()
+    results.update(await bench_endpoints(nic_names, requests, concurrency,
+                                         "db"))
+    results["memory_bytes_per_nic_hour"] = bench_memory(nics)
+    return results
+
+
+def main(nics: int = 50, ticks: int = 120, requests: int = 30,
+         concurrency: int = 8, save: Optional[str] = None,
+         compare: Optional[str] = None, tolerance: float = 0.2) -> None:
+    """
+    Benchmark the server's hot paths against an in-memory Mongo stand-in.
+
+    :param nics: Number of synthetic nics.
+    :param ticks: Sampling ticks ingested (every INTERVAL_TASK_BW_SAMPLE
+    seconds of simulated time, 120 is 10 minutes of default sampling).
+    :param requests: Requests per endpoint.
+    :param concurrency: Concurrent clients of the load generator.
+    :param save: Save the results as this baseline name.
+    :param compare: Compare the results to this baseline name.
+    :param tolerance: Change ratio worse than the baseline reported as a
+    regression.
+    """
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    print(f"Server benchmarks: {nics} nics, {ticks} ticks, {requests} "
+          f"requests per endpoint, concurrency {concurrency}")
+    results = asyncio.run(run(nics, ticks, requests, concurrency))
+    if not baselines.report(results, save, compare, tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
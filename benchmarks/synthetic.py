@@ -0,0 +1,148 @@
+""" Synthetic nic counters and pcap fixtures for the benchmarks """
+import random
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# Up to ~100MB/s per direction
+MAX_BYTES_RATE = 100 * 1024 * 1024
+
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD = struct.Struct("<IIII")
+PCAP_MAGIC = 0xA1B2C3D4
+LINKTYPE_ETHERNET = 1
+ETHERNET = struct.Struct("!6s6sH")
+ETHERTYPE_IPV4 = 0x0800
+IPV4 = struct.Struct("!BBHHHBBH4s4s")
+TCP = struct.Struct("!HHIIBBHHH")
+UDP = struct.Struct("!HHHH")
+ICMP = struct.Struct("!BBHHH")
+TCP_FIN, TCP_SYN, TCP_PSH_ACK, TCP_ACK = 0x11, 0x02, 0x18, 0x10
+
+
+class SyntheticCounters:
+    """
+    Counters source (see server/counters.py) of many fake nics, every nic
+    sends and receives at its own constant random rate.
+    """
+
+    def __init__(self, nics: int, seed: int = 0,
+                 max_rate: float = MAX_BYTES_RATE):
+        rng = random.Random(seed)
+        self.names = [f"veth{index}" for index in range(nics)]
+        self.rates = [(rng.uniform(0, max_rate), rng.uniform(0, max_rate))
+                      for _ in self.names]
+        self._started = time.monotonic()
+
+    def read(self) -> Dict[str, Tuple[int, int]]:
+        elapsed = time.monotonic() - self._started
+        return {name: (int(sent * elapsed), int(received * elapsed))
+                for name, (sent, received) in zip(self.names, self.rates)}
+
+
+def ipv4_frame(src: bytes, dst: bytes, proto: int, transport: bytes,
+               ident: int) -> bytes:
+    ip = IPV4.pack(0x45, 0, IPV4.size + len(transport), ident & 0xFFFF, 0,
+                   64, proto, 0, src, dst)
+    return (ETHERNET.pack(b"\x02\x00\x00\x00\x00\x02",
+                          b"\x02\x00\x00\x00\x00\x01", ETHERTYPE_IPV4) +
+            ip + transport)
+
+
+def tcp_segment(sport: int, dport: int, seq: int, ack: int, flags: int,
+                payload: bytes = b"") -> bytes:
+    return TCP.pack(sport, dport, seq, ack, 5 << 4, flags, 65535, 0,
+                    0) + payload
+
+
+def dns_query(ident: int, name: str) -> bytes:
+    qname = b"".join(bytes([len(label)]) + label.encode()
+                     for label in name.split(".")) + b"\0"
+    return struct.pack("!HHHHHH", ident & 0xFFFF, 0x0100, 1, 0, 0,
+                       0) + qname + struct.pack("!HH", 1, 1)
+
+
+def conversation(rng: random.Random, client: bytes, server: bytes,
+                 ident: int) -> List[bytes]:
+    """ :returns: The frames of a random conversation. """
+    kind = rng.random()
+    sport = rng.randint(1024, 65535)
+    if kind < 0.4:
+        # HTTP request and response over a whole TCP connection
+        seq, server_seq = rng.getrandbits(32), rng.getrandbits(32)
+        path = f"/page/{rng.randint(0, 999)}"
+        request = (f"GET {path} HTTP/1.1\r\nHost: example.com\r\n"
+                   f"\r\n").encode()
+        body = bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 900)))
+        response = (f"HTTP/1.1 200 OK\r\nContent-Length: {len(body)}\r\n"
+                    f"\r\n").encode() + body
+        segments = [
+            (client, server, sport, 80, seq, 0, TCP_SYN, b""),
+            (server, client, 80, sport, server_seq, seq + 1, TCP_SYN | 0x10,
+             b""),
+            (client, server, sport, 80, seq + 1, server_seq + 1, TCP_PSH_ACK,
+             request),
+            (server, client, 80, sport, server_seq + 1,
+             seq + 1 + len(request), TCP_PSH_ACK, response),
+            (client, server, sport, 80, seq + 1 + len(request),
+             server_seq + 1 + len(response), TCP_FIN, b""),
+        ]
+        return [ipv4_frame(src, dst, 6, tcp_segment(
+            source_port, destination_port, segment_seq % 2 ** 32,
+            segment_ack % 2 ** 32, flags, payload), ident + offset)
+            for offset, (src, dst, source_port, destination_port,
+                         segment_seq, segment_ack, flags, payload)
+            in enumerate(segments)]
+    if kind < 0.7:
+        query = dns_query(ident, f"host{rng.randint(0, 99)}.example.com")
+        return [ipv4_frame(client, server, 17, UDP.pack(
+            sport, 53, UDP.size + len(query), 0) + query, ident)]
+    if kind < 0.9:
+        payload = bytes(rng.getrandbits(8) for _ in range(rng.randint(
+            20, 1200)))
+        return [ipv4_frame(client, server, 17, UDP.pack(
+            sport, 443, UDP.size + len(payload), 0) + payload, ident)]
+    return [ipv4_frame(client, server, 1, ICMP.pack(8, 0, 0, ident & 0xFFFF,
+                                                    1) + b"ping", ident)]
+
+
+def write_pcap(path: Path, packets: int, seed: int = 0) -> Path:
+    """
+    Write a capture of random conversations (HTTP, DNS, UDP and ICMP)
+    between a few hosts, the same for the same packets and seed.
+
+    :return: The capture path.
+    """
+    rng = random.Random(seed)
+    hosts = [bytes([10, 0, index // 256, index % 256])
+             for index in range(1, 65)]
+    timestamp = 1_600_000_000.0
+    written = 0
+    with open(path, "wb") as file:
+        file.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, 65535,
+                                    LINKTYPE_ETHERNET))
+        while written < packets:
+            client, server = rng.sample(hosts, 2)
+            for frame in conversation(rng, client, server, written):
+                if written == packets:
+                    break
+                timestamp += rng.expovariate(1000)
+                seconds = int(timestamp)
+                file.write(PCAP_RECORD.pack(
+                    seconds, int((timestamp - seconds) * 10 ** 6),
+                    len(frame), len(frame)))
+                file.write(frame)
+                written += 1
+    return path
+
+
+def pcap_fixture(packets: int, seed: int = 0) -> Path:
+    """ :returns: The synthetic capture of that size, written once. """
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    path = FIXTURES_DIR / f"synthetic-{packets}-{seed}.pcap"
+    if not path.exists():
+        write_pcap(path, packets, seed)
+    return path
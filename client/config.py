@@ -7,5 +7,12 @@ class Settings(BaseSettings):
     PORT: str = "8000"
     PATH_TO_SAVE_PLOTS: str = "/plots"
 
+    # HTTP client configs, timeouts in seconds
+    TIMEOUT: float = 10.0
+    CONNECT_TIMEOUT: float = 5.0
+    RETRIES: int = 3
+    MAX_CONNECTIONS: int = 10
+    MAX_KEEPALIVE_CONNECTIONS: int = 5
+
 
 settings = Settings()
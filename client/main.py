@@ -1,23 +1,28 @@
+import asyncio
 import json
+import shlex
+import sys
 from datetime import datetime
 from pathlib import Path
 
 import fire
-import pandas as pd
-from httpx import AsyncClient
+import msgpack
+from httpx import Timeout
 from loguru import logger
 
 from config import settings
+from session import session
 
 BASE_URL = f"{settings.HOST}:{settings.PORT}"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+LOCAL_TIMEZONE = datetime.now().astimezone().tzinfo
 
 
 async def get_nics() -> json:
     """ Get all nics in the system. """
     url = f"{BASE_URL}/nics/"
-    async with AsyncClient(timeout=None) as client:
-        response = await client.get(url=url)
-        return response.json()
+    response = await session.client.get(url=url)
+    return response.json()
 
 
 async def check_nic_threshold(nic_name: str) -> None:
@@ -27,17 +32,86 @@ async def check_nic_threshold(nic_name: str) -> None:
     :param nic_name: The nic name (get from get_nics).
     """
     url = f"{BASE_URL}/nics/check_nic_rate_threshold/{nic_name}"
-    async with AsyncClient(timeout=None) as client:
-        response = await client.get(url=url)
-        logger.info(response.json())
+    response = await session.client.get(url=url)
+    logger.info(response.json())
+
+
+async def check_nics_threshold(*nic_names: str) -> None:
+    """
+    Check many nics thresholds in the server in one request.
+
+    :param nic_names: The nics names, all nics when not given.
+    """
+    url = f"{BASE_URL}/nics/check_nic_rate_threshold/"
+    params = {"nics": list(nic_names) or ["all"]}
+    response = await session.client.get(url=url, params=params)
+    for nic_name, verdict in response.json().items():
+        message = verdict["message"] if verdict else "Not valid data yet."
+        logger.info(f"{nic_name} | {message}")
+
+
+async def get_link_events(nic_name: str, limit: int = 20) -> None:
+    """
+    Get a given nic's link state changes (up/down), newest first.
+
+    :param nic_name: The nic name (get from get_nics).
+    :param limit: Maximum number of events.
+    """
+    url = f"{BASE_URL}/nics/{nic_name}/link_events"
+    response = await session.client.get(url=url, params={"limit": limit})
+    for event in response.json():
+        state = "up" if event["is_up"] else "down"
+        logger.info(f"{event['timestamp']} | {nic_name} is {state}")
+
+
+async def get_stats(nic_name: str, last_minutes: int = 60,
+                    quantiles: str = "0.5,0.95,0.99") -> json:
+    """
+    Get a given nic's upload and download rates percentiles.
+
+    :param nic_name: The nic name (get from get_nics).
+    :param last_minutes: The window in minutes.
+    :param quantiles: Comma separated quantiles (between 0 and 1).
+    """
+    url = f"{BASE_URL}/stats/{nic_name}"
+    if isinstance(quantiles, (int, float)):
+        quantiles = str(quantiles)
+    elif isinstance(quantiles, (list, tuple)):
+        quantiles = ",".join(map(str, quantiles))
+    params = {"last_minutes": last_minutes,
+              "quantiles": [q for q in quantiles.split(",") if q]}
+    response = await session.client.get(url=url, params=params)
+    if response.status_code == 204:
+        logger.info(f"No samples of {nic_name} in the last "
+                    f"{last_minutes} minutes.")
+        return None
+    return response.json()
+
+
+async def get_bandwidths(*nic_names: str, last_minutes: int = 1,
+                         max_points: int = None) -> json:
+    """
+    Get bandwidth samples of many nics in one request.
+
+    :param nic_names: The nics names, all nics when not given.
+    :param last_minutes: The window of samples in minutes.
+    :param max_points: Maximum points per nic, wide windows are served
+    from the server's 1m/1h rollups averages.
+    """
+    url = f"{BASE_URL}/bandwidth/"
+    params = {"nics": list(nic_names) or ["all"],
+              "last_minutes": last_minutes}
+    if max_points:
+        params["max_points"] = max_points
+    response = await session.client.get(url=url, params=params)
+    return response.json()
 
 
 async def change_thresholds(params: dict) -> None:
     """ DRY function """
     url = f"{BASE_URL}/settings/update_thresholds/"
-    async with AsyncClient(timeout=None) as client:
-        response = await client.put(url=url, params=params)
-        logger.info(response.json())
+    response = await session.client.put(url=url, params=params)
+    logger.info(response.json())
 
 
 async def change_min_dl_threshold(new_threshold: int) -> None:
@@ -76,28 +150,159 @@ async def change_max_ul_threshold(new_threshold: int) -> None:
     await change_thresholds({"ul_max": new_threshold})
 
 
-async def get_snapshot(nic_name: str) -> None:
+async def get_bandwidth_frame(nic_name: str, last_minutes: int = 1,
+                              max_points: int = None):
     """
-    Get rates of nic for the last minute and save the snapshot.
+    Get rates of nic in the server's compact columnar (msgpack) format.
 
-    :param nic_name: The name of nic you'll want to get plot of.
+    :param nic_name: The nic name.
+    :param last_minutes: The window of samples in minutes.
+    :param max_points: Maximum points, wide windows are served from the
+    server's 1m/1h rollups averages.
+    :return: pandas DataFrame of upload and download rates indexed by
+    local time, None when there are no samples.
     """
     url = f"{BASE_URL}/bandwidth/{nic_name}"
-    async with AsyncClient(timeout=None) as client:
-        response = await client.get(url=url)
-        data = response.json()
-        if data:
-            timestamps = [v['timestamp'] for v in data]
-            df = pd.DataFrame(data={
-                "upload": [v["upload"] for v in data],
-                "download": [v["download"] for v in data],
-            }, index=timestamps)
-            lines = df.plot.line()
-            lines.figure.figsize = (18,18)
-            lines.figure.savefig(Path.cwd() / Path("plots") / Path(f"{timestamps[-1]}.jpeg"))
+    params = {"last_minutes": last_minutes}
+    if max_points:
+        params["max_points"] = max_points
+    response = await session.client.get(
+        url=url, params=params, headers={"Accept": MSGPACK_MEDIA_TYPE})
+    if response.status_code != 200:
+        return None
+
+    # Heavy imports, only the snapshot commands need them
+    import numpy as np
+    import pandas as pd
+
+    columns = msgpack.unpackb(response.content)
+    offsets = np.frombuffer(columns["offsets"], dtype=columns["dtype"])
+    index = pd.to_datetime(columns["base"] + offsets, unit="s", utc=True)
+    return pd.DataFrame(data={
+        "upload": np.frombuffer(columns["upload"], dtype=columns["dtype"]),
+        "download": np.frombuffer(columns["download"],
+                                  dtype=columns["dtype"]),
+    }, index=index.tz_convert(LOCAL_TIMEZONE).tz_localize(None))
+
+
+async def get_snapshot(nic_name: str, last_minutes: int = 1,
+                       max_points: int = 500, server: bool = False,
+                       image_format: str = "png") -> None:
+    """
+    Get rates of nic for the last minutes and save the snapshot.
+
+    :param nic_name: The name of nic you'll want to get plot of.
+    :param last_minutes: The window of the plot in minutes.
+    :param max_points: Maximum points to plot, wide windows are served
+    from the server's 1m/1h rollups averages.
+    :param server: Get the plot rendered by the server instead of fetching
+    the samples and plotting locally.
+    :param image_format: The server rendered image format, png or svg.
+    """
+    if server:
+        url = f"{BASE_URL}/bandwidth/{nic_name}/snapshot"
+        params = {"last_minutes": last_minutes, "max_points": max_points,
+                  "format": image_format}
+        response = await session.client.get(url=url, params=params)
+        if response.status_code == 200:
+            file_name = f"{nic_name}_{datetime.now().isoformat()}"
+            path = Path.cwd() / Path("plots") / Path(
+                f"{file_name}.{image_format}")
+            path.write_bytes(response.content)
         else:
             logger.debug("No data")
+        return
+
+    df = await get_bandwidth_frame(nic_name, last_minutes, max_points)
+    if df is not None:
+        # Heavy import, only the snapshot command needs it
+        import matplotlib
+        matplotlib.use("Agg")
+
+        lines = df.plot.line()
+        lines.figure.figsize = (18, 18)
+        lines.figure.savefig(Path.cwd() / Path("plots") / Path(
+            f"{df.index[-1].isoformat()}.jpeg"))
+    else:
+        logger.debug("No data")
+
+
+async def watch(*nic_names: str) -> None:
+    """
+    Follow live samples and threshold verdicts of nics over one connection.
+
+    :param nic_names: The nics names to follow, all nics when not given.
+    """
+    url = f"{BASE_URL}/stream/samples"
+    params = {"nics": list(nic_names)} if nic_names else None
+    # No read timeout, events may be far apart
+    timeout = Timeout(settings.TIMEOUT, read=None)
+    async with session.client.stream("GET", url=url, params=params,
+                                     timeout=timeout) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            # Agents samples ingested by a non-leader worker aren't evaluated
+            verdict = event["verdict"]
+            logger.info(f"{event['nic_name']} | "
+                        f"upload {event['upload']}Mbps | "
+                        f"download {event['download']}Mbps | "
+                        f"{verdict['message'] if verdict else 'No verdict'}")
+
+
+def batch(file: str = None) -> None:
+    """
+    Run many commands over one pooled connection, one command per line
+    (e.g. "check_nic_threshold eth0") from a file or stdin. Prompts for
+    commands when stdin is a terminal, "exit" to quit.
+
+    :param file: Path of a commands file, stdin when not given.
+    """
+    lines = open(file) if file else sys.stdin
+    interactive = not file and sys.stdin.isatty()
+    try:
+        while True:
+            if interactive:
+                print("> ", end="", flush=True)
+            line = lines.readline()
+            if not line or line.strip() in ("exit", "quit"):
+                break
+            command = shlex.split(line, comments=True)
+            if not command:
+                continue
+            try:
+                fire.Fire(COMMANDS, command=command)
+            except SystemExit:
+                # Fire exits on usage errors, keep running the others
+                pass
+            except Exception as error:
+                logger.error(f"{line.strip()} | {error!r}")
+    finally:
+        if file:
+            lines.close()
+
+
+COMMANDS = {
+    "get_nics": get_nics,
+    "check_nic_threshold": check_nic_threshold,
+    "check_nics_threshold": check_nics_threshold,
+    "get_link_events": get_link_events,
+    "get_stats": get_stats,
+    "get_bandwidths": get_bandwidths,
+    "change_min_dl_threshold": change_min_dl_threshold,
+    "change_max_dl_threshold": change_max_dl_threshold,
+    "change_min_ul_threshold": change_min_ul_threshold,
+    "change_max_ul_threshold": change_max_ul_threshold,
+    "get_snapshot": get_snapshot,
+    "watch": watch,
+    "batch": batch,
+}
 
 
 if __name__ == '__main__':
-    fire.Fire()
+    try:
+        fire.Fire(COMMANDS)
+    finally:
+        if session.is_open:
+            asyncio.get_event_loop().run_until_complete(session.close())
@@ -0,0 +1,45 @@
+""" Shared pooled HTTP client of the cli commands """
+from typing import Optional
+
+from httpx import AsyncClient, AsyncHTTPTransport, Limits, Timeout
+
+from config import settings
+
+
+class ClientSession:
+    """
+    Keep-alive connection pool shared by all commands of the process,
+    created on first use and closed on exit.
+    """
+
+    def __init__(self):
+        self._client: Optional[AsyncClient] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._client is not None and not self._client.is_closed
+
+    @property
+    def client(self) -> AsyncClient:
+        if not self.is_open:
+            limits = Limits(
+                max_connections=settings.MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MAX_KEEPALIVE_CONNECTIONS,
+            )
+            # The transport retries failed connection attempts
+            transport = AsyncHTTPTransport(limits=limits,
+                                           retries=settings.RETRIES)
+            self._client = AsyncClient(
+                timeout=Timeout(settings.TIMEOUT,
+                                connect=settings.CONNECT_TIMEOUT),
+                transport=transport,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self.is_open:
+            await self._client.aclose()
+        self._client = None
+
+
+session = ClientSession()
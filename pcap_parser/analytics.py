@@ -0,0 +1,224 @@
+""" Vectorized protocol, port and talkers analytics of pcap files """
+import ipaddress
+import mmap
+import os
+from array import array
+from typing import Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+from fastpath import PROTO_ICMP, PROTO_TCP, PROTO_UDP, decode, iter_records
+
+PROTOCOL_NAMES = {PROTO_ICMP: "ICMP", PROTO_TCP: "TCP", PROTO_UDP: "UDP",
+                  58: "ICMPv6"}
+NO_PORT = -1
+# Address id of non IP packets
+NO_ADDRESS = 0
+BITS_IN_MEGABIT = 10 ** 6
+
+
+class PacketColumns(NamedTuple):
+    """ Header columns of every packet, protocols and addresses interned """
+    time: np.ndarray
+    length: np.ndarray
+    protocol: np.ndarray
+    src: np.ndarray
+    dst: np.ndarray
+    sport: np.ndarray
+    dport: np.ndarray
+    protocols: List[str]
+    addresses: List[str]
+
+
+def collect(file_paths: Sequence[str]) -> PacketColumns:
+    """
+    Collect the header columns of the captures in a single pass, headers are
+    decoded by the fast path decoder.
+
+    :param file_paths: The pcap/pcapng files paths.
+    :return: The packets columns, length is the captured length.
+    """
+    times, lengths = array("d"), array("I")
+    protocols, srcs, dsts = array("H"), array("I"), array("I")
+    sports, dports = array("i"), array("i")
+    protocol_ids: Dict[str, int] = {}
+    address_ids: Dict[bytes, int] = {b"": NO_ADDRESS}
+
+    for file_path in file_paths:
+        with open(file_path, "rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                continue
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for record in iter_records(buf):
+                    headers = decode(buf, record)
+                    if headers.proto is None:
+                        protocol = headers.session[0]
+                    else:
+                        protocol = PROTOCOL_NAMES.get(
+                            headers.proto, f"IP proto={headers.proto}")
+
+                    times.append(record.time)
+                    lengths.append(record.length)
+                    protocols.append(protocol_ids.setdefault(
+                        protocol, len(protocol_ids)))
+                    srcs.append(address_ids.setdefault(
+                        headers.src or b"", len(address_ids)))
+                    dsts.append(address_ids.setdefault(
+                        headers.dst or b"", len(address_ids)))
+                    sports.append(NO_PORT if headers.sport is None
+                                  else headers.sport)
+                    dports.append(NO_PORT if headers.dport is None
+                                  else headers.dport)
+
+    return PacketColumns(
+        time=np.frombuffer(times, dtype=np.float64),
+        length=np.frombuffer(lengths, dtype=np.uint32),
+        protocol=np.frombuffer(protocols, dtype=np.uint16),
+        src=np.frombuffer(srcs, dtype=np.uint32),
+        dst=np.frombuffer(dsts, dtype=np.uint32),
+        sport=np.frombuffer(sports, dtype=np.int32),
+        dport=np.frombuffer(dports, dtype=np.int32),
+        protocols=list(protocol_ids),
+        addresses=[str(ipaddress.ip_address(address)) if address else "-"
+                   for address in address_ids],
+    )
+
+
+def group_by(keys: np.ndarray, lengths: np.ndarray):
+    """
+    :returns: The unique keys, their packets and bytes, most bytes first.
+    """
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    packets = np.bincount(inverse, minlength=len(uniques))
+    total_bytes = np.bincount(inverse, weights=lengths,
+                              minlength=len(uniques)).astype(np.int64)
+    order = np.argsort(-total_bytes, kind="stable")
+    return uniques[order], packets[order], total_bytes[order]
+
+
+class PcapAnalytics:
+    """
+    Class for the capacity planning analytics of pcap files, aggregations
+    are vectorized over the packets header columns.
+    """
+
+    def __init__(self, file_paths: Sequence[str], top: int = 10,
+                 interval: float = 1.0):
+        self.columns = collect(file_paths)
+        self.top = top
+        self.interval = interval
+
+    @property
+    def packets_count(self) -> int:
+        return len(self.columns.time)
+
+    def by_protocol(self) -> List[Dict]:
+        columns = self.columns
+        keys, packets, total_bytes = group_by(columns.protocol,
+                                              columns.length)
+        return [{"protocol": columns.protocols[key], "packets": int(count),
+                 "bytes": int(size)}
+                for key, count, size in zip(keys, packets, total_bytes)]
+
+    def by_port(self) -> List[Dict]:
+        """ Transport ports, the lower port of a packet is the service. """
+        columns = self.columns
+        has_port = columns.sport != NO_PORT
+        port = np.minimum(columns.sport[has_port], columns.dport[has_port])
+        keys = columns.protocol[has_port].astype(np.int64) << 16 | port
+        keys, packets, total_bytes = group_by(keys, columns.length[has_port])
+        return [{"protocol": columns.protocols[key >> 16],
+                 "port": int(key & 0xFFFF), "packets": int(count),
+                 "bytes": int(size)}
+                for key, count, size in zip(keys, packets, total_bytes)]
+
+    def by_pair(self) -> List[Dict]:
+        """ :returns: The top src -> dst pairs of the IP packets. """
+        columns = self.columns
+        is_ip = columns.src != NO_ADDRESS
+        keys = (columns.src[is_ip].astype(np.int64) << 32 |
+                columns.dst[is_ip])
+        keys, packets, total_bytes = group_by(keys, columns.length[is_ip])
+        return [{"src": columns.addresses[key >> 32],
+                 "dst": columns.addresses[key & 0xFFFFFFFF],
+                 "packets": int(count), "bytes": int(size)}
+                for key, count, size in zip(keys[:self.top],
+                                            packets[:self.top],
+                                            total_bytes[:self.top])]
+
+    def top_talkers(self) -> List[Dict]:
+        """ :returns: The addresses with most bytes sent and received. """
+        columns = self.columns
+        addresses = len(columns.addresses)
+        sent = np.bincount(columns.src, weights=columns.length,
+                           minlength=addresses).astype(np.int64)
+        received = np.bincount(columns.dst, weights=columns.length,
+                               minlength=addresses).astype(np.int64)
+        total = sent + received
+        total[NO_ADDRESS] = -1
+        order = np.argsort(-total, kind="stable")[:self.top]
+        return [{"address": columns.addresses[address],
+                 "sent": int(sent[address]),
+                 "received": int(received[address])}
+                for address in order if total[address] >= 0]
+
+    def inter_arrival(self) -> Dict:
+        """ :returns: Packets inter arrival time statistics (ms). """
+        gaps = np.diff(np.sort(self.columns.time)) * 1000
+        if not len(gaps):
+            return {}
+        return {"mean": float(gaps.mean()),
+                "median": float(np.median(gaps)),
+                "p95": float(np.percentile(gaps, 95)),
+                "max": float(gaps.max())}
+
+    def throughput(self) -> List[Dict]:
+        """
+        :returns: Packets and Mbps per interval since the first packet, of
+        the intervals with packets only (a few bogus timestamps, e.g. 0,
+        among epoch ones would otherwise span decades of empty intervals).
+        """
+        columns = self.columns
+        if not len(columns.time):
+            return []
+        start = columns.time.min()
+        buckets = ((columns.time - start) // self.interval).astype(np.int64)
+        uniques, inverse = np.unique(buckets, return_inverse=True)
+        packets = np.bincount(inverse, minlength=len(uniques))
+        total_bytes = np.bincount(inverse, weights=columns.length,
+                                  minlength=len(uniques))
+        mbps = total_bytes * 8 / self.interval / BITS_IN_MEGABIT
+        return [{"time": start + bucket * self.interval,
+                 "packets": int(count),
+                 "mbps": round(float(rate), 3)}
+                for bucket, count, rate in zip(uniques.tolist(), packets,
+                                               mbps)]
+
+    def show_report(self) -> None:
+        print(f"Number of Packets in .pcap files: {self.packets_count}\n"
+              f"Bytes per protocol:")
+        for row in self.by_protocol():
+            print(f"    {row['protocol']:<24} {row['packets']:>10} packets "
+                  f"{row['bytes']:>14} bytes")
+
+        print("Bytes per port:")
+        for row in self.by_port()[:self.top]:
+            print(f"    {row['protocol']:<8} {row['port']:<15} "
+                  f"{row['packets']:>10} packets {row['bytes']:>14} bytes")
+
+        print("Bytes per src > dst pair:")
+        for row in self.by_pair():
+            pair = f"{row['src']} > {row['dst']}"
+            print(f"    {pair:<48} {row['packets']:>10} packets "
+                  f"{row['bytes']:>14} bytes")
+
+        print(f"Top {self.top} talkers:")
+        for row in self.top_talkers():
+            print(f"    {row['address']:<39} {row['sent']:>14} bytes sent "
+                  f"{row['received']:>14} bytes received")
+
+        print(f"Inter arrival time (ms): {self.inter_arrival()}\n"
+              f"Throughput per {self.interval} seconds:")
+        for row in self.throughput():
+            print(f"    {row['time']:.3f} {row['packets']:>10} packets "
+                  f"{row['mbps']:>10} Mbps")
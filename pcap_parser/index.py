@@ -0,0 +1,328 @@
+""" Flow index sidecar for repeated queries over the same capture """
+import hashlib
+import ipaddress
+import json
+import mmap
+import os
+import struct
+from pprint import pprint
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import fire
+from scapy.layers.dns import DNSQR
+
+from fastpath import PROTO_ICMP, PROTO_TCP, PROTO_UDP, Headers, Record, \
+    decode, dissect, is_dns_query, iter_records
+from sessions import HTTP_PORTS, PcapAccumulator, PcapReport, is_http, \
+    session_key
+
+INDEX_MAGIC = b"PCAPIDX2"
+INDEX_MAGIC_PREFIX = b"PCAPIDX"
+INDEX_SUFFIX = ".idx"
+HEADER_LENGTH = struct.Struct("<I")
+# Flow table entry, sorted by key hash: key hash, key offset and length in
+# the keys section, tags bits, first packet entry and packets count
+FLOW = struct.Struct("<QIHHII")
+# Packet entry: data offset, packet index, captured length, time, link type
+ENTRY = struct.Struct("<QIIdH")
+
+# Flow tags, a bit each in the flow table
+TAGS = ("tcp", "udp", "icmp", "ip", "ipv6", "arp", "ethernet", "other",
+        "dns", "http")
+TAG_BITS = {tag: 1 << bit for bit, tag in enumerate(TAGS)}
+PROTO_NAMES = {PROTO_TCP: "TCP", PROTO_UDP: "UDP"}
+
+
+def format_endpoint(address: bytes, port: Optional[int] = None) -> str:
+    address = str(ipaddress.ip_address(address))
+    return f"{address}:{port}" if port is not None else address
+
+
+def flow_key(headers: Headers) -> str:
+    """
+    :param headers: The decoded headers of a packet.
+    :return: Direction normalized flow key (same for both directions) of
+    the IP addresses, protocol and ports, whatever the link type.
+    """
+    if headers.src is None:
+        kind = headers.session[0]
+        if kind == "ARP":
+            first, second = sorted(headers.session[1:3])
+            return (f"ARP {format_endpoint(first)} <> "
+                    f"{format_endpoint(second)}")
+        if kind == "Ethernet":
+            return f"Ethernet type={headers.session[1]:#06x}"
+        return "Other"
+
+    if headers.sport is not None:
+        first, second = sorted([(headers.src, headers.sport),
+                                (headers.dst, headers.dport)])
+        return (f"{PROTO_NAMES[headers.proto]} {format_endpoint(*first)} "
+                f"<> {format_endpoint(*second)}")
+    first, second = sorted([headers.src, headers.dst])
+    endpoints = f"{format_endpoint(first)} <> {format_endpoint(second)}"
+    if headers.proto == PROTO_ICMP:
+        return f"ICMP {endpoints}"
+    kind = "IP" if len(headers.src) == 4 else "IPv6"
+    return f"{kind} {endpoints} proto={headers.proto}"
+
+
+def key_hash(key: str) -> int:
+    """ :returns: The flow table hash of a flow key. """
+    return int.from_bytes(hashlib.blake2b(key.encode(),
+                                          digest_size=8).digest(), "little")
+
+
+def tag_names(tags: int) -> List[str]:
+    return [tag for tag in TAGS if tags & TAG_BITS[tag]]
+
+
+def default_index_path(capture_path: str) -> str:
+    return capture_path + INDEX_SUFFIX
+
+
+def build(capture_path: str, index_path: Optional[str] = None,
+          ports: Union[int, Sequence[int]] = HTTP_PORTS) -> str:
+    """
+    Build the capture's sidecar index, mapping every normalized flow (and
+    its protocol tags) to the byte offsets of its packets. Flows are looked
+    up by a binary search of the flow table (sorted by key hash), only the
+    capture stats are read up front.
+
+    :param capture_path: The pcap/pcapng file path.
+    :param index_path: The index file path, defaults to capture path + .idx
+    :param ports: The HTTP server ports the http tag is given by.
+    :return: The index file path.
+    """
+    index_path = index_path or default_index_path(capture_path)
+    ports = [ports] if isinstance(ports, int) else list(ports)
+    flows: Dict[str, bytearray] = {}
+    flows_tags: Dict[str, int] = {}
+    sessions = set()
+    packets_count = dns_queries_count = 0
+
+    with open(capture_path, "rb") as file:
+        stat = os.fstat(file.fileno())
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for index, record in enumerate(iter_records(buf)):
+                headers = decode(buf, record)
+                key = flow_key(headers)
+                entries = flows.get(key)
+                if entries is None:
+                    entries = flows[key] = bytearray()
+                    flows_tags[key] = TAG_BITS[key.split(" ", 1)[0].lower()]
+                entries += ENTRY.pack(record.offset, index, record.length,
+                                      record.time, record.linktype)
+
+                packets_count += 1
+                sessions.add(headers.session)
+                if is_dns_query(buf, headers):
+                    dns_queries_count += 1
+                    flows_tags[key] |= TAG_BITS["dns"]
+                if headers.proto == PROTO_TCP and (
+                        headers.sport in ports or headers.dport in ports):
+                    flows_tags[key] |= TAG_BITS["http"]
+
+    table, keys = [], bytearray()
+    start = 0
+    for key, entries in flows.items():
+        encoded = key.encode()
+        count = len(entries) // ENTRY.size
+        table.append((key_hash(key), len(keys), len(encoded),
+                      flows_tags[key], start, count))
+        keys += encoded
+        start += count
+    table.sort()
+
+    header = {
+        "capture_size": stat.st_size,
+        "capture_mtime_ns": stat.st_mtime_ns,
+        "packets_count": packets_count,
+        "sessions_count": len(sessions),
+        "dns_queries_count": dns_queries_count,
+        "ports": ports,
+        "flows_count": len(table),
+        "keys_length": len(keys),
+    }
+    header_bytes = json.dumps(header).encode()
+    with open(index_path, "wb") as index_file:
+        index_file.write(INDEX_MAGIC)
+        index_file.write(HEADER_LENGTH.pack(len(header_bytes)))
+        index_file.write(header_bytes)
+        for flow in table:
+            index_file.write(FLOW.pack(*flow))
+        index_file.write(keys)
+        for entries in flows.values():
+            index_file.write(entries)
+    return index_path
+
+
+class FlowIndex:
+    """ Memory mapped capture and its flow index sidecar """
+
+    def __init__(self, capture_path: str, index_path: Optional[str] = None):
+        index_path = index_path or default_index_path(capture_path)
+        self._capture_file = open(capture_path, "rb")
+        self._index_file = open(index_path, "rb")
+        self.capture = mmap.mmap(self._capture_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        self.index = mmap.mmap(self._index_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+
+        magic = self.index[:len(INDEX_MAGIC)]
+        if magic != INDEX_MAGIC:
+            self.close()
+            if magic.startswith(INDEX_MAGIC_PREFIX):
+                raise ValueError(f"{index_path} is of an older version, "
+                                 f"build it again")
+            raise ValueError(f"{index_path} is not a flow index")
+        offset = len(INDEX_MAGIC)
+        header_length, = HEADER_LENGTH.unpack_from(self.index, offset)
+        offset += HEADER_LENGTH.size
+        self.header = json.loads(self.index[offset:offset + header_length])
+        self.flows_offset = offset + header_length
+        self.flows_count = self.header["flows_count"]
+        self.keys_offset = self.flows_offset + self.flows_count * FLOW.size
+        self.entries_offset = self.keys_offset + self.header["keys_length"]
+
+        stat = os.fstat(self._capture_file.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != (
+                self.header["capture_size"], self.header["capture_mtime_ns"]):
+            self.close()
+            raise ValueError(f"{index_path} is stale, build it again")
+
+    def __enter__(self) -> "FlowIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for closable in (getattr(self, "capture", None),
+                         getattr(self, "index", None),
+                         self._capture_file, self._index_file):
+            if closable:
+                closable.close()
+
+    def _hash_at(self, position: int) -> int:
+        return FLOW.unpack_from(self.index,
+                                self.flows_offset + position * FLOW.size)[0]
+
+    def _flow_at(self, position: int) -> Dict:
+        _, key_offset, key_length, tags, start, count = FLOW.unpack_from(
+            self.index, self.flows_offset + position * FLOW.size)
+        key_offset += self.keys_offset
+        return {"key": self.index[key_offset:key_offset + key_length]
+                .decode(),
+                "tags": tag_names(tags), "start": start, "count": count}
+
+    def flows(self, tag: Optional[str] = None) -> List[Dict]:
+        """
+        :returns: The indexed flows (capture order), only those with the
+        tag if given.
+        """
+        bit = TAG_BITS.get(tag, 0) if tag else None
+        positions = [
+            position for position in range(self.flows_count)
+            if bit is None or FLOW.unpack_from(
+                self.index, self.flows_offset + position * FLOW.size)[3] & bit
+        ]
+        return sorted((self._flow_at(position) for position in positions),
+                      key=lambda flow: flow["start"])
+
+    def flow(self, key: str) -> Dict:
+        """ :returns: The flow of the key, by a binary search of the table. """
+        wanted = key_hash(key)
+        low, high = 0, self.flows_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        # Keys of the same hash are next to each other
+        while low < self.flows_count and self._hash_at(low) == wanted:
+            flow = self._flow_at(low)
+            if flow["key"] == key:
+                return flow
+            low += 1
+        raise KeyError(f"No flow {key} in the index")
+
+    def records(self, flow: Dict) -> Iterator[Tuple[int, Record]]:
+        """ :returns: The flow's (packet index, record), capture order. """
+        offset = self.entries_offset + flow["start"] * ENTRY.size
+        for _ in range(flow["count"]):
+            data_offset, index, length, time, linktype = ENTRY.unpack_from(
+                self.index, offset)
+            offset += ENTRY.size
+            yield index, Record(data_offset, length, time, linktype)
+
+    def packets(self, flow: Dict) -> Iterator[Tuple[int, object]]:
+        """ :returns: The flow's (packet index, dissected packet). """
+        layers = {}
+        for index, record in self.records(flow):
+            yield index, dissect(self.capture, record, layers)
+
+
+class IndexedPcapHandler(PcapReport):
+    """
+    Class for extracting the report of pcap file from its flow index, only
+    the HTTP flows packets are read from the capture.
+    """
+
+    def __init__(self, flow_index: FlowIndex):
+        self.packets_count = flow_index.header["packets_count"]
+        self.sessions_count = flow_index.header["sessions_count"]
+        self.dns_queries_count = flow_index.header["dns_queries_count"]
+
+        ports = flow_index.header["ports"]
+        accumulator = PcapAccumulator(ports)
+        for flow in flow_index.flows(tag="http"):
+            for index, pkt in flow_index.packets(flow):
+                if is_http(pkt, ports):
+                    accumulator.add_http(pkt, session_key(pkt), (0, index))
+        self.http_payload = accumulator.conversations()
+
+
+def report(capture_path: str, index_path: Optional[str] = None) -> None:
+    """ Show the capture report using its index. """
+    with FlowIndex(capture_path, index_path) as flow_index:
+        IndexedPcapHandler(flow_index).show_report()
+
+
+def flows(capture_path: str, tag: Optional[str] = None,
+          index_path: Optional[str] = None) -> None:
+    """ List the capture's flows (e.g. --tag=http / dns / udp). """
+    with FlowIndex(capture_path, index_path) as flow_index:
+        for flow in flow_index.flows(tag=tag):
+            print(f"{flow['key']} | {','.join(flow['tags'])} | "
+                  f"{flow['count']} packets")
+
+
+def session(capture_path: str, flow_key: str,
+            index_path: Optional[str] = None) -> None:
+    """ Show the packets of a single flow (key as listed by flows). """
+    with FlowIndex(capture_path, index_path) as flow_index:
+        for index, pkt in flow_index.packets(flow_index.flow(flow_key)):
+            print(f"{index}: {pkt.summary()}")
+
+
+def dns(capture_path: str, index_path: Optional[str] = None) -> None:
+    """ Show the DNS questions in the capture. """
+    with FlowIndex(capture_path, index_path) as flow_index:
+        questions = []
+        for flow in flow_index.flows(tag="dns"):
+            for index, pkt in flow_index.packets(flow):
+                if DNSQR in pkt:
+                    questions.append((index, pkt[DNSQR].qname))
+        pprint([qname for _, qname in sorted(questions)])
+
+
+if __name__ == '__main__':
+    fire.Fire({
+        "build": build,
+        "report": report,
+        "flows": flows,
+        "session": session,
+        "dns": dns,
+    })
@@ -1,76 +1,95 @@
-from collections import namedtuple
-from pprint import pprint
+from typing import Dict, Sequence, Union
 
 import fire
-import scapy
-from scapy.all import rdpcap
+from scapy.all import PcapReader, rdpcap
 from scapy.layers.dns import DNSQR
-from scapy.layers.http import HTTP
-from scapy.layers.inet import TCP
 
+from analytics import PcapAnalytics
+from fastpath import FastPcapHandler
+from parallel import ParallelPcapHandler
+from sessions import (
+    HTTP_PORTS, PcapAccumulator, PcapReport, is_http, session_key,
+)
 
-class PcapHandler:
+
+class PcapHandler(PcapReport):
     """ Class for handling and extracting data from pcap file """
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, ports: Sequence[int] = HTTP_PORTS):
         self.pcap = rdpcap(file_path)
+        self.ports = ports
         self.http_payload = self.generate_http_data()
 
-    def generate_http_data(self) -> None:
-        # Filter only HTTP sessions (by known port conventions)
-        http_sessions = self.pcap.filter(
-            lambda pkt: (TCP in pkt) and
-                        ((pkt[TCP].sport == 80) or (pkt[TCP].dport == 80))
-        ).sessions()
-
-        conversations = {}
-        http_payload = namedtuple("HttpSessionPayload", ["payload", "endtime"])
-
-        # Iterate through http sessions iterable to build conversion
-        for s_id, pkts in http_sessions.items():
-
-            # Get the payload that was sent in the session (split into packets)
-            payload = []
-            for pkt in pkts:
-                if (pkt[TCP].sport == 80 or pkt[TCP].dport == 80) and type(
-                        pkt[TCP].payload) == scapy.layers.http.HTTP:
-                    payload += bytes(pkt[TCP].payload).split(
-                        b"\r\n")  # convert from bytes
-
-            endtime = pkts[-1].time
-
-            # Determine if this session is an HTTP Request or Response
-            if pkts[0].dport == 80:
-                # HTTP Request
-                if s_id not in conversations.keys():
-                    conversations[s_id] = {}
-                conversations[s_id]["req"] = http_payload(payload=payload,
-                                                          endtime=endtime)
-            else:
-                # Swap destination and source to match session id in Request
-                s_id = s_id.split(" ")
-                s_id[1], s_id[3] = s_id[3], s_id[1]
-                s_id = " ".join(s_id)
-                if s_id not in conversations.keys():
-                    conversations[s_id] = {}
-                conversations[s_id]["res"] = http_payload(payload=payload,
-                                                          endtime=endtime)
-
-        return conversations
-
-    def show_report(self) -> None:
-        print(
-            f"Number of Packets in .pcap file: {len(self.pcap)}\n"
-            f"Number of Sessions in .pcap file: {len(self.pcap.sessions())}\n"
-            f"Number of DNS Queries in .pcap file: {len(self.pcap[DNSQR])}\n"
-            f"HTTP payload generate from .pcap file: \n"
-        )
-        pprint(self.http_payload)
-
-
-def main(filename: str) -> None:
-    """ Main function """
-    pcap = PcapHandler(filename)
+    @property
+    def packets_count(self) -> int:
+        return len(self.pcap)
+
+    @property
+    def sessions_count(self) -> int:
+        return len(self.pcap.sessions())
+
+    @property
+    def dns_queries_count(self) -> int:
+        return len(self.pcap[DNSQR])
+
+    def generate_http_data(self) -> Dict:
+        # Reassemble the http sessions by TCP sequence to build conversions
+        accumulator = PcapAccumulator(self.ports)
+        for index, pkt in enumerate(self.pcap):
+            if is_http(pkt, self.ports):
+                accumulator.add_http(pkt, session_key(pkt), (0, index))
+
+        return accumulator.conversations()
+
+
+class StreamingPcapHandler(PcapReport):
+    """
+    Class for extracting the same data from pcap file in a single streaming
+    pass, memory is bound by the number of flows and not by the file size.
+    """
+
+    def __init__(self, file_path, ports: Sequence[int] = HTTP_PORTS):
+        accumulator = PcapAccumulator(ports)
+        with PcapReader(file_path) as reader:
+            for index, pkt in enumerate(reader):
+                accumulator.add(pkt, (0, index))
+        self.load_accumulator(accumulator)
+
+
+def main(*filenames: str, streaming: bool = False, fast: bool = False,
+         workers: int = 1, ports: Union[int, Sequence[int]] = HTTP_PORTS,
+         analytics: bool = False, top: int = 10,
+         interval: float = 1.0) -> None:
+    """
+    Main function
+
+    :param filenames: The pcap files paths, reported as a single capture.
+    :param streaming: Parse the file in a single constant memory pass
+    instead of loading all of it.
+    :param fast: Decode only the raw headers the report needs, only HTTP
+    packets are fully dissected.
+    :param workers: Number of processes to spread the files (and chunks of
+    big files) across, 0 for all CPU cores.
+    :param ports: The HTTP server ports, e.g. --ports=80,8080
+    :param analytics: Report bytes and packets per protocol, port and
+    src/dst pair, top talkers and throughput instead.
+    :param top: Number of top pairs, ports and talkers in analytics.
+    :param interval: Seconds per throughput point in analytics.
+    """
+    if analytics:
+        PcapAnalytics(filenames, top=top, interval=interval).show_report()
+        return
+
+    ports = (ports,) if isinstance(ports, int) else tuple(ports)
+    if len(filenames) > 1 or workers != 1:
+        pcap = ParallelPcapHandler(filenames, workers=workers or None,
+                                   ports=ports)
+    elif fast:
+        pcap = FastPcapHandler(filenames[0], ports)
+    elif streaming:
+        pcap = StreamingPcapHandler(filenames[0], ports)
+    else:
+        pcap = PcapHandler(filenames[0], ports)
     pcap.show_report()
 
 
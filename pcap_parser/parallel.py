@@ -0,0 +1,141 @@
+""" Parallel pcap processing across CPU cores and files """
+import mmap
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from fastpath import (
+    PcapngSection, Record, RecordBoundaryError, add_headers,
+    chunk_boundaries, decode, dissect, iter_chunk_records, scan,
+)
+from sessions import HTTP_PORTS, PcapAccumulator, PcapReport, session_key
+
+# Files at least this big are split into byte chunks across all the workers
+CHUNK_MIN_BYTES = 64 * 1024 * 1024
+
+
+def scan_chunk(file_path: str, start: int, end: int,
+               section: Optional[PcapngSection],
+               ports: Sequence[int] = HTTP_PORTS,
+               ) -> Tuple[PcapAccumulator, List[Tuple[int, Record]]]:
+    """
+    Count the packets of a chunk from their raw headers, each packet is
+    decoded once. HTTP packets are left to dissect_flows.
+
+    :param file_path: The pcap/pcapng file path.
+    :param start: The chunk start.
+    :param end: The next chunk start (or the file end).
+    :param section: The pcapng section of the records, None for pcap.
+    :param ports: The HTTP server ports.
+    :return: The chunk counts and its HTTP records with their flow hash.
+    :raises: RecordBoundaryError: if the chunk doesn't end at end.
+    """
+    accumulator = PcapAccumulator(ports)
+    http_records = []
+    with open(file_path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for record in iter_chunk_records(buf, start, end, section):
+                headers = decode(buf, record)
+                if add_headers(accumulator, buf, headers):
+                    http_records.append((headers.flow_hash, record))
+    return accumulator, http_records
+
+
+def dissect_flows(file_path: str, file_index: int, records: List[Record],
+                  ports: Sequence[int] = HTTP_PORTS) -> PcapAccumulator:
+    """
+    Dissect and reassemble HTTP records of whole flows, in file order.
+
+    :param file_path: The pcap/pcapng file path.
+    :param file_index: The file position in the processed files.
+    :param records: The HTTP records of some flows of the file.
+    :param ports: The HTTP server ports.
+    :return: The accumulated HTTP sessions.
+    """
+    accumulator = PcapAccumulator(ports)
+    layers = {}
+    with open(file_path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for record in records:
+                pkt = dissect(buf, record, layers)
+                # Packets are ordered by their offset in chunked files
+                accumulator.add_http(pkt, session_key(pkt),
+                                     (file_index, record.offset))
+    return accumulator
+
+
+def file_chunks(file_path: str, chunks: int
+                ) -> Tuple[List[int], Optional[PcapngSection]]:
+    """ :returns: The file's chunk boundaries, see chunk_boundaries. """
+    with open(file_path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return chunk_boundaries(buf, chunks)
+
+
+class ParallelPcapHandler(PcapReport):
+    """
+    Class for extracting the report of many pcap files with a process pool.
+
+    Every file is a task, big files are split into byte chunks at record
+    boundaries: each chunk's packets are decoded once by a worker, then
+    the HTTP packets are sent to workers by their (direction normalized)
+    flow hash so each session is reassembled by one worker. Partial reports
+    are merged in file order.
+    """
+
+    def __init__(self, file_paths: Sequence[str],
+                 workers: Optional[int] = None,
+                 ports: Sequence[int] = HTTP_PORTS,
+                 chunk_min_bytes: int = CHUNK_MIN_BYTES):
+        self.workers = workers or os.cpu_count()
+        self.ports = ports
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # Every file's first stage is submitted before waiting on any
+            tasks = []
+            for file_index, file_path in enumerate(file_paths):
+                chunked = (self.workers > 1 and os.path.getsize(file_path)
+                           >= chunk_min_bytes)
+                tasks.append(self._submit_chunks(executor, file_path)
+                             if chunked else
+                             executor.submit(scan, file_path, file_index,
+                                             ports))
+
+            accumulator = PcapAccumulator(ports)
+            for file_index, (file_path, task) in enumerate(zip(file_paths,
+                                                               tasks)):
+                partials = ([task.result()] if isinstance(task, Future) else
+                            self._chunked_partials(executor, file_path,
+                                                   file_index, task))
+                for partial in partials:
+                    accumulator.merge(partial)
+        self.load_accumulator(accumulator)
+
+    def _submit_chunks(self, executor: ProcessPoolExecutor,
+                       file_path: str) -> List[Future]:
+        boundaries, section = file_chunks(file_path, self.workers)
+        return [executor.submit(scan_chunk, file_path, start, end, section,
+                                self.ports)
+                for start, end in zip(boundaries, boundaries[1:])]
+
+    def _chunked_partials(self, executor: ProcessPoolExecutor,
+                          file_path: str, file_index: int,
+                          chunks: List[Future]) -> List[PcapAccumulator]:
+        """ :returns: The chunks counts and the flow shards HTTP sessions
+        of a chunked file. """
+        try:
+            results = [chunk.result() for chunk in chunks]
+        except (RecordBoundaryError, IndexError):
+            # A boundary wasn't a record start (an unknown interface in
+            # pcapng) or the file has many sections, it's read in one pass
+            return [executor.submit(scan, file_path, file_index,
+                                    self.ports).result()]
+
+        shards = [[] for _ in range(self.workers)]
+        for _, http_records in results:
+            for flow_hash, record in http_records:
+                shards[flow_hash % self.workers].append(record)
+        flows = [executor.submit(dissect_flows, file_path, file_index,
+                                 records, self.ports)
+                 for records in shards if records]
+        return ([counts for counts, _ in results] +
+                [task.result() for task in flows])
@@ -0,0 +1,263 @@
+""" TCP stream reassembly and HTTP message extraction """
+from typing import Dict, List, Optional, Tuple
+
+# Buffered bytes (out of order segments and incomplete message) per flow
+MAX_FLOW_BYTES = 1024 * 1024
+# Seconds (of capture time) after which a silent flow's buffers are dropped
+IDLE_TIMEOUT = 120
+
+TCP_FIN, TCP_SYN, TCP_RST = 0x01, 0x02, 0x04
+SEQ_MODULO = 2 ** 32
+HEADERS_END = b"\r\n\r\n"
+# Message body length markers
+CHUNKED, UNTIL_CLOSE = -1, -2
+
+
+def seq_distance(seq: int, next_seq: int) -> int:
+    """ :returns: How far seq is ahead of next_seq, negative if behind. """
+    distance = (seq - next_seq) % SEQ_MODULO
+    return distance if distance < SEQ_MODULO // 2 else distance - SEQ_MODULO
+
+
+def message_body_length(head: bytes, is_request: bool) -> int:
+    """
+    :param head: The HTTP message start line and headers.
+    :param is_request: True for requests, False for responses.
+    :return: The body length, CHUNKED or UNTIL_CLOSE (connection close).
+    """
+    lines = head.split(b"\r\n")
+    if not is_request:
+        status = lines[0].split(b" ", 2)
+        if len(status) > 1 and status[1].isdigit() and (
+                int(status[1]) < 200 or int(status[1]) in (204, 304)):
+            return 0
+
+    content_length = None
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"transfer-encoding" and b"chunked" in value.lower():
+            return CHUNKED
+        if name == b"content-length" and value.strip().isdigit():
+            content_length = int(value.strip())
+
+    if content_length is not None:
+        return content_length
+    return 0 if is_request else UNTIL_CLOSE
+
+
+class HttpStream:
+    """
+    One direction of a TCP connection, segments are put in sequence order
+    (retransmissions dropped) and split into HTTP messages.
+    """
+    __slots__ = ("session", "max_bytes", "next_seq", "pending",
+                 "pending_bytes", "buffer", "scan_from", "head_end",
+                 "body_length", "chunk_cursor", "last_seen")
+
+    def __init__(self, session: List, max_bytes: int):
+        # The session entry [payload lines, endtime, is request, position]
+        self.session = session
+        self.max_bytes = max_bytes
+        self.next_seq: Optional[int] = None
+        # Out of order segments by sequence number
+        self.pending: Dict[int, bytes] = {}
+        self.pending_bytes = 0
+        self.buffer = bytearray()
+        self.scan_from = 0
+        self.head_end: Optional[int] = None
+        self.body_length = 0
+        self.chunk_cursor = 0
+        self.last_seen = 0.0
+
+    def add(self, seq: int, flags: int, payload: bytes) -> None:
+        if flags & TCP_SYN:
+            if self.next_seq is None:
+                self.next_seq = (seq + 1) % SEQ_MODULO
+            return
+        if self.next_seq is None:
+            # Connection start was not captured
+            self.next_seq = seq
+
+        if payload:
+            distance = seq_distance(seq, self.next_seq)
+            if distance > 0:
+                if len(payload) > len(self.pending.get(seq, b"")):
+                    self.pending_bytes += len(payload) - len(
+                        self.pending.get(seq, b""))
+                    self.pending[seq] = payload
+                if self.pending_bytes + len(self.buffer) > self.max_bytes:
+                    # Give up on the missing segment
+                    self.skip_gap()
+            else:
+                self.feed(payload[-distance:])
+                self.drain()
+
+        if flags & (TCP_FIN | TCP_RST) and not self.pending:
+            self.flush()
+
+    def feed(self, data: bytes) -> None:
+        """ Append data that starts at the next expected sequence number. """
+        if not data:
+            return
+        self.next_seq = (self.next_seq + len(data)) % SEQ_MODULO
+        self.buffer += data
+        self.parse()
+
+    def drain(self) -> None:
+        """ Feed the pending segments which became in order. """
+        while self.pending:
+            ready = [seq for seq in self.pending
+                     if seq_distance(seq, self.next_seq) <= 0]
+            if not ready:
+                return
+            for seq in ready:
+                payload = self.pending.pop(seq)
+                self.pending_bytes -= len(payload)
+                # Re-measure, an earlier ready segment may overlap this one
+                self.feed(payload[-seq_distance(seq, self.next_seq):])
+
+    def skip_gap(self) -> None:
+        """ Continue from the earliest pending segment (lost data). """
+        if self.pending:
+            self.next_seq = min(self.pending, key=lambda seq: seq_distance(
+                seq, self.next_seq))
+            self.emit(len(self.buffer))
+            self.reset()
+            self.drain()
+
+    def parse(self) -> None:
+        """ Emit every complete HTTP message in the buffer. """
+        while self.buffer:
+            if self.head_end is None:
+                end = self.buffer.find(HEADERS_END, max(0, self.scan_from - 3))
+                if end < 0:
+                    self.scan_from = len(self.buffer)
+                    break
+                self.head_end = end + len(HEADERS_END)
+                self.chunk_cursor = self.head_end
+                self.body_length = message_body_length(
+                    bytes(self.buffer[:end]), self.session[2])
+
+            message_end = self.message_end()
+            if message_end is None:
+                break
+            self.emit(message_end)
+            self.reset()
+
+        if len(self.buffer) > self.max_bytes:
+            # Message bigger than the flow cap, emit what it has so far
+            # (of a chunked body only the complete chunks)
+            emitted = len(self.buffer)
+            if self.body_length == CHUNKED and self.chunk_cursor:
+                emitted = self.chunk_cursor
+            self.emit(emitted)
+            if self.head_end is not None:
+                if self.body_length > 0:
+                    self.body_length = max(
+                        0, self.head_end + self.body_length - emitted)
+                self.head_end = 0
+                self.chunk_cursor = max(0, self.chunk_cursor - emitted)
+            self.scan_from = 0
+
+    def message_end(self) -> Optional[int]:
+        """ :returns: The end of the current message if fully buffered. """
+        if self.body_length == UNTIL_CLOSE:
+            return None
+        if self.body_length != CHUNKED:
+            end = self.head_end + self.body_length
+            return end if end <= len(self.buffer) else None
+
+        while True:
+            line_end = self.buffer.find(b"\r\n", self.chunk_cursor)
+            if line_end < 0:
+                return None
+            size = self.buffer[self.chunk_cursor:line_end].split(b";")[0]
+            try:
+                size = int(size.strip(), 16)
+            except ValueError:
+                # Malformed chunk, end the message here
+                return line_end + 2
+            if size == 0:
+                # Last chunk, then optional trailers and an empty line
+                end = self.buffer.find(HEADERS_END, line_end)
+                return None if end < 0 else end + len(HEADERS_END)
+            chunk_end = line_end + 2 + size + 2
+            if chunk_end > len(self.buffer):
+                return None
+            self.chunk_cursor = chunk_end
+
+    def emit(self, length: int) -> None:
+        if length:
+            self.session[0] += bytes(self.buffer[:length]).split(b"\r\n")
+            del self.buffer[:length]
+
+    def reset(self) -> None:
+        self.scan_from = 0
+        self.head_end = None
+        self.body_length = 0
+        self.chunk_cursor = 0
+
+    def flush(self) -> None:
+        """ Emit everything buffered, missing segments are skipped. """
+        while self.pending:
+            self.skip_gap()
+        self.emit(len(self.buffer))
+        self.reset()
+
+
+class TcpReassembler:
+    """
+    Reassembler of the HTTP sessions (TCP connection directions), memory is
+    bound per flow and idle flows are evicted.
+    """
+
+    def __init__(self, max_flow_bytes: int = MAX_FLOW_BYTES,
+                 idle_timeout: float = IDLE_TIMEOUT):
+        self.max_flow_bytes = max_flow_bytes
+        self.idle_timeout = idle_timeout
+        # Session id -> [payload lines, endtime, is request, first position]
+        self.sessions: Dict[str, List] = {}
+        self._streams: Dict[str, HttpStream] = {}
+        self._last_eviction = 0.0
+
+    def add(self, s_id: str, seq: int, flags: int, payload: bytes,
+            time: float, position: Tuple[int, int], is_request: bool) -> None:
+        """
+        :param s_id: The segment's session id.
+        :param seq: The segment's TCP sequence number.
+        :param flags: The segment's TCP flags.
+        :param payload: The segment's TCP payload.
+        :param time: The segment's capture time.
+        :param position: The (file index, packet index) of the segment.
+        :param is_request: True if sent to the server (client to server).
+        """
+        session = self.sessions.get(s_id)
+        if session is None:
+            session = self.sessions[s_id] = [[], time, is_request, position]
+        session[1] = time
+
+        stream = self._streams.get(s_id)
+        if stream is None:
+            stream = self._streams[s_id] = HttpStream(session,
+                                                      self.max_flow_bytes)
+        stream.last_seen = time
+        stream.add(seq, flags, payload)
+
+        if time - self._last_eviction >= self.idle_timeout:
+            self.evict_idle(time)
+
+    def evict_idle(self, now: float) -> None:
+        """ Flush and drop the streams idle for longer than the timeout. """
+        self._last_eviction = now
+        for s_id, stream in list(self._streams.items()):
+            if now - stream.last_seen > self.idle_timeout:
+                stream.flush()
+                del self._streams[s_id]
+
+    def finish(self) -> Dict[str, List]:
+        """ Flush all streams. :returns: The sessions. """
+        for stream in self._streams.values():
+            stream.flush()
+        self._streams.clear()
+        return self.sessions
@@ -0,0 +1,163 @@
+""" Sessions helpers and report shared by the pcap handlers """
+from collections import namedtuple
+from pprint import pprint
+from typing import Dict, Sequence, Tuple
+
+from scapy.layers.dns import DNSQR
+from scapy.layers.inet import TCP
+
+from reassembly import TcpReassembler
+
+HTTP_PORT = 80
+HTTP_PORTS = (HTTP_PORT,)
+
+HttpSessionPayload = namedtuple("HttpSessionPayload", ["payload", "endtime"])
+
+
+def session_key(pkt) -> str:
+    """ Same session id scapy's PacketList.sessions() gives the packet. """
+    if "Ether" in pkt:
+        if "IP" in pkt or "IPv6" in pkt:
+            src = "{IP:%IP.src%}{IPv6:%IPv6.src%}"
+            dst = "{IP:%IP.dst%}{IPv6:%IPv6.dst%}"
+            if "TCP" in pkt:
+                fmt = "TCP {}:%r,TCP.sport% > {}:%r,TCP.dport%"
+            elif "UDP" in pkt:
+                fmt = "UDP {}:%r,UDP.sport% > {}:%r,UDP.dport%"
+            elif "ICMP" in pkt:
+                fmt = ("ICMP {} > {} type=%r,ICMP.type% code=%r,ICMP.code% "
+                       "id=%ICMP.id%")
+            elif "ICMPv6" in pkt:
+                fmt = ("ICMPv6 {} > {} type=%r,ICMPv6.type% "
+                       "code=%r,ICMPv6.code%")
+            elif "IPv6" in pkt:
+                fmt = "IPv6 {} > {} nh=%IPv6.nh%"
+            else:
+                fmt = "IP {} > {} proto=%IP.proto%"
+            return pkt.sprintf(fmt.format(src, dst))
+        if "ARP" in pkt:
+            return pkt.sprintf("ARP %ARP.psrc% > %ARP.pdst%")
+        return pkt.sprintf("Ethernet type=%04xr,Ether.type%")
+    return "Other"
+
+
+def is_http(pkt, ports: Sequence[int] = HTTP_PORTS) -> bool:
+    """ Filter only HTTP packets (by known port conventions) """
+    return (TCP in pkt) and (
+            (pkt[TCP].sport in ports) or (pkt[TCP].dport in ports))
+
+
+def build_conversations(
+        http_sessions: Dict[str, Sequence],
+) -> Dict:
+    """
+    Match HTTP request and response sessions into conversations.
+
+    :param http_sessions: Mapping of session id to its payload, endtime
+    and whether it is the request (client to server) side.
+    :return: Mapping of request session id to its req and res payloads.
+    """
+    conversations = {}
+    for s_id, (payload, endtime, is_request, *_) in http_sessions.items():
+        if is_request:
+            # HTTP Request
+            if s_id not in conversations.keys():
+                conversations[s_id] = {}
+            conversations[s_id]["req"] = HttpSessionPayload(payload=payload,
+                                                            endtime=endtime)
+        else:
+            # Swap destination and source to match session id in Request
+            s_id = s_id.split(" ")
+            s_id[1], s_id[3] = s_id[3], s_id[1]
+            s_id = " ".join(s_id)
+            if s_id not in conversations.keys():
+                conversations[s_id] = {}
+            conversations[s_id]["res"] = HttpSessionPayload(payload=payload,
+                                                            endtime=endtime)
+
+    return conversations
+
+
+class PcapAccumulator:
+    """
+    Single pass accumulator of the report counts and HTTP sessions, partial
+    accumulators (of files or flow shards) merge into a single one.
+    """
+
+    def __init__(self, ports: Sequence[int] = HTTP_PORTS):
+        self.ports = ports
+        self.packets_count = 0
+        self.dns_queries_count = 0
+        self.sessions = set()
+        self.reassembler = TcpReassembler()
+        # Session id -> [payload, endtime, is request, first packet position]
+        self.http_sessions = self.reassembler.sessions
+
+    def add(self, pkt, position: Tuple[int, int]) -> None:
+        """
+        :param pkt: The dissected packet.
+        :param position: The (file index, packet index) of the packet.
+        """
+        self.packets_count += 1
+        s_id = session_key(pkt)
+        self.sessions.add(s_id)
+
+        if DNSQR in pkt:
+            self.dns_queries_count += 1
+
+        if is_http(pkt, self.ports):
+            self.add_http(pkt, s_id, position)
+
+    def add_http(self, pkt, s_id: str, position: Tuple[int, int]) -> None:
+        """
+        :param pkt: The dissected HTTP packet.
+        :param s_id: The packet's session id.
+        :param position: The (file index, packet index) of the packet.
+        """
+        tcp = pkt[TCP]
+        self.reassembler.add(s_id, tcp.seq, int(tcp.flags), bytes(tcp.payload),
+                             pkt.time, position, tcp.dport in self.ports)
+
+    def merge(self, other: "PcapAccumulator") -> None:
+        """ Fold accumulator of packets that come after this one's. """
+        self.reassembler.finish()
+        other.reassembler.finish()
+        self.packets_count += other.packets_count
+        self.dns_queries_count += other.dns_queries_count
+        self.sessions |= other.sessions
+        for s_id, session in other.http_sessions.items():
+            mine = self.http_sessions.get(s_id)
+            if mine is None:
+                self.http_sessions[s_id] = session
+            else:
+                mine[0] += session[0]
+                mine[1] = max(mine[1], session[1])
+
+    def conversations(self) -> Dict:
+        """ :returns: The HTTP conversations, ordered by first packet. """
+        return build_conversations(dict(sorted(
+            self.reassembler.finish().items(), key=lambda item: item[1][3],
+        )))
+
+
+class PcapReport:
+    """ Report printing of the pcap handlers counts and HTTP payload """
+    packets_count: int
+    sessions_count: int
+    dns_queries_count: int
+    http_payload: Dict
+
+    def load_accumulator(self, accumulator: PcapAccumulator) -> None:
+        self.packets_count = accumulator.packets_count
+        self.sessions_count = len(accumulator.sessions)
+        self.dns_queries_count = accumulator.dns_queries_count
+        self.http_payload = accumulator.conversations()
+
+    def show_report(self) -> None:
+        print(
+            f"Number of Packets in .pcap file: {self.packets_count}\n"
+            f"Number of Sessions in .pcap file: {self.sessions_count}\n"
+            f"Number of DNS Queries in .pcap file: {self.dns_queries_count}\n"
+            f"HTTP payload generate from .pcap file: \n"
+        )
+        pprint(self.http_payload)
@@ -0,0 +1,147 @@
+""" Collector agent, pushes this host's nics samples to a central server """
+import asyncio
+import gzip
+import json
+import time
+from collections import deque
+from typing import Deque, Dict, List
+
+import psutil
+from httpx import AsyncClient, HTTPError, HTTPStatusError
+from loguru import logger
+
+from config import settings
+from sampler import NicSampler, Rates, adaptive_interval
+from utils import config_logger
+
+# Client errors worth retrying, the others reject the batch for good
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+
+class Agent:
+    """
+    Runs only the sampler and pushes gzip compressed sample batches to the
+    central server's ingest endpoint.
+
+    Samples are buffered (bounded, oldest dropped first) while the server
+    is unreachable and pushed with exponential backoff once it is back.
+    """
+
+    def __init__(self, server_url: str, host: str, push_interval: float,
+                 batch_size: int, buffer_size: int, max_backoff: float):
+        self.url = f"{server_url}/ingest/samples"
+        self.host = host
+        self.interval = adaptive_interval()
+        self.push_interval = push_interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.sampler = NicSampler()
+        self.buffer: Deque[Dict] = deque(maxlen=buffer_size)
+        self.nic_names: List[str] = []
+        self.pushed_samples = 0
+        self.dropped_samples = 0
+        self.rejected_samples = 0
+
+    def sample(self) -> Rates:
+        """ Sample the nics which are up into the buffer. """
+        self.nic_names = [name for name, stats in
+                          psutil.net_if_stats().items() if stats.isup]
+        timestamp = time.time()
+        rates = self.sampler.sample(self.nic_names)
+        for nic_name, (upload, download) in rates.items():
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped_samples += 1
+            self.buffer.append({"nic_name": nic_name, "timestamp": timestamp,
+                                "upload": upload, "download": download})
+        return rates
+
+    async def push(self, client: AsyncClient) -> None:
+        """
+        Push the buffered samples in batches.
+
+        :raises: HTTPError: if the server is unreachable or failed (5xx) on
+        a batch, the batch is kept in the buffer. A batch the server
+        rejected (other 4xx) is dropped, retrying it would block the rest.
+        """
+        while self.buffer:
+            batch = [self.buffer.popleft()
+                     for _ in range(min(self.batch_size, len(self.buffer)))]
+            body = gzip.compress(json.dumps({
+                "host": self.host,
+                "nics": self.nic_names,
+                "samples": batch,
+            }).encode())
+            try:
+                response = await client.post(
+                    self.url, content=body,
+                    headers={"Content-Encoding": "gzip",
+                             "Content-Type": "application/json"},
+                )
+                response.raise_for_status()
+            except HTTPStatusError as e:
+                status_code = e.response.status_code
+                if (status_code < 500 and
+                        status_code not in RETRYABLE_CLIENT_ERRORS):
+                    self.rejected_samples += len(batch)
+                    logger.error(f"Server rejected a batch of {len(batch)} "
+                                 f"samples ({status_code}: "
+                                 f"{e.response.text}), dropped it")
+                    continue
+                self._requeue(batch)
+                raise
+            except HTTPError:
+                self._requeue(batch)
+                raise
+            self.pushed_samples += len(batch)
+
+    def _requeue(self, batch: List[Dict]) -> None:
+        """ Back to the buffer front, the newest give way if it's full. """
+        overflow = len(self.buffer) + len(batch) - self.buffer.maxlen
+        self.dropped_samples += max(0, overflow)
+        self.buffer.extendleft(reversed(batch))
+
+    async def sample_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval.next(self.sample()))
+
+    async def push_forever(self) -> None:
+        backoff = self.push_interval
+        async with AsyncClient(timeout=settings.AGENT_TIMEOUT) as client:
+            while True:
+                await asyncio.sleep(backoff)
+                try:
+                    await self.push(client)
+                except HTTPError as e:
+                    backoff = min(backoff * 2, self.max_backoff)
+                    logger.warning(f"Push to {self.url} failed ({e!r}), "
+                                   f"{len(self.buffer)} samples buffered, "
+                                   f"retry in {backoff}s")
+                    continue
+                backoff = self.push_interval
+                logger.debug(f"Pushed {self.pushed_samples} samples, "
+                             f"dropped {self.dropped_samples}, rejected "
+                             f"{self.rejected_samples}")
+
+    async def run(self) -> None:
+        logger.info(f"Agent of host {self.host} pushing to {self.url}")
+        await asyncio.gather(self.sample_forever(), self.push_forever())
+
+
+agent = Agent(
+    server_url=settings.AGENT_SERVER_URL,
+    host=settings.HOST_NAME,
+    push_interval=settings.AGENT_PUSH_INTERVAL,
+    batch_size=settings.AGENT_BATCH_SIZE,
+    buffer_size=settings.AGENT_BUFFER_SIZE,
+    max_backoff=settings.AGENT_MAX_BACKOFF,
+)
+
+
+if __name__ == '__main__':
+    """ Run this function if this module ran explicitly """
+    config_logger()
+    try:
+        asyncio.run(agent.run())
+    except KeyboardInterrupt:
+        logger.warning(f"Agent stopped, {len(agent.buffer)} samples were "
+                       f"not pushed.")
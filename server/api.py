@@ -1,20 +1,279 @@
 """ Controllers module for api contract with other apps """
-from datetime import datetime, timedelta
-from typing import List, Optional, Union
+import asyncio
+import json
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, status, HTTPException
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from beanie.operators import In
+from fastapi import APIRouter, status, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
+from pydantic import ValidationError
 from starlette.responses import Response
 
 from config import settings
-from models import NIC, BandwidthSample
-from utils import rate_calculator_to_json_response
+from health import health
+from ingest import IngestedSample, agent_nic_name, ingest_pipeline
+from leader import leader_election
+from link_monitor import link_monitor
+from metrics import PROMETHEUS_MEDIA_TYPE, registry
+from models import (
+    NIC, AgentBatch, BandwidthRollup, BandwidthSample, NicLinkEvent,
+)
+from render import MEDIA_TYPES, snapshot_renderer
+from ring_buffer import Series, empty_series, recent_samples
+from rollups import RollupBucket, buckets_series, rollups
+from sketches import DDSketch
+from streaming import broadcaster, shared_events
+from thresholds import (
+    threshold_engine, thresholds_store, window_verdict,
+)
+from utils import utc_now
+from wire import JSON_MEDIA_TYPE, encode_series, negotiate
+from writer import sample_writer
 
 nics_router = APIRouter(prefix="/nics", tags=["nics"])
 bandwidth_router = APIRouter(prefix="/bandwidth", tags=["bandwidths"])
 settings_router = APIRouter(prefix="/settings", tags=["settings"])
+metrics_router = APIRouter(prefix="/metrics", tags=["metrics"])
+stream_router = APIRouter(prefix="/stream", tags=["stream"])
+ingest_router = APIRouter(prefix="/ingest", tags=["ingest"])
+stats_router = APIRouter(prefix="/stats", tags=["stats"])
+health_router = APIRouter(prefix="/health", tags=["health"])
+
+
+async def read_body(request: Request, max_size: int) -> bytes:
+    """
+    Read the request body as it streams in, gunzipped on the fly when
+    Content-Encoding says, so a small gzip bomb can't exhaust memory.
+
+    :param max_size: Max body size in bytes (decompressed).
+    :raises: HTTPException: if the body is bigger than max size.
+    :raises: zlib.error: if the body isn't valid gzip.
+    """
+    decompressor = None
+    if request.headers.get("content-encoding") == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    body = bytearray()
+    async for chunk in request.stream():
+        if decompressor:
+            chunk = decompressor.decompress(chunk, max_size + 1 - len(body))
+        body += chunk
+        if len(body) > max_size:
+            raise HTTPException(
+                detail=f"Body is bigger than {max_size} bytes.",
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    if decompressor and not decompressor.eof:
+        raise zlib.error("Truncated gzip body")
+    return bytes(body)
+
+
+async def resolve_nic_names(nics: Optional[List[str]]) -> List[str]:
+    """
+    :param nics: The requested nic names, "all" (or none) for all nics.
+    :return: The unique nic names.
+    """
+    if nics and "all" not in nics:
+        return list(dict.fromkeys(nics))
+    return [nic.name async for nic in NIC.find_all()]
+
+
+async def get_samples_windows(nic_names: List[str],
+                              since: datetime) -> Dict[str, Series]:
+    """
+    Get nics samples newer than a timestamp, served from the in-memory ring
+    buffers when they cover the window and from db otherwise (one query for
+    all nics that aren't covered).
+
+    :param nic_names: The unique nic names.
+    :param since: The timestamp the window starts after.
+    :return: Mapping of nic name to its samples series, oldest first.
+    """
+    since_timestamp = since.timestamp()
+    windows = {}
+    missing = []
+    for nic_name in nic_names:
+        if recent_samples.covers(nic_name, since_timestamp):
+            windows[nic_name] = recent_samples.window(nic_name,
+                                                      since_timestamp)
+        else:
+            windows[nic_name] = empty_series()
+            missing.append(nic_name)
+
+    if missing:
+        bw_samples = await BandwidthSample.find(
+            In(BandwidthSample.nic_name, missing),
+        ).find(
+            BandwidthSample.timestamp > since,
+        ).sort("timestamp").to_list()
+
+        for sample in bw_samples:
+            series = windows[sample.nic_name]
+            series.timestamps.append(sample.timestamp.timestamp())
+            series.uploads.append(sample.upload)
+            series.downloads.append(sample.download)
+    return windows
+
+
+async def get_rollups_windows(
+        nic_names: List[str],
+        since: datetime,
+        resolution: int,
+        sketches: bool = False,
+) -> Dict[str, List[RollupBucket]]:
+    """
+    Get nics rollup buckets overlapping the window, served from memory when
+    the tier covers it and from db (plus the open bucket if in memory)
+    otherwise. Open buckets of another worker (the leader) are in db as of
+    their last flush (ROLLUP_FLUSH_SECONDS).
+
+    :param nic_names: The unique nic names.
+    :param since: The timestamp the window starts after.
+    :param resolution: The rollup tier resolution in seconds.
+    :param sketches: The buckets quantile sketches are needed, served from
+    db for tiers which don't keep them in memory.
+    :return: Mapping of nic name to its rollup buckets, oldest first.
+    """
+    tier = rollups.tiers[resolution]
+    since_timestamp = since.timestamp()
+    in_memory = tier.keep_sketches or not sketches
+    windows = {}
+    missing = []
+    for nic_name in nic_names:
+        if in_memory and tier.covers(nic_name, since_timestamp):
+            windows[nic_name] = tier.window(nic_name, since_timestamp)
+        else:
+            windows[nic_name] = []
+            missing.append(nic_name)
+
+    if missing:
+        documents = await BandwidthRollup.find(
+            In(BandwidthRollup.nic_name, missing),
+            BandwidthRollup.resolution == resolution,
+        ).find(
+            BandwidthRollup.timestamp > since - timedelta(seconds=resolution),
+        ).sort("timestamp").to_list()
+
+        currents = {nic_name: tier.current(nic_name) for nic_name in missing}
+        for document in documents:
+            current = currents[document.nic_name]
+            if current and current.id == document.id:
+                # Flushed version of the open bucket, added from memory
+                continue
+            buckets = windows[document.nic_name]
+            bucket = RollupBucket.from_document(document)
+            # Same bucket may be persisted partially by several server runs
+            if buckets and buckets[-1].start == bucket.start:
+                buckets[-1].merge(bucket)
+            else:
+                buckets.append(bucket)
+
+        for nic_name, current in currents.items():
+            buckets = windows[nic_name]
+            if not current:
+                continue
+            if buckets and buckets[-1].start == current.start:
+                buckets[-1].merge(current)
+            elif not buckets or current.start > buckets[-1].start:
+                buckets.append(current)
+    return windows
+
+
+async def get_bandwidth_windows(
+        nic_names: List[str],
+        last_minutes: int,
+        max_points: Optional[int],
+) -> Tuple[Optional[int], Dict[str, Union[Series, List[RollupBucket]]]]:
+    """
+    :param nic_names: The unique nic names.
+    :param last_minutes: The timedelta in minutes of last minutes samples.
+    :param max_points: Maximum number of points wanted per nic.
+    :return: The rollups resolution (None for raw samples) and mapping of
+    nic name to its samples series (or rollup buckets).
+    """
+    wanted_timestamp = utc_now() - timedelta(minutes=last_minutes)
+    resolution = rollups.select_resolution(
+        last_minutes * 60, max_points) if max_points else None
+
+    if resolution:
+        return resolution, await get_rollups_windows(
+            nic_names, wanted_timestamp, resolution)
+    return None, await get_samples_windows(nic_names, wanted_timestamp)
+
+
+async def get_bandwidth_records(
+        nic_names: List[str],
+        last_minutes: int,
+        max_points: Optional[int],
+) -> Dict[str, List[Dict]]:
+    """
+    :param nic_names: The unique nic names.
+    :param last_minutes: The timedelta in minutes of last minutes samples.
+    :param max_points: Maximum number of points wanted per nic.
+    :return: Mapping of nic name to its samples (or rollups) json records.
+    """
+    resolution, windows = await get_bandwidth_windows(nic_names, last_minutes,
+                                                      max_points)
+    if resolution:
+        return {
+            nic_name: [bucket.to_record(nic_name, resolution)
+                       for bucket in buckets]
+            for nic_name, buckets in windows.items()
+        }
+    return {nic_name: series.to_records(nic_name)
+            for nic_name, series in windows.items()}
+
+
+def rates_stats(sketch: DDSketch, rates_sum: float, rates_min: float,
+                rates_max: float, count: int, quantiles: List[float]) -> Dict:
+    """
+    :returns: The rates min/max/avg (exact) and quantiles (estimated) of
+    the window, e.g. {"p50": ..., "p95": ...}.
+    """
+    stats = {"min": rates_min, "max": rates_max,
+             "avg": round(rates_sum / count, 3) if count else None}
+    for q in quantiles:
+        value = sketch.quantile(q)
+        stats[f"p{q * 100:g}"] = None if value is None else round(value, 3)
+    return stats
+
+
+def samples_stats(rates: array, quantiles: List[float]) -> Dict:
+    """ :returns: The rates min/max/avg and quantiles (exact) of a window. """
+    ordered = sorted(rates)
+    stats = {"min": ordered[0], "max": ordered[-1],
+             "avg": round(sum(ordered) / len(ordered), 3)}
+    for q in quantiles:
+        stats[f"p{q * 100:g}"] = round(ordered[int(q * (len(ordered) - 1))],
+                                       3)
+    return stats
+
+
+async def get_verdicts(nic_names: List[str]) -> Dict[str, Optional[Dict]]:
+    """
+    :param nic_names: The unique nic names.
+    :return: Mapping of nic name to its threshold verdict (None if no data).
+    """
+    now = time.time()
+    verdicts = {nic_name: threshold_engine.verdict(nic_name, now)
+                for nic_name in nic_names}
+
+    missing = [nic_name for nic_name, verdict in verdicts.items()
+               if verdict is None]
+    if missing:
+        # Nothing sampled by this process lately, evaluate the stored windows
+        window_timestamp = utc_now() - timedelta(
+            seconds=settings.THRESHOLD_WINDOW_SECONDS)
+        windows = await get_samples_windows(missing, window_timestamp)
+        for nic_name, series in windows.items():
+            if series.timestamps:
+                verdicts[nic_name] = window_verdict(
+                    nic_name, sum(series.uploads), sum(series.downloads),
+                    len(series.timestamps))
+    return verdicts
 
 
 @nics_router.get("/")
@@ -23,29 +282,128 @@ async def get_nics() -> List[NIC]:
     return await NIC.find_all().to_list()
 
 
+@nics_router.get("/{nic_name}/link_events")
+async def get_nic_link_events(nic_name: str,
+                              limit: int = 20) -> List[NicLinkEvent]:
+    """
+    Get the link state changes (up/down) of specific nic, newest first.
+
+    :param nic_name: The unique nic name.
+    :param limit: Maximum number of events.
+    """
+    return await NicLinkEvent.find(
+        NicLinkEvent.nic_name == nic_name,
+    ).sort("-timestamp").limit(limit).to_list()
+
+
+@bandwidth_router.get("/")
+async def get_nics_bandwidth_samples(
+        nics: Optional[List[str]] = Query(default=None),
+        last_minutes: int = 1,
+        max_points: Optional[int] = None,
+) -> JSONResponse:
+    """
+    Get bandwidth samples of many nics in one response.
+
+    :param nics: The nic names, "all" (or none) for all nics.
+    :param last_minutes: The timedelta in minutes of last minutes samples.
+    :param max_points: Maximum number of points wanted per nic.
+    :return: Mapping of nic name to its samples.
+    """
+    nic_names = await resolve_nic_names(nics)
+    return JSONResponse(
+        content=await get_bandwidth_records(nic_names, last_minutes,
+                                            max_points),
+        status_code=status.HTTP_200_OK,
+    )
+
+
 @bandwidth_router.get("/{nic_name}")
 async def get_nic_bandwidth_samples(
         nic_name: str,
         last_minutes: int = 1,
-) -> Union[Response, JSONResponse]:
+        max_points: Optional[int] = None,
+        accept: Optional[str] = Header(default=None),
+) -> Response:
     """
     Get all bandwidth samples of specific nic.
 
+    Negotiated by the Accept header, json records by default or columns
+    (epoch base, timestamps offsets and upload/download arrays) as
+    application/vnd.networkmonitor.columns+json or application/msgpack.
+
     :param nic_name: The unique nic name.
     :param last_minutes: The timedelta in minutes of last minutes samples.
+    :param max_points: Maximum number of points wanted, when raw samples
+    exceed it the finest fitting rollup tier (1m/1h) buckets are returned.
+    :param accept: The wanted media types.
     :return: HTTP status code representing what happened.
     :raises: HTTPException: if the db doesn't contain this nic_id.
     """
-    wanted_timestamp = datetime.now() - timedelta(minutes=last_minutes)
-    bw_samples = await BandwidthSample.find(
-        BandwidthSample.nic_name == nic_name,
-    ).find(
-        BandwidthSample.timestamp > wanted_timestamp,
-    ).sort("timestamp").to_list()
+    media_type = negotiate(accept)
+    if media_type != JSON_MEDIA_TYPE:
+        resolution, windows = await get_bandwidth_windows(
+            [nic_name], last_minutes, max_points)
+        series = (buckets_series(windows[nic_name]) if resolution
+                  else windows[nic_name])
+        if not series.timestamps:
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+        return Response(
+            content=encode_series(media_type, nic_name, resolution, series),
+            media_type=media_type,
+        )
+
+    records = await get_bandwidth_records([nic_name], last_minutes,
+                                          max_points)
 
-    if not bw_samples:
+    if not records[nic_name]:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
-    return JSONResponse(content=jsonable_encoder(bw_samples),
+    return JSONResponse(content=records[nic_name],
+                        status_code=status.HTTP_200_OK)
+
+
+@bandwidth_router.get("/{nic_name}/snapshot")
+async def get_nic_bandwidth_snapshot(
+        nic_name: str,
+        last_minutes: int = 1,
+        max_points: int = 500,
+        image_format: str = Query(default="png", alias="format",
+                                  regex="^(png|svg)$"),
+) -> Response:
+    """
+    Get the upload and download rates plot of specific nic, rendered on the
+    server and cached until a newer sample arrives.
+
+    :param nic_name: The unique nic name.
+    :param last_minutes: The window of the plot in minutes.
+    :param max_points: Maximum number of points to plot, wide windows are
+    plotted from the rollup tiers (1m/1h) averages.
+    :param image_format: The image format, png or svg.
+    :return: The image, 204 when there are no samples in the window.
+    """
+    records = await get_bandwidth_records([nic_name], last_minutes,
+                                          max_points)
+    if not records[nic_name]:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    image = await snapshot_renderer.render(
+        nic_name, (last_minutes, max_points), records[nic_name],
+        image_format)
+    return Response(content=image, media_type=MEDIA_TYPES[image_format])
+
+
+@nics_router.get("/check_nic_rate_threshold/")
+async def check_nics_rate_threshold(
+        nics: Optional[List[str]] = Query(default=None),
+) -> JSONResponse:
+    """
+    Check many NICs rate thresholds in one response.
+
+    :param nics: The nic names, "all" (or none) for all nics.
+    :return: Mapping of nic name to its verdict, null when no valid data.
+    """
+    nic_names = await resolve_nic_names(nics)
+    return JSONResponse(content=await get_verdicts(nic_names),
                         status_code=status.HTTP_200_OK)
 
 
@@ -54,35 +412,155 @@ async def check_nic_rate_threshold(
         nic_name: str,
 ) -> JSONResponse:
     """
-    Check specific NIC rate threshold.
+    Check specific NIC rate threshold, the average rates of the last window
+    are evaluated by the thresholds engine as samples arrive.
 
     :param nic_name: The unique nic name.
     :return: response message indicating the nic threshold test.
     """
-    last_minute_timestamp = datetime.now() - timedelta(minutes=1)
-    bw_samples = await BandwidthSample.find(
-        BandwidthSample.nic_name == nic_name,
-    ).find(
-        BandwidthSample.timestamp > last_minute_timestamp,
-    ).sort("timestamp").to_list()
-
-    first_sample = bw_samples[0] if bw_samples else None
-    last_sample = bw_samples[-1] if bw_samples else None
+    verdict = (await get_verdicts([nic_name]))[nic_name]
 
-    if first_sample and first_sample is not last_sample:
-        last_minute_download = last_sample.download - first_sample.download
-        last_minute_upload = last_sample.upload - first_sample.upload
-
-        return rate_calculator_to_json_response(
-            dl=last_minute_download,
-            ul=last_minute_upload,
-            nic_name=nic_name,
-        )
+    if verdict:
+        return JSONResponse(content=verdict, status_code=status.HTTP_200_OK)
 
     return JSONResponse(content="Not valid data yet or name given.",
                         status_code=status.HTTP_404_NOT_FOUND)
 
 
+@stream_router.get("/samples")
+async def stream_samples(
+        nics: Optional[List[str]] = Query(default=None),
+) -> StreamingResponse:
+    """
+    Stream (Server-Sent Events) every new sample and its threshold verdict
+    (null for agents samples ingested by a non-leader worker).
+
+    :param nics: The nic names to follow, all nics when not given.
+    :return: text/event-stream response open until the client disconnects.
+    """
+    subscription = broadcaster.subscribe(set(nics) if nics else None)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        timeout=settings.STREAM_KEEPALIVE_SECONDS,
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: sample\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@stats_router.get("/{nic_name}")
+async def get_nic_stats(
+        nic_name: str,
+        last_minutes: int = 60,
+        quantiles: List[float] = Query(default=[0.5, 0.95, 0.99]),
+) -> Response:
+    """
+    Get upload and download rates percentiles of specific nic. Windows of
+    the in-memory recent samples are exact, other windows are merged from
+    the quantile sketches of the rollup buckets in the window (so it takes
+    as long as the number of buckets, not samples) and rounded out to whole
+    buckets of the finest tier (1m/1h) fitting it.
+
+    :param nic_name: The unique nic name.
+    :param last_minutes: The window in minutes.
+    :param quantiles: The wanted quantiles (between 0 and 1).
+    :return: The window's samples count, rates min/max/avg and quantiles.
+    :raises: HTTPException: if a quantile isn't between 0 and 1.
+    """
+    if not all(0 <= q <= 1 for q in quantiles):
+        raise HTTPException(detail="Quantiles must be between 0 and 1.",
+                            status_code=status.HTTP_400_BAD_REQUEST)
+
+    since = utc_now() - timedelta(minutes=last_minutes)
+    if recent_samples.covers(nic_name, since.timestamp()):
+        series = recent_samples.window(nic_name, since.timestamp())
+        if not series.timestamps:
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+        return JSONResponse(content={
+            "nic_name": nic_name,
+            "resolution": None,
+            "since": since.isoformat(),
+            "count": len(series.timestamps),
+            "upload": samples_stats(series.uploads, quantiles),
+            "download": samples_stats(series.downloads, quantiles),
+        }, status_code=status.HTTP_200_OK)
+
+    resolution = rollups.stats_resolution(last_minutes * 60,
+                                          settings.STATS_MAX_BUCKETS)
+    buckets = (await get_rollups_windows([nic_name], since, resolution,
+                                         sketches=True))[nic_name]
+    if not buckets:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    window = RollupBucket(buckets[0].start)
+    for bucket in buckets:
+        window.merge(bucket)
+    return JSONResponse(content={
+        "nic_name": nic_name,
+        "resolution": resolution,
+        "since": datetime.fromtimestamp(window.start,
+                                        timezone.utc).isoformat(),
+        "count": window.count,
+        "upload": rates_stats(window.upload_sketch, window.upload_sum,
+                              window.upload_min, window.upload_max,
+                              window.count, quantiles),
+        "download": rates_stats(window.download_sketch,
+                                window.download_sum, window.download_min,
+                                window.download_max, window.count,
+                                quantiles),
+    }, status_code=status.HTTP_200_OK)
+
+
+@ingest_router.post("/samples")
+async def ingest_agent_samples(request: Request) -> JSONResponse:
+    """
+    Ingest a batch of samples pushed by an agent (server/agent.py), the
+    body is an AgentBatch json, gzip compressed when Content-Encoding says.
+    Agent nics are named "<host>:<nic>".
+
+    :return: Number of accepted samples.
+    :raises: HTTPException: if the body isn't a valid batch (422 for
+    invalid samples, e.g. non finite or negative rates), is too big
+    (INGEST_MAX_BODY_SIZE) or the db isn't ready yet (the agent retries).
+    """
+    if not health.is_ready:
+        raise HTTPException(detail="Server is starting, db isn't ready.",
+                            status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        batch = AgentBatch.parse_raw(
+            await read_body(request, settings.INGEST_MAX_BODY_SIZE))
+    except zlib.error as e:
+        raise HTTPException(detail=f"Invalid samples batch: {e}",
+                            status_code=status.HTTP_400_BAD_REQUEST)
+    except ValidationError as e:
+        # Before any sample is ingested, e.g. a NaN or negative rate
+        raise HTTPException(detail=f"Invalid samples batch: {e}",
+                            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    await ingest_pipeline.register_nics(
+        batch.host, batch.nics or {sample.nic_name
+                                   for sample in batch.samples})
+    accepted = await ingest_pipeline.ingest(
+        (IngestedSample(agent_nic_name(batch.host, sample.nic_name),
+                        batch.host, sample.timestamp, sample.upload,
+                        sample.download)
+         for sample in batch.samples),
+        in_memory=not leader_election.enabled,
+    )
+    return JSONResponse(content={"accepted": accepted},
+                        status_code=status.HTTP_202_ACCEPTED)
+
+
 @settings_router.put("/update_thresholds")
 async def update_thresholds(
         dl_min: Optional[int] = None,
@@ -98,7 +576,14 @@ async def update_thresholds(
     :param ul_min: Upload minimum threshold.
     :param ul_max: Upload maximum threshold.
     :return: JSON response
+    :raises: HTTPException: if a threshold is invalid or the db isn't
+    ready yet (the thresholds are kept there for all workers).
     """
+    if not health.is_ready:
+        raise HTTPException(detail="Server is starting, db isn't ready.",
+                            status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    # Validate against the latest thresholds, maybe updated by another worker
+    await thresholds_store.load()
     if dl_min:
         if (dl_max and dl_min >= dl_max) or (
                 dl_min >= settings.DL_MAX_NIC_RATE_THRESHOLD):
@@ -130,5 +615,70 @@ async def update_thresholds(
                  f"{settings.DL_MAX_NIC_RATE_THRESHOLD},"
                  f"{settings.UL_MIN_NIC_RATE_THRESHOLD},"
                  f"{settings.UL_MAX_NIC_RATE_THRESHOLD}")
+    await thresholds_store.save()
+    threshold_engine.reevaluate()
 
     return JSONResponse(content="Updated", status_code=status.HTTP_200_OK)
+
+
+@metrics_router.get("")
+async def get_prometheus_metrics() -> Response:
+    """
+    Get this worker's metrics in Prometheus text format (sampler ticks,
+    db commands and requests latency histograms, nics and queues gauges).
+    """
+    return Response(content=registry.render(),
+                    media_type=PROMETHEUS_MEDIA_TYPE)
+
+
+@metrics_router.get("/writer")
+async def get_writer_metrics() -> Dict:
+    """ Get the bandwidth samples writer queue depth and flush latency. """
+    return sample_writer.stats()
+
+
+@metrics_router.get("/leader")
+async def get_leader_metrics() -> Dict:
+    """ Get the worker serving the request and whether it's the leader. """
+    return leader_election.stats()
+
+
+@metrics_router.get("/thresholds")
+async def get_thresholds_metrics() -> Dict:
+    """ Get the thresholds this worker applies and its reloads count. """
+    return thresholds_store.stats()
+
+
+@metrics_router.get("/stream")
+async def get_stream_metrics() -> Dict:
+    """ Get the live stream subscribers and events shared between workers. """
+    return shared_events.stats()
+
+
+@metrics_router.get("/links")
+async def get_link_metrics() -> Dict:
+    """ Get the link monitor's source, nics states and events count. """
+    return link_monitor.stats()
+
+
+@metrics_router.get("/render")
+async def get_render_metrics() -> Dict:
+    """ Get the snapshots render cache size, hits and misses. """
+    return snapshot_renderer.stats()
+
+
+@health_router.get("/live")
+async def get_liveness() -> Dict:
+    """ Liveness probe, the worker serves requests (and its startup). """
+    return health.stats()
+
+
+@health_router.get("/ready")
+async def get_readiness() -> JSONResponse:
+    """
+    Readiness probe, 503 until the db is initialized. Whether (and since
+    when) this worker samples is in the sampling section.
+    """
+    return JSONResponse(content=health.stats(),
+                        status_code=status.HTTP_200_OK if health.is_ready
+                        else status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -1,4 +1,7 @@
 """ App configurations """
+import socket
+import sys
+from typing import List, Optional
 
 from pydantic import BaseSettings
 
@@ -10,17 +13,117 @@ class Settings(BaseSettings):
     DB_PORT: str = "27017"
     NIC_DB_COLLECTION: str = "network_interface_card_collection"
     BW_DB_COLLECTION: str = "bandwidth_sample_collection"
+    # Startup retries connecting to db every that many seconds
+    DB_RETRY_SECONDS: float = 5.0
 
-    # Tasks configs
-    NETWORK_SLEEP_TIME: int = 2
+    # Bandwidth samples storage configs, time-series mode stores them in a
+    # MongoDB time-series collection and TTL (seconds) bounds the history
+    BW_TIMESERIES: bool = False
+    BW_TIMESERIES_COLLECTION: str = "bandwidth_sample_timeseries"
+    BW_TTL_SECONDS: Optional[int] = None
+
+    # Logs of lower levels are skipped, per sample logs are DEBUG
+    LOG_LEVEL: str = "INFO"
+
+    # Host identity, nics of agents are named "<host>:<nic>"
+    HOST_NAME: str = socket.gethostname()
+    # Sample this host's nics, disable to only ingest agents samples
+    # (e.g. server in a container)
+    LOCAL_SAMPLING: bool = True
+
+    # API worker processes, more than one runs without reload and a single
+    # worker (the leader, elected by a lease in db) owns the sampling tasks
+    WORKERS: int = 1
+    LEADER_LEASE_NAME: str = "sampler"
+    # The leader renews the lease every renew interval, another worker
+    # takes over once it expired (the leader died)
+    LEADER_LEASE_SECONDS: int = 15
+    LEADER_RENEW_SECONDS: int = 5
+
+    # Agent configs (server/agent.py)
+    AGENT_SERVER_URL: str = "http://localhost:8000"
+    AGENT_PUSH_INTERVAL: float = 5.0
+    AGENT_BATCH_SIZE: int = 1000
+    AGENT_BUFFER_SIZE: int = 100000
+    AGENT_TIMEOUT: float = 10.0
+    AGENT_MAX_BACKOFF: float = 300.0
+    # Agent batches bigger than that (bytes, decompressed) are refused
+    INGEST_MAX_BODY_SIZE: int = 16 * 1024 * 1024
+
+    # Tasks configs, nics link state is followed by netlink notifications
+    # (Linux) and polled every monitor interval when they're unavailable
+    LINK_MONITOR_NETLINK: bool = True
     INTERVAL_TASK_MONITOR_NICS: int = 15
-    INTERVAL_TASK_BW_SAMPLE: int = 5
+    INTERVAL_TASK_BW_SAMPLE: float = 5
+    # Nics (or "all") with 32 bit byte counters, a counter going back
+    # wrapped around, on other nics it was reset (e.g. driver reload).
+    # Counters of 32 bit kernels are all 32 bit
+    COUNTERS_32_BIT_NICS: List[str] = (["all"] if sys.maxsize < 2 ** 32
+                                       else [])
+
+    # Adaptive sampling, nics are sampled every min interval while busy
+    # (rate in Mbps) or near the max thresholds (ratio of the threshold)
+    # and back off to INTERVAL_TASK_BW_SAMPLE while idle
+    ADAPTIVE_SAMPLING: bool = False
+    ADAPTIVE_MIN_INTERVAL: float = 0.25
+    ADAPTIVE_BUSY_RATE: float = 10.0
+    ADAPTIVE_NEAR_THRESHOLD_RATIO: float = 0.8
+
+    # Bandwidth samples writer configs
+    WRITER_BATCH_SIZE: int = 500
+    WRITER_FLUSH_INTERVAL: float = 1.0
+    WRITER_MAX_QUEUE_SIZE: int = 10000
+    WRITER_MAX_RETRIES: int = 3
+
+    # Recent samples kept in memory per nic (an hour of default sampling)
+    RING_BUFFER_CAPACITY: int = 720
+
+    # Rollup buckets kept in memory per nic (a day of 1m, a month of 1h),
+    # closed 1m buckets quantile sketches are only kept in db
+    ROLLUP_MINUTE_RETENTION: int = 1440
+    ROLLUP_HOUR_RETENTION: int = 720
+    # The leader persists its open buckets every that many seconds, the
+    # other workers windows are served from db
+    ROLLUP_FLUSH_SECONDS: float = 10.0
+
+    # Live stream configs
+    STREAM_QUEUE_SIZE: int = 100
+    STREAM_KEEPALIVE_SECONDS: int = 15
+    # With many workers every ingested sample's event goes through a capped
+    # db collection (size in bytes) tailed by all workers
+    STREAM_COLLECTION: str = "stream_events"
+    STREAM_COLLECTION_SIZE: int = 16 * 1024 * 1024
+    STREAM_RETRY_SECONDS: float = 1.0
+
+    # Snapshot rendering configs
+    RENDER_WORKERS: int = 2
+    RENDER_CACHE_SIZE: int = 64
+    SNAPSHOT_WIDTH_INCHES: float = 12
+    SNAPSHOT_HEIGHT_INCHES: float = 6
+
+    # Rollup buckets quantile sketches, rates are estimated within the
+    # relative accuracy, rates below the min value (Mbps) count as zero
+    SKETCH_RELATIVE_ACCURACY: float = 0.01
+    SKETCH_MIN_VALUE: float = 0.001
+    # Bins per sketch (4 bytes each), past them the lowest bins collapse,
+    # at 1% accuracy 1024 bins cover the min value up to 100Gbps
+    SKETCH_MAX_BINS: int = 1024
+    # Stats are merged from the finest rollup tier with at most that many
+    # buckets in the window
+    STATS_MAX_BUCKETS: int = 1500
+
+    # Thresholds are evaluated on the average rates of this window
+    THRESHOLD_WINDOW_SECONDS: int = 60
 
     # Represents Mbps
     DL_MIN_NIC_RATE_THRESHOLD: int = 0
     DL_MAX_NIC_RATE_THRESHOLD: int = 5
     UL_MIN_NIC_RATE_THRESHOLD: int = 0
     UL_MAX_NIC_RATE_THRESHOLD: int = 3
+    # Updated thresholds are kept in db (overriding the ones above), every
+    # worker reloads them every that many seconds
+    THRESHOLDS_NAME: str = "nic_rate"
+    THRESHOLDS_RELOAD_SECONDS: float = 5.0
 
 
 settings = Settings()
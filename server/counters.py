@@ -0,0 +1,132 @@
+""" NICs byte counters sources module """
+import os
+from typing import Dict, Iterable, Tuple
+
+import psutil
+
+from config import settings
+
+PROC_NET_DEV = "/proc/net/dev"
+# Lines before the first nic in /proc/net/dev
+PROC_NET_DEV_HEADER_LINES = 2
+# Fields (after the nic name) of received and transmitted bytes
+RECEIVED_BYTES_FIELD, SENT_BYTES_FIELD = 0, 8
+COUNTER_32_MODULO = 2 ** 32
+READ_BUFFER_SIZE = 16 * 1024
+
+# Nic name -> (bytes sent, bytes received)
+Counters = Dict[str, Tuple[int, int]]
+
+
+def counter_delta(current: int, last: int, is_32_bit: bool = False) -> int:
+    """
+    :param is_32_bit: The nic is known to have 32 bit counters (32 bit
+    kernels and some drivers), which wrap around to zero.
+    :returns: How much a counter grew since last, a counter that went back
+    was reset (e.g. driver reload) and grew from zero, unless it's a 32 bit
+    counter which wrapped around.
+    """
+    if current >= last:
+        return current - last
+    if is_32_bit:
+        return current + COUNTER_32_MODULO - last
+    return current
+
+
+class ProcNetDevCounters:
+    """
+    Linux counters read straight from /proc/net/dev.
+
+    The file is kept open and read into a reusable buffer on every call,
+    only the two byte fields of every nic are parsed. Counters are kept
+    monotonic across resets like psutil's nowrap (and across wraparounds
+    of nics known to have 32 bit counters).
+    """
+
+    def __init__(self, path: str = PROC_NET_DEV,
+                 nics_32_bit: Iterable[str] = ()):
+        self.path = path
+        self.nics_32_bit = set(nics_32_bit)
+        self.all_32_bit = "all" in self.nics_32_bit
+        self._fd = os.open(path, os.O_RDONLY)
+        self._buffer = bytearray(READ_BUFFER_SIZE)
+        # Nic name -> (raw sent, raw received) of the previous read
+        self._raw: Counters = {}
+        self._totals: Counters = {}
+
+    def _read(self) -> int:
+        """
+        Read the file into the buffer, which grows to fit it.
+
+        :return: The file's size.
+        """
+        while True:
+            size = os.preadv(self._fd, [self._buffer], 0)
+            if size < len(self._buffer):
+                return size
+            self._buffer = bytearray(len(self._buffer) * 2)
+
+    def read(self) -> Counters:
+        """ :returns: Mapping of nic name to its (sent, received) bytes. """
+        raw, totals = self._raw, self._totals
+        size = self._read()
+        buffer = self._buffer
+        counters = {}
+
+        position = 0
+        for _ in range(PROC_NET_DEV_HEADER_LINES):
+            position = buffer.find(b"\n", position, size) + 1
+        while 0 < position < size:
+            end = buffer.find(b"\n", position, size)
+            if end < 0:
+                end = size
+            colon = buffer.find(b":", position, end)
+            line_start, position = position, end + 1
+            if colon < 0:
+                continue
+            fields = buffer[colon + 1:end].split()
+            if len(fields) <= SENT_BYTES_FIELD:
+                continue
+            name = buffer[line_start:colon].strip().decode()
+            sent = int(fields[SENT_BYTES_FIELD])
+            received = int(fields[RECEIVED_BYTES_FIELD])
+
+            last = raw.get(name)
+            if last is None:
+                total = (sent, received)
+            else:
+                total_sent, total_received = totals[name]
+                is_32_bit = self.all_32_bit or name in self.nics_32_bit
+                total = (total_sent + counter_delta(sent, last[0], is_32_bit),
+                         total_received + counter_delta(received, last[1],
+                                                        is_32_bit))
+            raw[name] = (sent, received)
+            totals[name] = counters[name] = total
+
+        for name in raw.keys() - counters.keys():
+            # Removed nic
+            del raw[name], totals[name]
+        return counters
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PsutilCounters:
+    """ psutil's counters, for platforms without /proc/net/dev. """
+
+    def read(self) -> Counters:
+        return {name: (counters.bytes_sent, counters.bytes_recv)
+                for name, counters in psutil.net_io_counters(
+                    pernic=True, nowrap=True).items()}
+
+
+def counters_source():
+    """ :returns: The cheapest counters source of this platform. """
+    if hasattr(os, "preadv"):
+        try:
+            return ProcNetDevCounters(
+                nics_32_bit=settings.COUNTERS_32_BIT_NICS)
+        except OSError:
+            pass
+    return PsutilCounters()
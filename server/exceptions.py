@@ -1,5 +0,0 @@
-""" Exceptions module """
-
-
-class NicDownException(BaseException):
-    """ Extend the base exception for exception when Nic Loss. """
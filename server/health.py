@@ -0,0 +1,61 @@
+""" Worker health (liveness and readiness) module """
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import settings
+from leader import leader_election
+from utils import utc_now
+
+
+def isoformat(timestamp: Optional[datetime]) -> Optional[str]:
+    return timestamp.isoformat() if timestamp else None
+
+
+class WorkerHealth:
+    """
+    Startup milestones of this worker, the services start in the background
+    so the api is up before the db connects.
+
+    The worker is live while it serves requests and ready once the db is
+    initialized and the services (writer, thresholds, live events sharing
+    and leader election) started. Sampling is reported on its own, only the
+    leader samples and its first samples come on the second tick.
+    """
+
+    def __init__(self):
+        self.started_at = utc_now()
+        self.database_ready_at: Optional[datetime] = None
+        self.sampling_started_at: Optional[datetime] = None
+        self.last_sample_at: Optional[datetime] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.database_ready_at is not None
+
+    def database_ready(self) -> None:
+        self.database_ready_at = utc_now()
+
+    def sampled(self) -> None:
+        """ Record a sampling tick which ingested samples. """
+        self.last_sample_at = utc_now()
+        if self.sampling_started_at is None:
+            self.sampling_started_at = self.last_sample_at
+
+    def sampling_stopped(self) -> None:
+        self.sampling_started_at = self.last_sample_at = None
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.is_ready,
+            "started_at": isoformat(self.started_at),
+            "database_ready_at": isoformat(self.database_ready_at),
+            "sampling": {
+                "local_sampling": settings.LOCAL_SAMPLING,
+                "is_leader": leader_election.is_leader,
+                "started_at": isoformat(self.sampling_started_at),
+                "last_sample_at": isoformat(self.last_sample_at),
+            },
+        }
+
+
+health = WorkerHealth()
@@ -0,0 +1,139 @@
+""" Samples ingest pipeline shared by the local sampler and the agents """
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from beanie.operators import In
+from loguru import logger
+
+from models import NIC, BandwidthRollup, BandwidthSample
+from ring_buffer import recent_samples
+from rollups import rollups, save_rollups
+from streaming import broadcaster, shared_events
+from thresholds import threshold_engine
+from utils import log_enabled
+from writer import sample_writer
+
+
+class IngestedSample(NamedTuple):
+    """ A bandwidth sample of a nic (rates in Mbps) """
+    nic_name: str
+    host: str
+    # Epoch seconds
+    timestamp: float
+    upload: float
+    download: float
+
+
+def agent_nic_name(host: str, nic_name: str) -> str:
+    """ :returns: The name of an agent's nic, unique across hosts. """
+    return f"{host}:{nic_name}"
+
+
+class IngestPipeline:
+    """
+    Feeds samples to the in-memory stores (recent samples, rollups and
+    thresholds), the batch writer and the live stream.
+
+    Samples may arrive late (an agent flushing its buffer), late samples
+    are persisted but the memory stores send windows over them to db.
+
+    With many workers an agent's batches land on any of them, so they skip
+    the memory stores (whose windows would miss the other workers samples)
+    and are only persisted, rollups as partial buckets of the batch (their
+    live events have no verdict). Live events go through db then, to the
+    subscribers of all workers.
+    """
+
+    def __init__(self):
+        # Agents nics names known to be in db
+        self._known_nics: Set[str] = set()
+
+    async def register_nics(self, host: str, nic_names: Iterable[str]) -> None:
+        """
+        Create the NIC documents of an agent's nics not seen before, one
+        query and one bulk insert for all new nics.
+        """
+        names = {agent_nic_name(host, nic_name) for nic_name in nic_names}
+        new_names = names - self._known_nics
+        if not new_names:
+            return
+
+        existing = {nic.name async for nic in NIC.find(
+            In(NIC.name, list(new_names)))}
+        missing = new_names - existing
+        if missing:
+            await NIC.insert_many([NIC(name=name, host=host)
+                                   for name in sorted(missing)])
+            logger.info(f"Registered {len(missing)} nics of host {host}")
+        self._known_nics |= new_names
+
+    async def ingest(self, samples: Iterable[IngestedSample],
+                     in_memory: bool = True) -> int:
+        """
+        :param samples: The samples, oldest first per nic.
+        :param in_memory: Feed the memory stores, False when other workers
+        ingest samples of the same nics.
+        :return: Number of ingested samples.
+        """
+        closed_rollups: List[BandwidthRollup] = []
+        batch_samples: List[Tuple[str, float, float, float]] = []
+        events: List[Dict] = []
+        count = 0
+        # Checked once per batch, not formatted per sample when skipped
+        log_samples = log_enabled("DEBUG")
+
+        for sample in samples:
+            nic_name, timestamp = sample.nic_name, sample.timestamp
+            if log_samples:
+                logger.debug(f"Sample of nic {nic_name}: upload "
+                             f"{sample.upload}Mbps, download "
+                             f"{sample.download}Mbps")
+
+            verdict = None
+            if in_memory:
+                latest = recent_samples.latest(nic_name)
+                if latest is not None and timestamp < latest:
+                    recent_samples.invalidate(nic_name, timestamp)
+                else:
+                    recent_samples.append(nic_name, timestamp, sample.upload,
+                                          sample.download)
+                closed_rollups += rollups.add(nic_name, timestamp,
+                                              sample.upload, sample.download)
+                verdict = threshold_engine.add(nic_name, timestamp,
+                                               sample.upload, sample.download)
+            else:
+                batch_samples.append((nic_name, timestamp, sample.upload,
+                                      sample.download))
+
+            sample_datetime = datetime.fromtimestamp(timestamp, timezone.utc)
+            await sample_writer.put(BandwidthSample(
+                nic_name=nic_name, host=sample.host, upload=sample.upload,
+                download=sample.download, timestamp=sample_datetime,
+            ))
+
+            if shared_events.enabled or broadcaster.has_subscribers:
+                events.append({
+                    "nic_name": nic_name,
+                    "host": sample.host,
+                    "timestamp": sample_datetime.isoformat(),
+                    "upload": sample.upload,
+                    "download": sample.download,
+                    "verdict": verdict,
+                })
+            count += 1
+
+        if batch_samples:
+            closed_rollups += rollups.batch_documents(batch_samples)
+        await save_rollups(closed_rollups)
+
+        # With many workers the subscribers may be on any of them
+        if shared_events.enabled:
+            if events:
+                await shared_events.publish(events)
+        else:
+            for event in events:
+                broadcaster.publish(event)
+        return count
+
+
+ingest_pipeline = IngestPipeline()
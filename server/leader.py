@@ -0,0 +1,169 @@
+""" Leader election of the server worker processes module """
+import asyncio
+import os
+import time
+import uuid
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from config import settings
+from models import LeaderLease
+from utils import utc_now
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class LeaderElection:
+    """
+    Elect the single worker process which owns the sampling tasks.
+
+    Workers race for a lease document in db, the holder renews it every
+    renew interval. A leader that dies (or hangs) stops renewing, so the
+    lease expires and another worker acquires it. The leader also stops
+    considering itself leader once its lease could have expired, even if
+    db is unreachable, so two workers never sample at once.
+    With a single worker there is no one to race and it always leads.
+    """
+
+    def __init__(self, name: str, lease_seconds: int, renew_seconds: int,
+                 enabled: bool):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.renew_seconds = renew_seconds
+        self.enabled = enabled
+        self.holder: Optional[str] = None
+
+        self._on_elected: Optional[Callback] = None
+        self._on_deposed: Optional[Callback] = None
+        self._task: Optional[asyncio.Task] = None
+        # Monotonic time the held lease expires at
+        self._valid_until = 0.0
+        self._leading = False
+
+        # Metrics
+        self.elections = 0
+        self.failed_renewals = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def start(self, on_elected: Callback, on_deposed: Callback) -> None:
+        """
+        Start the election.
+
+        :param on_elected: Called when this worker becomes the leader.
+        :param on_deposed: Called when this worker stops being the leader.
+        """
+        if self._task or self._leading:
+            return
+        self.holder = (f"{settings.HOST_NAME}:{os.getpid()}:"
+                       f"{uuid.uuid4().hex[:8]}")
+        self._on_elected, self._on_deposed = on_elected, on_deposed
+
+        if not self.enabled:
+            self._valid_until = float("inf")
+            await self._transition()
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Worker {self.holder} joined the leader election")
+
+    async def stop(self) -> None:
+        """ Stop the election and release the lease if held. """
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self._leading:
+            self._valid_until = 0.0
+            self._leading = False
+            try:
+                # Free the lease so another worker takes over right away
+                await LeaderLease.get_motor_collection().delete_one(
+                    {"_id": self.name, "holder": self.holder})
+            except PyMongoError as e:
+                logger.warning(f"Failed releasing leader lease: {e}")
+            logger.info(f"Worker {self.holder} released the leadership")
+
+    async def _acquire(self) -> bool:
+        """
+        Acquire (or renew) the lease in a single atomic update, matching
+        only a lease held by this worker or an expired one. Upserting when
+        another worker holds it fails on the duplicate lease name.
+
+        :return: True if this worker holds the lease.
+        """
+        now = utc_now()
+        try:
+            await LeaderLease.get_motor_collection().find_one_and_update(
+                {"_id": self.name,
+                 "$or": [{"holder": self.holder},
+                         {"expires_at": {"$lte": now}}]},
+                {"$set": {"holder": self.holder,
+                          "expires_at": now + timedelta(
+                              seconds=self.lease_seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            requested_at = time.monotonic()
+            try:
+                if await self._acquire():
+                    self._valid_until = requested_at + self.lease_seconds
+                else:
+                    self._valid_until = 0.0
+            except PyMongoError as e:
+                # Keep leading until the held lease could have expired
+                self.failed_renewals += 1
+                logger.warning(f"Leader lease renewal failed: {e}")
+
+            await self._transition()
+            await asyncio.sleep(self.renew_seconds)
+
+    async def _transition(self) -> None:
+        """ Call the callbacks when the leadership changed. """
+        is_leader = self.is_leader
+        if is_leader == self._leading:
+            return
+        self._leading = is_leader
+
+        if is_leader:
+            self.elections += 1
+            logger.info(f"Worker {self.holder} is the leader")
+            callback = self._on_elected
+        else:
+            logger.warning(f"Worker {self.holder} is no longer the leader")
+            callback = self._on_deposed
+        try:
+            await callback()
+        except Exception as e:
+            logger.exception(f"Leadership change callback failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "enabled": self.enabled,
+            "elections": self.elections,
+            "failed_renewals": self.failed_renewals,
+        }
+
+
+leader_election = LeaderElection(
+    name=settings.LEADER_LEASE_NAME,
+    lease_seconds=settings.LEADER_LEASE_SECONDS,
+    renew_seconds=settings.LEADER_RENEW_SECONDS,
+    enabled=settings.WORKERS > 1,
+)
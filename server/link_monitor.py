@@ -0,0 +1,306 @@
+""" NICs link state monitor module """
+import asyncio
+import socket
+import struct
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from uuid import uuid4
+
+import psutil
+from beanie import BulkWriter
+from beanie.operators import Set, SetOnInsert
+from loguru import logger
+
+from config import settings
+from models import NIC, NicLinkEvent
+from utils import utc_now
+
+# RTNETLINK (linux/rtnetlink.h, linux/if_link.h, linux/if.h)
+RTMGRP_LINK = 0x1
+RTM_NEWLINK, RTM_DELLINK = 16, 17
+NLMSG_HEADER = struct.Struct("=IHHII")
+IFINFO_MSG = struct.Struct("=BxHiII")
+RT_ATTR = struct.Struct("=HH")
+IFLA_IFNAME = 3
+IFF_UP, IFF_RUNNING = 0x1, 0x40
+RECEIVE_BUFFER_SIZE = 64 * 1024
+
+# (nic name, is up)
+LinkChange = Tuple[str, bool]
+
+
+def align(length: int) -> int:
+    """ :returns: The length padded to netlink's 4 bytes alignment. """
+    return (length + 3) & ~3
+
+
+def parse_link_messages(data: bytes) -> Iterator[LinkChange]:
+    """
+    :param data: A datagram of RTNETLINK messages.
+    :return: The link changes of the new/deleted link messages, a nic is
+    up when it's administratively up and running (has carrier).
+    """
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            return
+        end = offset + length
+        body = offset + NLMSG_HEADER.size
+        if message_type in (RTM_NEWLINK, RTM_DELLINK) and (
+                body + IFINFO_MSG.size <= end):
+            _, _, _, flags, _ = IFINFO_MSG.unpack_from(data, body)
+            name = None
+            attribute = body + IFINFO_MSG.size
+            while attribute + RT_ATTR.size <= end:
+                attribute_length, attribute_type = RT_ATTR.unpack_from(
+                    data, attribute)
+                if attribute_length < RT_ATTR.size:
+                    break
+                if attribute_type == IFLA_IFNAME:
+                    value = data[attribute + RT_ATTR.size:
+                                 attribute + attribute_length]
+                    name = value.split(b"\0", 1)[0].decode(errors="replace")
+                    break
+                attribute += align(attribute_length)
+            if name:
+                is_up = (message_type == RTM_NEWLINK and
+                         flags & (IFF_UP | IFF_RUNNING) ==
+                         IFF_UP | IFF_RUNNING)
+                yield name, bool(is_up)
+        offset += align(length)
+
+
+def link_states() -> Dict[str, bool]:
+    """ :returns: Mapping of this host's nic names to whether they're up. """
+    return {name: stats.isup for name, stats in
+            psutil.net_if_stats().items()}
+
+
+class NetlinkLinkSource:
+    """
+    RTNETLINK link notifications (Linux), the kernel pushes every link
+    change so it's seen right away instead of on the next poll.
+    """
+
+    def __init__(self, on_change: Callable[[LinkChange], None],
+                 on_overrun: Callable[[], None]):
+        self.on_change = on_change
+        self.on_overrun = on_overrun
+        self._socket: Optional[socket.socket] = None
+
+    def start(self) -> None:
+        """
+        :raises: OSError: if netlink is unavailable (not Linux or not
+        permitted, e.g. a sandboxed container).
+        """
+        if not hasattr(socket, "AF_NETLINK"):
+            raise OSError("Netlink sockets are only available on Linux")
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                             socket.NETLINK_ROUTE)
+        try:
+            sock.bind((0, RTMGRP_LINK))
+            sock.setblocking(False)
+            asyncio.get_running_loop().add_reader(sock.fileno(),
+                                                  self._on_readable)
+        except Exception:
+            sock.close()
+            raise
+        self._socket = sock
+
+    def stop(self) -> None:
+        if self._socket:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data = self._socket.recv(RECEIVE_BUFFER_SIZE)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                # ENOBUFS, the kernel dropped notifications we were too slow
+                # to read, the states are taken again instead
+                logger.warning(f"Netlink link notifications lost: {e}")
+                self.on_overrun()
+                return
+            for change in parse_link_messages(data):
+                self.on_change(change)
+
+
+class LinkMonitor:
+    """
+    Tracks the up/down state of this host's nics.
+
+    On start the NIC documents are reconciled with the current states in
+    bulk. Link changes come from netlink (or polling when it's unavailable)
+    and are applied in order by a single task, which records every state
+    change as a NicLinkEvent, updates the NIC document and creates the
+    documents of new nics once they're up. A failure applying a change is
+    logged and the monitor goes on.
+    """
+
+    def __init__(self, poll_interval: float, use_netlink: bool):
+        self.poll_interval = poll_interval
+        self.use_netlink = use_netlink
+        self.source: Optional[str] = None
+        # Nic name -> is up, as last applied
+        self._states: Dict[str, bool] = {}
+        self._changes: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._netlink: Optional[NetlinkLinkSource] = None
+
+        # Metrics
+        self.events = 0
+        self.failures = 0
+
+    async def start(self) -> None:
+        """ Take the current states and follow their changes. """
+        if self._tasks:
+            return
+        self._changes = asyncio.Queue()
+        await self.reconcile()
+
+        self.source = "polling"
+        if self.use_netlink:
+            netlink = NetlinkLinkSource(self._put, self._put_snapshot)
+            try:
+                netlink.start()
+                self._netlink, self.source = netlink, "netlink"
+            except OSError as e:
+                logger.warning(f"Netlink unavailable ({e}), polling nics "
+                               f"every {self.poll_interval} seconds")
+
+        # After subscribing, so no change between the two is missed
+        self._put_snapshot()
+        self._tasks.append(asyncio.create_task(self._apply_changes()))
+        if self.source == "polling":
+            self._tasks.append(asyncio.create_task(self._poll()))
+        logger.info(f"Link monitor started ({self.source})")
+
+    async def stop(self) -> None:
+        if self._netlink:
+            self._netlink.stop()
+            self._netlink = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._changes.qsize() if self._changes else 0
+
+    async def reconcile(self) -> None:
+        """
+        Sync this host's NIC documents with its nics, one query and one
+        bulk upsert of the nics which changed state or are new (and up),
+        removed nics are down. A link event is recorded per change.
+        """
+        documented = {nic.name: nic.is_up async for nic in NIC.find(
+            NIC.host == settings.HOST_NAME)}
+        states = link_states()
+        states.update({name: False
+                       for name in documented.keys() - states.keys()})
+        changes = {name: is_up for name, is_up in states.items()
+                   if documented.get(name, False) != is_up}
+
+        if changes:
+            timestamp = utc_now()
+            bulk_writer = BulkWriter()
+            for name, is_up in changes.items():
+                await NIC.find_one(
+                    NIC.name == name, NIC.host == settings.HOST_NAME,
+                ).update(
+                    Set({NIC.is_up: is_up, NIC.state_changed_at: timestamp}),
+                    SetOnInsert({NIC.id: uuid4(), NIC.name: name,
+                                 NIC.host: settings.HOST_NAME}),
+                    upsert=True, bulk_writer=bulk_writer,
+                )
+            await bulk_writer.commit()
+            await NicLinkEvent.insert_many([
+                NicLinkEvent(nic_name=name, is_up=is_up, timestamp=timestamp)
+                for name, is_up in changes.items()
+            ])
+            self.events += len(changes)
+            logger.info(f"Reconciled nics, {len(changes)} of "
+                        f"{len(states)} changed")
+        self._states = states
+
+    def states(self) -> Dict[str, bool]:
+        """ :returns: Mapping of nic name to whether it's up. """
+        return dict(self._states)
+
+    def _put(self, change: LinkChange) -> None:
+        self._changes.put_nowait((change, utc_now()))
+
+    def _put_snapshot(self) -> None:
+        """ Queue the current state of every nic (unchanged are skipped). """
+        try:
+            states = link_states()
+        except Exception as e:
+            logger.exception(f"Failed getting nics states: {e}")
+            return
+        for name in self._states.keys() - states.keys():
+            # Removed nic
+            self._put((name, False))
+        for change in states.items():
+            self._put(change)
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self._put_snapshot()
+
+    async def _apply_changes(self) -> None:
+        while True:
+            change, timestamp = await self._changes.get()
+            try:
+                await self._apply(change, timestamp)
+            except Exception as e:
+                self.failures += 1
+                logger.exception(f"Failed applying link change {change}: {e}")
+
+    async def _apply(self, change: LinkChange, timestamp: datetime) -> None:
+        name, is_up = change
+        if self._states.get(name) == is_up:
+            return
+
+        nic = await NIC.find_one(NIC.name == name,
+                                 NIC.host == settings.HOST_NAME)
+        if nic is None:
+            if is_up:
+                await NIC(name=name, is_up=True,
+                          state_changed_at=timestamp).create()
+                logger.info(f"Discovered nic {name}")
+        else:
+            nic.is_up = is_up
+            nic.state_changed_at = timestamp
+            await nic.save()
+
+        self._states[name] = is_up
+        if nic is None and not is_up:
+            return
+        await NicLinkEvent(nic_name=name, is_up=is_up,
+                           timestamp=timestamp).create()
+        self.events += 1
+        if is_up:
+            logger.info(f"NIC {name} is up")
+        else:
+            logger.warning(f"NIC {name} is down")
+
+    def stats(self) -> Dict:
+        return {
+            "source": self.source,
+            "nics": self.states(),
+            "events": self.events,
+            "failures": self.failures,
+        }
+
+
+link_monitor = LinkMonitor(
+    poll_interval=settings.INTERVAL_TASK_MONITOR_NICS,
+    use_netlink=settings.LINK_MONITOR_NETLINK,
+)
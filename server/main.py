@@ -6,36 +6,109 @@ import uvicorn
 from beanie import init_beanie
 from fastapi import FastAPI, APIRouter
 from loguru import logger
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
-from api import nics_router, bandwidth_router, settings_router
+from api import (
+    nics_router, bandwidth_router, settings_router, metrics_router,
+    stream_router, ingest_router, stats_router, health_router,
+)
 from config import settings
-from models import NIC, BandwidthSample
-from task import populate_nics, create_bandwidth_sample, keep_alive_nics
+from health import health
+from leader import leader_election
+from link_monitor import link_monitor
+from metrics import RouteLatencyMiddleware, db_listener
+from models import (
+    NIC, BandwidthRollup, BandwidthSample, LeaderLease, NicLinkEvent,
+    RateThresholds,
+)
+from render import snapshot_renderer
+from rollups import rollups, save_rollups
+from streaming import shared_events
+from task import (
+    become_leader, create_bandwidth_sample, flush_open_rollups, step_down,
+)
+from thresholds import thresholds_store
 from utils import config_logger
+from writer import sample_writer
 
 app = FastAPI()
 root_router = APIRouter()
 
 
-@root_router.on_event("startup")
-async def on_startup_actions() -> None:
-    """ Make on startup actions """
-    config_logger()
+async def init_database() -> AsyncIOMotorDatabase:
+    """
+    Connect to db and init the documents models.
 
+    :return: The db.
+    """
     client = AsyncIOMotorClient(
-        f"mongodb://{settings.DB_HOST}:{settings.DB_PORT}"
+        f"mongodb://{settings.DB_HOST}:{settings.DB_PORT}",
+        event_listeners=[db_listener], tz_aware=True,
     )
     await init_beanie(database=client.db_name,
-                      document_models=[NIC, BandwidthSample])
-    await NIC.delete_all()
-    await BandwidthSample.delete_all()
-
-    await asyncio.gather(
-        asyncio.create_task(populate_nics()),
-        asyncio.create_task(create_bandwidth_sample()),
-        asyncio.create_task(keep_alive_nics()),
-    )
+                      document_models=[NIC, BandwidthSample,
+                                       BandwidthRollup, LeaderLease,
+                                       NicLinkEvent, RateThresholds])
+    return client.db_name
+
+
+async def start_services() -> None:
+    """
+    Connect to db (retrying until it's up), then load the thresholds and
+    start the writer, the live events sharing (many workers), the leader
+    election (the leader reconciles the nics) and the sampling. Previous
+    runs data is kept.
+    """
+    while True:
+        try:
+            database = await init_database()
+            break
+        except Exception as e:
+            logger.warning(f"Database unavailable ({e}), retrying in "
+                           f"{settings.DB_RETRY_SECONDS} seconds")
+            await asyncio.sleep(settings.DB_RETRY_SECONDS)
+
+    await thresholds_store.start()
+    await sample_writer.start()
+    await shared_events.start(database)
+    await leader_election.start(on_elected=become_leader,
+                                on_deposed=step_down)
+    # Requests are served once everything they use is up
+    health.database_ready()
+
+    if settings.LOCAL_SAMPLING:
+        # Every worker ticks, only the leader's ticks sample
+        app.state.sampling_task = asyncio.create_task(
+            create_bandwidth_sample())
+        app.state.rollups_task = asyncio.create_task(flush_open_rollups())
+
+
+@root_router.on_event("startup")
+async def on_startup_actions() -> None:
+    """
+    Make on startup actions, the services start in the background so the
+    api is up right away (see /health/ready).
+    """
+    config_logger()
+    app.state.startup_task = asyncio.create_task(start_services())
+
+
+@root_router.on_event("shutdown")
+async def on_shutdown_actions() -> None:
+    """ Make on shutdown actions """
+    app.state.startup_task.cancel()
+    if getattr(app.state, "sampling_task", None):
+        app.state.sampling_task.cancel()
+        app.state.rollups_task.cancel()
+    await leader_election.stop()
+    await thresholds_store.stop()
+    await link_monitor.stop()
+    await sample_writer.stop()
+    await shared_events.stop()
+    snapshot_renderer.shutdown()
+
+    if health.is_ready:
+        await save_rollups(rollups.open_documents())
 
 
 @root_router.get("/", response_model=Dict)
@@ -44,15 +117,31 @@ async def root() -> Dict:
 
 
 # Routers configuration
+app.add_middleware(RouteLatencyMiddleware)
 app.include_router(root_router)
 app.include_router(nics_router)
 app.include_router(bandwidth_router)
 app.include_router(settings_router)
+app.include_router(metrics_router)
+app.include_router(stream_router)
+app.include_router(ingest_router)
+app.include_router(stats_router)
+app.include_router(health_router)
 
 
 async def main() -> None:
-    """ Main program function. """
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    """
+    Main program function, a single worker runs with reload (development),
+    many workers (WORKERS env var) is the production mode.
+    """
+    if settings.WORKERS == 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+        return
+
+    config_logger()
+    logger.info(f"Starting {settings.WORKERS} workers")
+    uvicorn.run("main:app", host="0.0.0.0", port=8000,
+                workers=settings.WORKERS)
 
 
 if __name__ == '__main__':
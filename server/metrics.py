@@ -0,0 +1,266 @@
+""" Prometheus metrics module """
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from leader import leader_election
+from link_monitor import link_monitor
+from streaming import broadcaster
+from writer import sample_writer
+
+# Starlette adds the charset
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+# Seconds, from sub-millisecond db calls up to seconds long queries
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names: Sequence[str], values: LabelValues) -> str:
+    """ :returns: The labels of a sample, e.g. {route="/nics/"} """
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="' + value.replace("\\", "\\\\").replace('"', '\\"')
+        .replace("\n", "\\n") + '"'
+        for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class HistogramSeries:
+    """ Observations count per bucket (the last is +Inf) and their sum """
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+
+
+class Histogram:
+    """
+    Prometheus histogram, a series per label values.
+
+    Observing is a bisect and two additions (under a lock, db latencies are
+    observed from motor's threads), the text format is only built when the
+    metrics are scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = HistogramSeries(
+                    len(self.buckets))
+            series.counts[index] += 1
+            series.sum += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = [(label_values, list(series.counts), series.sum)
+                        for label_values, series in self._series.items()]
+        bucket_labels = self.label_names + ("le",)
+        for label_values, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = format_labels(bucket_labels, label_values + (
+                    format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """ Prometheus gauge read when scraped, costs nothing in between """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str,
+                 read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self) -> Iterable[str]:
+        yield f"{self.name} {format_value(self.read())}"
+
+
+class Counter(Gauge):
+    """ Prometheus counter (a total only going up) read when scraped """
+    kind = "counter"
+
+
+class MetricsRegistry:
+    """ The metrics of this worker, rendered in Prometheus text format """
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def histogram(self, name: str, documentation: str,
+                  label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(histogram)
+        return histogram
+
+    def gauge(self, name: str, documentation: str,
+              read: Callable[[], float]) -> Gauge:
+        gauge = Gauge(name, documentation, read)
+        self._metrics.append(gauge)
+        return gauge
+
+    def counter(self, name: str, documentation: str,
+                read: Callable[[], float]) -> Counter:
+        counter = Counter(name, documentation, read)
+        self._metrics.append(counter)
+        return counter
+
+    def render(self) -> str:
+        """ :returns: All the metrics in Prometheus text format. """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class DatabaseCommandListener(monitoring.CommandListener):
+    """
+    Observes every db command's latency (as timed by pymongo) per command
+    and collection, so no query code has to be wrapped.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        # (connection, request id) -> collection of the running commands
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        # Commands name their collection, getMore names the cursor id
+        field = ("collection" if event.command_name == "getMore"
+                 else event.command_name)
+        collection = event.command.get(field)
+        if isinstance(collection, str):
+            self._collections[(event.connection_id,
+                               event.request_id)] = collection
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._observe(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._observe(event)
+
+    def _observe(self, event) -> None:
+        collection = self._collections.pop(
+            (event.connection_id, event.request_id), None)
+        if collection is not None:
+            self.histogram.observe(event.duration_micros / 10 ** 6,
+                                   event.command_name, collection)
+
+
+class RouteLatencyMiddleware:
+    """
+    ASGI middleware observing requests latency per route (the path
+    template, e.g. /bandwidth/{nic_name}) until the response starts, so
+    live streams are timed to their first byte.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def send_timed(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Set by the router once matched
+                route = scope.get("route")
+                request_latency.observe(
+                    time.perf_counter() - started, scope["method"],
+                    route.path if route else "unmatched",
+                    str(message["status"]))
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+
+registry = MetricsRegistry()
+
+sampler_tick_duration = registry.histogram(
+    "networkmonitor_sampler_tick_seconds",
+    "Sampling tick duration, from counters read to samples queued")
+sampler_tick_lag = registry.histogram(
+    "networkmonitor_sampler_lag_seconds",
+    "Sampling tick start delay behind its schedule")
+db_command_latency = registry.histogram(
+    "networkmonitor_db_command_seconds",
+    "Db commands latency per command (insert, find, aggregate, ...) and "
+    "collection", label_names=("command", "collection"))
+request_latency = registry.histogram(
+    "networkmonitor_request_seconds",
+    "Api requests latency until the response starts, per route",
+    label_names=("method", "route", "status"))
+
+db_listener = DatabaseCommandListener(db_command_latency)
+
+registry.gauge("networkmonitor_nics",
+               "This host's nics followed by the link monitor (leader)",
+               lambda: len(link_monitor.states()))
+registry.gauge("networkmonitor_nics_up", "This host's nics which are up",
+               lambda: sum(link_monitor.states().values()))
+registry.gauge("networkmonitor_leader", "Whether this worker is the leader",
+               lambda: int(leader_election.is_leader))
+registry.gauge("networkmonitor_writer_queue_depth",
+               "Samples queued to be written to db",
+               lambda: sample_writer.queue_depth)
+registry.gauge("networkmonitor_writer_queue_capacity",
+               "Samples the writer queues before producers wait",
+               lambda: sample_writer.max_queue_size)
+registry.gauge("networkmonitor_link_changes_queue_depth",
+               "Nics link changes waiting to be applied",
+               lambda: link_monitor.queue_depth)
+registry.gauge("networkmonitor_stream_subscribers",
+               "Live samples stream subscribers",
+               lambda: broadcaster.subscribers)
+registry.gauge("networkmonitor_stream_queued_events",
+               "Live sample events queued to all subscribers",
+               lambda: broadcaster.queued_events)
+registry.counter("networkmonitor_writer_flushed_samples_total",
+                 "Samples written to db",
+                 lambda: sample_writer.flushed_samples)
+registry.counter("networkmonitor_writer_dropped_samples_total",
+                 "Samples dropped after failed flushes",
+                 lambda: sample_writer.dropped_samples)
+registry.counter("networkmonitor_writer_unconfirmed_samples_total",
+                 "Samples not retried after a flush of unknown outcome",
+                 lambda: sample_writer.unconfirmed_samples)
@@ -1,41 +1,231 @@
 """ Models module """
+import math
 import time
 from datetime import datetime
+from typing import Dict, List, Optional
 from uuid import UUID, uuid4
 
-from beanie import Document
-from pydantic import Field
+from beanie import Document, Granularity, TimeSeriesConfig
+from pydantic import BaseModel, Field, validator
+from pymongo import ASCENDING, IndexModel
+
+from config import settings
+from utils import utc_now
 
 
 class NIC(Document):
     """ The NIC (Network Interface Card) db document model """
     id: UUID = Field(default_factory=uuid4)
     name: str = Field(default="default_nic")
+    # The host the nic is on (the server's host or an agent's)
+    host: str = Field(default=settings.HOST_NAME)
+    # Link state, tracked by the link monitor for the server's host nics
+    is_up: bool = Field(default=True)
+    state_changed_at: Optional[datetime] = None
 
     class Config:
         schema_extra = {
             "example": {
                 "id": uuid4(),
                 "name": "eth0",
+                "host": "localhost",
+                "is_up": True,
+                "state_changed_at": time.time(),
             }
         }
 
 
+class NicLinkEvent(Document):
+    """ A nic's link state change document model """
+    id: UUID = Field(default_factory=uuid4)
+    nic_name: str
+    host: str = Field(default=settings.HOST_NAME)
+    is_up: bool
+    timestamp: datetime = Field(default_factory=utc_now)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": uuid4(),
+                "nic_name": "eth0",
+                "host": "localhost",
+                "is_up": False,
+                "timestamp": time.time(),
+            }
+        }
+
+    class Settings:
+        indexes = [
+            IndexModel([("nic_name", ASCENDING), ("timestamp", ASCENDING)]),
+        ]
+
+
 class BandwidthSample(Document):
     """ The Bandwidth test document model """
     id: UUID = Field(default_factory=uuid4)
     nic_name: str
+    host: str = Field(default=settings.HOST_NAME)
     upload: float = Field(default=0.0)
     download: float = Field(default=0.0)
-    timestamp: datetime = Field(default_factory=datetime.now)
+    timestamp: datetime = Field(default_factory=utc_now)
 
     class Config:
         schema_extra = {
             "example": {
                 "id": uuid4(),
                 "nic_name": "eth0",
+                "host": "localhost",
                 "upload": 0.0,
                 "download": 0.0,
                 "timestamp": time.time(),
             }
         }
+
+    class Settings:
+        indexes = [
+            IndexModel([("nic_name", ASCENDING), ("timestamp", ASCENDING)]),
+        ]
+        if settings.BW_TIMESERIES:
+            name = settings.BW_TIMESERIES_COLLECTION
+            timeseries = TimeSeriesConfig(
+                time_field="timestamp",
+                meta_field="nic_name",
+                granularity=Granularity.seconds,
+                expire_after_seconds=settings.BW_TTL_SECONDS,
+            )
+        elif settings.BW_TTL_SECONDS:
+            indexes.append(IndexModel(
+                [("timestamp", ASCENDING)],
+                expireAfterSeconds=settings.BW_TTL_SECONDS,
+            ))
+
+
+class BandwidthRollup(Document):
+    """ The bandwidth samples aggregate of a time bucket document model """
+    id: UUID = Field(default_factory=uuid4)
+    nic_name: str
+    # Bucket width in seconds
+    resolution: int
+    # Bucket start
+    timestamp: datetime
+    # Stored as "count", Document.count is the query method
+    samples_count: int = Field(default=0, alias="count")
+    upload_sum: float = Field(default=0.0)
+    upload_min: float = Field(default=0.0)
+    upload_max: float = Field(default=0.0)
+    download_sum: float = Field(default=0.0)
+    download_min: float = Field(default=0.0)
+    download_max: float = Field(default=0.0)
+    # DDSketch of the bucket's rates (zero count, lowest bin index and the
+    # bins counts from it), see sketches.py
+    upload_sketch: Dict = Field(default_factory=dict)
+    download_sketch: Dict = Field(default_factory=dict)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": uuid4(),
+                "nic_name": "eth0",
+                "resolution": 60,
+                "timestamp": time.time(),
+                "count": 12,
+                "upload_sum": 1.2,
+                "upload_min": 0.0,
+                "upload_max": 0.5,
+                "download_sum": 3.6,
+                "download_min": 0.1,
+                "download_max": 1.1,
+                "upload_sketch": {"zero_count": 8, "offset": -115,
+                                  "counts": [2, 0, 1, 1]},
+                "download_sketch": {"zero_count": 0, "offset": -115,
+                                    "counts": [5, 4, 0, 3]},
+            }
+        }
+
+    class Settings:
+        indexes = [
+            IndexModel([("nic_name", ASCENDING), ("resolution", ASCENDING),
+                        ("timestamp", ASCENDING)]),
+        ]
+
+
+class LeaderLease(Document):
+    """ The lease document of the worker owning the sampling tasks """
+    # The lease name
+    id: str
+    # The holding worker ("<host>:<pid>:<token>")
+    holder: str
+    # UTC, the lease is free once expired
+    expires_at: datetime
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": "sampler",
+                "holder": "localhost:4242:1f2e3d4c",
+                "expires_at": time.time(),
+            }
+        }
+
+
+class RateThresholds(Document):
+    """ The nics rate thresholds document model, shared by all workers """
+    # The thresholds name
+    id: str
+    # Represents Mbps
+    dl_min: int
+    dl_max: int
+    ul_min: int
+    ul_max: int
+    updated_at: datetime = Field(default_factory=utc_now)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": "nic_rate",
+                "dl_min": 0,
+                "dl_max": 5,
+                "ul_min": 0,
+                "ul_max": 3,
+                "updated_at": time.time(),
+            }
+        }
+
+
+class AgentSample(BaseModel):
+    """ A bandwidth sample pushed by an agent """
+    nic_name: str
+    # Epoch seconds
+    timestamp: float
+    upload: float
+    download: float
+
+    @validator("timestamp")
+    def finite_timestamp(cls, value: float) -> float:
+        if not math.isfinite(value):
+            raise ValueError("timestamp must be finite")
+        return value
+
+    @validator("upload", "download")
+    def finite_rate(cls, value: float) -> float:
+        if not math.isfinite(value) or value < 0:
+            raise ValueError("rate must be finite and non negative")
+        return value
+
+
+class AgentBatch(BaseModel):
+    """ The samples batch an agent pushes to the ingest endpoint """
+    host: str
+    # The agent's nics which are up
+    nics: List[str] = Field(default_factory=list)
+    samples: List[AgentSample] = Field(default_factory=list)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "host": "web-1",
+                "nics": ["eth0"],
+                "samples": [{"nic_name": "eth0", "timestamp": time.time(),
+                             "upload": 0.1, "download": 0.3}],
+            }
+        }
@@ -0,0 +1,120 @@
+""" Server side bandwidth snapshots rendering module """
+import asyncio
+import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from config import settings
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def render_plot(nic_name: str, records: List[Dict],
+                image_format: str) -> bytes:
+    """
+    Render the upload and download line plot of nic records, with the
+    object oriented matplotlib api (no global pyplot state, thread safe).
+
+    :param nic_name: The nic name (plot title).
+    :param records: The nic samples (or rollups) json records, oldest first.
+    :param image_format: png or svg.
+    :return: The image content.
+    """
+    figure = Figure(figsize=(settings.SNAPSHOT_WIDTH_INCHES,
+                             settings.SNAPSHOT_HEIGHT_INCHES))
+    FigureCanvasAgg(figure)
+    axes = figure.subplots()
+    # Plotted in the server's local time
+    timestamps = [datetime.fromisoformat(record["timestamp"]).astimezone()
+                  .replace(tzinfo=None) for record in records]
+    axes.plot(timestamps, [record["upload"] for record in records],
+              label="upload")
+    axes.plot(timestamps, [record["download"] for record in records],
+              label="download")
+    axes.set_title(nic_name)
+    axes.set_ylabel("Mbps")
+    axes.legend()
+    figure.autofmt_xdate()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class SnapshotRenderer:
+    """
+    Renders snapshots in a thread pool (off the event loop), rendered
+    images are cached by nic, window, format and latest sample so repeat
+    requests within a sampling interval aren't rendered again.
+    """
+
+    def __init__(self, workers: int, cache_size: int):
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="render")
+        self._cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        # Renders in progress, concurrent identical requests share them
+        self._rendering: Dict[Tuple, asyncio.Future] = {}
+        self.hits = self.misses = 0
+
+    async def render(self, nic_name: str, window: Tuple,
+                     records: List[Dict], image_format: str) -> bytes:
+        """
+        :param nic_name: The nic name.
+        :param window: The window params (e.g. last minutes and max points).
+        :param records: The nic json records, oldest first (not empty).
+        :param image_format: png or svg.
+        :return: The image content.
+        """
+        latest = records[-1]
+        # Open rollup buckets keep their start, count tells them apart
+        key = (nic_name, window, image_format, latest["timestamp"],
+               latest.get("count"))
+
+        image = self._cache.get(key)
+        if image is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return image
+
+        future = self._rendering.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, render_plot, nic_name, records, image_format)
+            self._rendering[key] = future
+            try:
+                image = await asyncio.shield(future)
+            finally:
+                del self._rendering[key]
+            self._store(key, image)
+            return image
+        return await asyncio.shield(future)
+
+    def _store(self, key: Tuple, image: bytes) -> None:
+        self._cache[key] = image
+        # Older images of the same nic, window and format are stale
+        for cached_key in [cached_key for cached_key in self._cache
+                           if cached_key[:3] == key[:3]
+                           and cached_key != key]:
+            del self._cache[cached_key]
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {"cached": len(self._cache), "hits": self.hits,
+                "misses": self.misses}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+snapshot_renderer = SnapshotRenderer(
+    workers=settings.RENDER_WORKERS,
+    cache_size=settings.RENDER_CACHE_SIZE,
+)
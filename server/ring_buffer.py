@@ -0,0 +1,171 @@
+""" In-memory recent bandwidth samples module """
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from config import settings
+
+
+class Series(NamedTuple):
+    """ Bandwidth samples of a nic as parallel columns. """
+    timestamps: array
+    uploads: array
+    downloads: array
+
+    def to_records(self, nic_name: str) -> List[Dict]:
+        """
+        :param nic_name: The nic name the series belongs to.
+        :returns: The series as list of samples json records.
+        """
+        return [
+            {
+                "nic_name": nic_name,
+                "upload": upload,
+                "download": download,
+                "timestamp": datetime.fromtimestamp(
+                    timestamp, timezone.utc).isoformat(),
+            }
+            for timestamp, upload, download in zip(*self)
+        ]
+
+
+def empty_series() -> Series:
+    return Series(array("d"), array("d"), array("d"))
+
+
+class NicRingBuffer:
+    """
+    Fixed capacity ring of a nic's samples.
+
+    Timestamps (epoch seconds), upload and download are kept in parallel
+    arrays ordered by time, so a time window is found with a binary search.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.uploads = array("d", bytes(8 * capacity))
+        self.downloads = array("d", bytes(8 * capacity))
+        # Timestamp of the newest sample overwritten by a newer one
+        self.evicted_until = float("-inf")
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, upload: float, download: float) -> None:
+        if self._size < self.capacity:
+            index = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            index = self._start
+            self.evicted_until = self.timestamps[index]
+            self._start = (self._start + 1) % self.capacity
+
+        self.timestamps[index] = timestamp
+        self.uploads[index] = upload
+        self.downloads[index] = download
+
+    @property
+    def latest(self) -> Optional[float]:
+        """ :returns: Timestamp of the newest sample. """
+        if not self._size:
+            return None
+        return self.timestamps[(self._start + self._size - 1) % self.capacity]
+
+    def _bisect(self, timestamp: float) -> int:
+        """ :returns: Position (from oldest) of first sample newer than ts. """
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            index = (self._start + middle) % self.capacity
+            if self.timestamps[index] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, since: float) -> Series:
+        """
+        :param since: Epoch timestamp the window starts after.
+        :returns: The samples newer than since, oldest first.
+        """
+        first = self._bisect(since)
+        start = (self._start + first) % self.capacity
+        end = start + self._size - first
+
+        if end <= self.capacity:
+            return Series(self.timestamps[start:end],
+                          self.uploads[start:end],
+                          self.downloads[start:end])
+        end -= self.capacity
+        return Series(self.timestamps[start:] + self.timestamps[:end],
+                      self.uploads[start:] + self.uploads[:end],
+                      self.downloads[start:] + self.downloads[:end])
+
+
+class RingBufferStore:
+    """ Ring buffers of recent samples per nic, filled by the sampler. """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # Timestamp of the first sample appended by this process, samples
+        # newer than it are all in the buffers unless evicted
+        self.started_at: Optional[float] = None
+        self._buffers: Dict[str, NicRingBuffer] = {}
+
+    def append(self, nic_name: str, timestamp: float, upload: float,
+               download: float) -> None:
+        if self.started_at is None:
+            self.started_at = timestamp
+
+        buffer = self._buffers.get(nic_name)
+        if buffer is None:
+            buffer = self._buffers[nic_name] = NicRingBuffer(self.capacity)
+        buffer.append(timestamp, upload, download)
+
+    def latest(self, nic_name: str) -> Optional[float]:
+        """ :returns: Timestamp of the nic's newest sample. """
+        buffer = self._buffers.get(nic_name)
+        return buffer.latest if buffer else None
+
+    def invalidate(self, nic_name: str, until: float) -> None:
+        """
+        Mark the nic's windows reaching back to until as not in memory, for
+        late samples (older than the newest) which are only in db.
+        """
+        buffer = self._buffers.get(nic_name)
+        if buffer is None:
+            buffer = self._buffers[nic_name] = NicRingBuffer(self.capacity)
+        buffer.evicted_until = max(buffer.evicted_until, until)
+
+    def covers(self, nic_name: str, since: float) -> bool:
+        """
+        :param nic_name: The nic name.
+        :param since: Epoch timestamp the window starts after.
+        :returns: True if all samples of the window are in memory.
+        """
+        if self.started_at is None or since < self.started_at:
+            return False
+        buffer = self._buffers.get(nic_name)
+        # A nic never sampled by this process (e.g. sampled by another
+        # worker) has its samples only in db
+        return buffer is not None and buffer.evicted_until <= since
+
+    def window(self, nic_name: str, since: float) -> Series:
+        """
+        :param nic_name: The nic name.
+        :param since: Epoch timestamp the window starts after.
+        :returns: The nic's samples newer than since, oldest first.
+        """
+        buffer = self._buffers.get(nic_name)
+        return buffer.window(since) if buffer else empty_series()
+
+    def reset(self) -> None:
+        """ Drop all samples, windows go to db until sampling again. """
+        self.started_at = None
+        self._buffers.clear()
+
+
+recent_samples = RingBufferStore(capacity=settings.RING_BUFFER_CAPACITY)
@@ -0,0 +1,355 @@
+""" Multi-resolution bandwidth rollups module """
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from beanie import BulkWriter
+
+from config import settings
+from models import BandwidthRollup
+from ring_buffer import Series
+from sketches import DDSketch
+
+
+class RollupBucket:
+    """
+    Aggregates (min/max/sum/count and quantile sketches) of a nic's samples
+    in a time bucket. The bucket keeps its document id, so persisting it
+    again (an open bucket as it fills) replaces its document. Closed
+    buckets of tiers which don't keep sketches in memory have None ones.
+    """
+    __slots__ = ("id", "start", "count", "upload_sum", "upload_min",
+                 "upload_max", "download_sum", "download_min", "download_max",
+                 "upload_sketch", "download_sketch")
+
+    def __init__(self, start: float):
+        self.id = uuid4()
+        self.start = start
+        self.count = 0
+        self.upload_sum = self.download_sum = 0.0
+        self.upload_min = self.download_min = float("inf")
+        self.upload_max = self.download_max = float("-inf")
+        self.upload_sketch = DDSketch()
+        self.download_sketch = DDSketch()
+
+    def add(self, upload: float, download: float) -> None:
+        self.count += 1
+        if self.upload_sketch is not None:
+            self.upload_sketch.add(upload)
+            self.download_sketch.add(download)
+        self.upload_sum += upload
+        self.download_sum += download
+        if upload < self.upload_min:
+            self.upload_min = upload
+        if upload > self.upload_max:
+            self.upload_max = upload
+        if download < self.download_min:
+            self.download_min = download
+        if download > self.download_max:
+            self.download_max = download
+
+    def merge(self, other: "RollupBucket") -> None:
+        """ Fold another bucket's aggregates into this one. """
+        self.count += other.count
+        self.upload_sum += other.upload_sum
+        self.download_sum += other.download_sum
+        self.upload_min = min(self.upload_min, other.upload_min)
+        self.upload_max = max(self.upload_max, other.upload_max)
+        self.download_min = min(self.download_min, other.download_min)
+        self.download_max = max(self.download_max, other.download_max)
+        if self.upload_sketch is None or other.upload_sketch is None:
+            # Sketches of part of the samples would be wrong
+            self.upload_sketch = self.download_sketch = None
+        else:
+            self.upload_sketch.merge(other.upload_sketch)
+            self.download_sketch.merge(other.download_sketch)
+
+    def to_record(self, nic_name: str, resolution: int) -> Dict:
+        """ :returns: The bucket as json record, upload/download are avg. """
+        return {
+            "nic_name": nic_name,
+            "resolution": resolution,
+            "timestamp": datetime.fromtimestamp(
+                self.start, timezone.utc).isoformat(),
+            "count": self.count,
+            "upload": self.upload_sum / self.count,
+            "upload_min": self.upload_min,
+            "upload_max": self.upload_max,
+            "upload_sum": self.upload_sum,
+            "download": self.download_sum / self.count,
+            "download_min": self.download_min,
+            "download_max": self.download_max,
+            "download_sum": self.download_sum,
+        }
+
+    def to_document(self, nic_name: str,
+                    resolution: int) -> BandwidthRollup:
+        return BandwidthRollup(
+            id=self.id,
+            nic_name=nic_name,
+            resolution=resolution,
+            timestamp=datetime.fromtimestamp(self.start, timezone.utc),
+            count=self.count,
+            upload_sum=self.upload_sum,
+            upload_min=self.upload_min,
+            upload_max=self.upload_max,
+            download_sum=self.download_sum,
+            download_min=self.download_min,
+            download_max=self.download_max,
+            upload_sketch=(self.upload_sketch.to_document()
+                           if self.upload_sketch else {}),
+            download_sketch=(self.download_sketch.to_document()
+                             if self.download_sketch else {}),
+        )
+
+    @classmethod
+    def from_document(cls, document: BandwidthRollup) -> "RollupBucket":
+        bucket = cls(document.timestamp.timestamp())
+        bucket.id = document.id
+        bucket.count = document.samples_count
+        bucket.upload_sum = document.upload_sum
+        bucket.upload_min = document.upload_min
+        bucket.upload_max = document.upload_max
+        bucket.download_sum = document.download_sum
+        bucket.download_min = document.download_min
+        bucket.download_max = document.download_max
+        if document.upload_sketch:
+            bucket.upload_sketch = DDSketch.from_document(
+                document.upload_sketch)
+            bucket.download_sketch = DDSketch.from_document(
+                document.download_sketch)
+        else:
+            bucket.upload_sketch = bucket.download_sketch = None
+        return bucket
+
+
+async def save_rollups(documents: List[BandwidthRollup]) -> None:
+    """ Upsert rollup documents by id in one bulk write. """
+    if not documents:
+        return
+    async with BulkWriter() as bulk_writer:
+        for document in documents:
+            await BandwidthRollup.find_one(
+                BandwidthRollup.id == document.id, upsert=True,
+            ).replace_one(document, bulk_writer=bulk_writer)
+
+
+def buckets_series(buckets: List[RollupBucket]) -> Series:
+    """ :returns: The buckets start and upload/download averages series. """
+    return Series(
+        array("d", [bucket.start for bucket in buckets]),
+        array("d", [bucket.upload_sum / bucket.count for bucket in buckets]),
+        array("d", [bucket.download_sum / bucket.count
+                    for bucket in buckets]),
+    )
+
+
+class RollupTier:
+    """
+    Rollup buckets of a single resolution per nic, newest last. Without
+    keep sketches closed buckets drop their quantile sketches (persisted
+    with their documents), which take most of their memory.
+    """
+
+    def __init__(self, resolution: int, retention: int,
+                 keep_sketches: bool):
+        self.resolution = resolution
+        self.retention = retention
+        self.keep_sketches = keep_sketches
+        # Timestamp of the first sample added by this process
+        self.started_at: Optional[float] = None
+        self._buckets: Dict[str, Deque[RollupBucket]] = {}
+        self._evicted_until: Dict[str, float] = {}
+
+    def add(self, nic_name: str, timestamp: float, upload: float,
+            download: float) -> Optional[RollupBucket]:
+        """
+        Add sample to its bucket.
+
+        :returns: The nic's previous bucket if the sample closed it, for a
+        late sample (of an already closed bucket) a bucket of just it.
+        """
+        if self.started_at is None:
+            self.started_at = timestamp
+
+        start = timestamp - timestamp % self.resolution
+        buckets = self._buckets.get(nic_name)
+        if buckets is None:
+            buckets = self._buckets[nic_name] = deque()
+
+        if buckets and start < buckets[-1].start:
+            return self._add_late(nic_name, start, upload, download)
+
+        closed = None
+        if not buckets or buckets[-1].start != start:
+            closed = buckets[-1] if buckets else None
+            if len(buckets) == self.retention:
+                self._evicted_until[nic_name] = buckets.popleft().start
+            buckets.append(RollupBucket(start))
+
+        buckets[-1].add(upload, download)
+        return closed
+
+    def _add_late(self, nic_name: str, start: float, upload: float,
+                  download: float) -> RollupBucket:
+        """
+        Add late sample to its closed bucket (if still in memory).
+
+        :returns: Bucket of just the sample, persisted next to the closed
+        bucket's document, both are merged on read.
+        """
+        for bucket in reversed(self._buckets[nic_name]):
+            if bucket.start == start:
+                bucket.add(upload, download)
+                break
+            if bucket.start < start:
+                # Never had samples in memory, windows over it go to db
+                self._evicted_until[nic_name] = max(
+                    self._evicted_until.get(nic_name, float("-inf")), start)
+                break
+        else:
+            self._evicted_until[nic_name] = max(
+                self._evicted_until.get(nic_name, float("-inf")), start)
+
+        late = RollupBucket(start)
+        late.add(upload, download)
+        return late
+
+    def drop_sketches(self, bucket: RollupBucket) -> None:
+        """ Drop a closed (and persisted) bucket's sketches if not kept. """
+        if not self.keep_sketches:
+            bucket.upload_sketch = bucket.download_sketch = None
+
+    def current(self, nic_name: str) -> Optional[RollupBucket]:
+        """ :returns: The nic's open (newest) bucket. """
+        buckets = self._buckets.get(nic_name)
+        return buckets[-1] if buckets else None
+
+    def open_buckets(self) -> Dict[str, RollupBucket]:
+        """ :returns: The open bucket of every nic. """
+        return {nic_name: buckets[-1]
+                for nic_name, buckets in self._buckets.items() if buckets}
+
+    def covers(self, nic_name: str, since: float) -> bool:
+        """
+        :returns: True if all buckets overlapping the window are in memory.
+        """
+        if (self.started_at is None or since < self.started_at or
+                nic_name not in self._buckets):
+            return False
+        evicted_until = self._evicted_until.get(nic_name, float("-inf"))
+        return evicted_until <= since - self.resolution
+
+    def window(self, nic_name: str, since: float) -> List[RollupBucket]:
+        """ :returns: The nic buckets overlapping the window, oldest first. """
+        buckets = self._buckets.get(nic_name, ())
+        result = []
+        for bucket in reversed(buckets):
+            if bucket.start <= since - self.resolution:
+                break
+            result.append(bucket)
+        result.reverse()
+        return result
+
+    def reset(self) -> None:
+        """ Drop all buckets, windows go to db until sampling again. """
+        self.started_at = None
+        self._buckets.clear()
+        self._evicted_until.clear()
+
+
+class RollupStore:
+    """ Rollup tiers updated incrementally as samples arrive. """
+
+    def __init__(self, tiers: List[RollupTier]):
+        self.tiers = {tier.resolution: tier for tier in tiers}
+
+    def add(self, nic_name: str, timestamp: float, upload: float,
+            download: float) -> List[BandwidthRollup]:
+        """
+        Add sample to every tier.
+
+        :returns: Documents of buckets the sample closed, to be persisted.
+        """
+        closed_documents = []
+        for resolution, tier in self.tiers.items():
+            closed = tier.add(nic_name, timestamp, upload, download)
+            if closed:
+                closed_documents.append(closed.to_document(nic_name,
+                                                           resolution))
+                tier.drop_sketches(closed)
+        return closed_documents
+
+    def open_documents(self) -> List[BandwidthRollup]:
+        """
+        :returns: Documents of all open buckets, persisted periodically
+        (for the other workers) and on shutdown.
+        """
+        return [bucket.to_document(nic_name, resolution)
+                for resolution, tier in self.tiers.items()
+                for nic_name, bucket in tier.open_buckets().items()]
+
+    def batch_documents(
+            self, samples: Iterable[Tuple[str, float, float, float]],
+    ) -> List[BandwidthRollup]:
+        """
+        Aggregate a samples batch without keeping buckets in memory, for
+        workers that share the ingest (the documents are partial buckets,
+        merged with the other documents of their bucket on read).
+
+        :param samples: The (nic name, timestamp, upload, download) samples.
+        :return: Documents of the batch's buckets in every tier.
+        """
+        buckets: Dict[Tuple[str, int, float], RollupBucket] = {}
+        for nic_name, timestamp, upload, download in samples:
+            for resolution in self.tiers:
+                start = timestamp - timestamp % resolution
+                bucket = buckets.get((nic_name, resolution, start))
+                if bucket is None:
+                    bucket = buckets[nic_name, resolution, start] = \
+                        RollupBucket(start)
+                bucket.add(upload, download)
+        return [bucket.to_document(nic_name, resolution)
+                for (nic_name, resolution, _), bucket in buckets.items()]
+
+    def reset(self) -> None:
+        for tier in self.tiers.values():
+            tier.reset()
+
+    def stats_resolution(self, window_seconds: float,
+                         max_buckets: int) -> int:
+        """ :returns: The finest tier with at most max_buckets in window. """
+        for resolution in sorted(self.tiers):
+            if window_seconds / resolution <= max_buckets:
+                return resolution
+        return max(self.tiers)
+
+    def select_resolution(self, window_seconds: float,
+                          max_points: int) -> Optional[int]:
+        """
+        Pick the finest tier which returns at most max_points for the window.
+
+        :param window_seconds: The queried window length.
+        :param max_points: The maximum number of points wanted.
+        :return: The tier resolution, None when raw samples fit.
+        """
+        # Adaptive sampling may sample as often as its min interval
+        sample_interval = (settings.ADAPTIVE_MIN_INTERVAL
+                           if settings.ADAPTIVE_SAMPLING
+                           else settings.INTERVAL_TASK_BW_SAMPLE)
+        if window_seconds / sample_interval <= max_points:
+            return None
+        for resolution in sorted(self.tiers):
+            if window_seconds / resolution <= max_points:
+                return resolution
+        return max(self.tiers)
+
+
+rollups = RollupStore(tiers=[
+    RollupTier(resolution=60, retention=settings.ROLLUP_MINUTE_RETENTION,
+               keep_sketches=False),
+    RollupTier(resolution=3600, retention=settings.ROLLUP_HOUR_RETENTION,
+               keep_sketches=True),
+])
@@ -0,0 +1,112 @@
+""" NICs bandwidth sampler module """
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import settings
+from counters import Counters, counters_source
+
+BYTES_IN_MB = 1024 * 1024
+
+# Nic name -> (upload, download) rates in Mbps
+Rates = Dict[str, Tuple[float, float]]
+
+
+class NicSampler:
+    """
+    Sampler engine for all NICs rates.
+
+    Every tick reads the counters of all NICs in a single snapshot and calc
+    the rates against the previous tick's snapshot, so all NICs are measured
+    over the same window and no sleep between reads is needed.
+    """
+
+    def __init__(self):
+        self.counters = counters_source()
+        self._last_time: Optional[float] = None
+        self._last_counters: Counters = {}
+
+    def reset(self) -> None:
+        """ Forget the previous snapshot (e.g. after not sampling a while). """
+        self._last_time, self._last_counters = None, {}
+
+    def sample(self, nic_names: Iterable[str]) -> Rates:
+        """
+        Take a counters snapshot and calc the rates since the previous one.
+
+        :param nic_names: The names of the nics to calc rates for.
+        :return: Mapping of nic name to (upload, download) rates in Mbps,
+        empty on the first tick because there is no previous snapshot yet.
+        """
+        now = time.monotonic()
+        counters = self.counters.read()
+        last_time, last_counters = self._last_time, self._last_counters
+        self._last_time, self._last_counters = now, counters
+
+        if last_time is None or now <= last_time:
+            return {}
+
+        elapsed = now - last_time
+        rates = {}
+        for name in nic_names:
+            current, last = counters.get(name), last_counters.get(name)
+            if current is None or last is None:
+                # Nic appeared (or vanished) between ticks, next tick has it
+                continue
+            net_sent = (current[0] - last[0]) / elapsed
+            net_recv = (current[1] - last[1]) / elapsed
+            rates[name] = (
+                round(net_sent / BYTES_IN_MB, 3),
+                round(net_recv / BYTES_IN_MB, 3),
+            )
+        return rates
+
+
+class AdaptiveInterval:
+    """
+    Sampling interval adapted to the last tick's rates.
+
+    While a nic is busy or its rates are near the max thresholds the
+    interval drops to the minimum, so short bursts are seen. Once all nics
+    are calm it doubles every tick back up to the maximum.
+    Disabled it always gives the maximum.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float,
+                 busy_rate: float, near_threshold_ratio: float,
+                 enabled: bool):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.busy_rate = busy_rate
+        self.near_threshold_ratio = near_threshold_ratio
+        self.enabled = enabled
+        self.interval = max_interval
+
+    def is_hot(self, upload: float, download: float) -> bool:
+        ratio = self.near_threshold_ratio
+        return (max(upload, download) >= self.busy_rate or
+                upload >= ratio * settings.UL_MAX_NIC_RATE_THRESHOLD or
+                download >= ratio * settings.DL_MAX_NIC_RATE_THRESHOLD)
+
+    def next(self, rates: Rates) -> float:
+        """
+        :param rates: The last tick's rates.
+        :return: Seconds until the next tick.
+        """
+        if not self.enabled:
+            return self.max_interval
+        if any(self.is_hot(*rate) for rate in rates.values()):
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
+
+
+def adaptive_interval() -> AdaptiveInterval:
+    """ :returns: Adaptive interval of the sampling settings. """
+    return AdaptiveInterval(
+        min_interval=settings.ADAPTIVE_MIN_INTERVAL,
+        max_interval=settings.INTERVAL_TASK_BW_SAMPLE,
+        busy_rate=settings.ADAPTIVE_BUSY_RATE,
+        near_threshold_ratio=settings.ADAPTIVE_NEAR_THRESHOLD_RATIO,
+        enabled=settings.ADAPTIVE_SAMPLING,
+    )
@@ -0,0 +1,127 @@
+""" Mergeable quantile sketches module """
+import math
+from array import array
+from typing import Dict, Optional
+
+from config import settings
+
+
+def zero_counts(size: int) -> array:
+    """ :returns: Bins counts array of that many zeros. """
+    return array("I", [0]) * size
+
+
+class DDSketch:
+    """
+    DDSketch (Masson et al. 2019) of non negative rates.
+
+    Values are counted in logarithmic bins, bin i holds the values in
+    (gamma^(i-1), gamma^i], so any quantile is estimated within the
+    relative accuracy. Sketches of the same accuracy merge by adding their
+    bins, memory grows with the log of the values range only.
+    Values below min_value (e.g. idle nics) are counted as zero.
+
+    The bins are a dense array of counts from the lowest bin index, at
+    most max_bins long: beyond it the lowest bins are collapsed into one
+    (only the lowest quantiles lose accuracy).
+    """
+    __slots__ = ("gamma", "log_gamma", "min_value", "max_bins", "offset",
+                 "counts", "zero_count", "count")
+
+    def __init__(self, relative_accuracy: float = None,
+                 min_value: float = None, max_bins: int = None):
+        relative_accuracy = (relative_accuracy or
+                             settings.SKETCH_RELATIVE_ACCURACY)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = (settings.SKETCH_MIN_VALUE if min_value is None
+                          else min_value)
+        self.max_bins = max_bins or settings.SKETCH_MAX_BINS
+        # Index of the first bin in counts
+        self.offset = 0
+        self.counts = array("I")
+        self.zero_count = 0
+        self.count = 0
+
+    def _extend(self, low: int, high: int) -> None:
+        """ Grow the bins to hold indexes low to high (inclusive). """
+        if not self.counts:
+            self.offset = low
+            self.counts = zero_counts(high - low + 1)
+            return
+        if low < self.offset:
+            self.counts = zero_counts(self.offset - low) + self.counts
+            self.offset = low
+        end = self.offset + len(self.counts)
+        if high >= end:
+            self.counts.extend(zero_counts(high - end + 1))
+
+    def _collapse(self) -> None:
+        """ Fold the lowest bins into one, down to max_bins bins. """
+        excess = len(self.counts) - self.max_bins
+        if excess <= 0:
+            return
+        self.counts[excess] += sum(self.counts[:excess])
+        del self.counts[:excess]
+        self.offset += excess
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value < self.min_value:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        position = index - self.offset
+        if not 0 <= position < len(self.counts):
+            self._extend(index, index)
+            self._collapse()
+            position = max(index - self.offset, 0)
+        self.counts[position] += 1
+
+    def merge(self, other: "DDSketch") -> None:
+        """ Fold another sketch (of the same accuracy) into this one. """
+        if other.gamma != self.gamma:
+            raise ValueError("Can't merge sketches of different accuracy")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        if not other.counts:
+            return
+        self._extend(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        for position, count in enumerate(other.counts, start):
+            self.counts[position] += count
+        self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        :param q: The quantile, between 0 and 1.
+        :return: The estimated value, None for an empty sketch.
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank or not self.counts:
+            return 0.0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                break
+        return 2 * self.gamma ** (self.offset + position) / (self.gamma + 1)
+
+    def to_document(self) -> Dict:
+        """ :returns: The sketch as dense bins from the lowest index. """
+        return {"zero_count": self.zero_count, "offset": self.offset,
+                "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_document(cls, document: Optional[Dict]) -> "DDSketch":
+        sketch = cls()
+        if not document:
+            return sketch
+        sketch.zero_count = document["zero_count"]
+        sketch.offset = document["offset"]
+        sketch.counts = array("I", document["counts"])
+        sketch.count = sketch.zero_count + sum(sketch.counts)
+        sketch._collapse()
+        return sketch
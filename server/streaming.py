@@ -0,0 +1,196 @@
+""" Live samples streaming module """
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import CursorType, DESCENDING
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from config import settings
+
+
+class Subscription:
+    """ A subscriber's bounded queue of live events, optionally by nics. """
+
+    def __init__(self, nic_names: Optional[Set[str]], max_queue_size: int):
+        self.nic_names = nic_names
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+
+    def offer(self, event: Dict) -> None:
+        """
+        Queue event if subscribed to its nic, a slow subscriber loses its
+        oldest events instead of slowing down the sampler.
+
+        :param event: The event to queue.
+        """
+        if self.nic_names and event["nic_name"] not in self.nic_names:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class SampleBroadcaster:
+    """ Fan out of live sample events to all subscribers. """
+
+    def __init__(self, max_queue_size: int):
+        self.max_queue_size = max_queue_size
+        self._subscriptions: Set[Subscription] = set()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscriptions)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    @property
+    def queued_events(self) -> int:
+        return sum(subscription.queue.qsize()
+                   for subscription in self._subscriptions)
+
+    def subscribe(self, nic_names: Optional[Set[str]] = None) -> Subscription:
+        """
+        :param nic_names: The nics to subscribe to, all nics when empty.
+        :returns: The new subscription.
+        """
+        subscription = Subscription(nic_names, self.max_queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def publish(self, event: Dict) -> None:
+        """ :param event: The event to send to all relevant subscribers. """
+        for subscription in self._subscriptions:
+            subscription.offer(event)
+
+
+class SharedEvents:
+    """
+    Live events shared by all worker processes through a capped db
+    collection. A stream is served by any worker while samples are ingested
+    by the leader (local samples) or by any worker (agents), so workers
+    publish their events to the collection and every worker tails it into
+    its own subscribers.
+    """
+
+    def __init__(self, broadcaster: SampleBroadcaster, collection_name: str,
+                 size: int, retry_seconds: float, enabled: bool):
+        self.broadcaster = broadcaster
+        self.collection_name = collection_name
+        self.size = size
+        self.retry_seconds = retry_seconds
+        self.enabled = enabled
+        self._collection: Optional[AsyncIOMotorCollection] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.published = 0
+        self.received = 0
+        self.failures = 0
+
+    async def start(self, database: AsyncIOMotorDatabase) -> None:
+        """ Create the capped collection if missing and start tailing it. """
+        if not self.enabled or self._task:
+            return
+        if self.collection_name not in await database.list_collection_names():
+            try:
+                await database.create_collection(
+                    self.collection_name, capped=True, size=self.size)
+            except CollectionInvalid:
+                # Created by another worker meanwhile
+                pass
+        self._collection = database[self.collection_name]
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def publish(self, events: List[Dict]) -> None:
+        """
+        :param events: The events to send to the subscribers of all workers,
+        a failure loses them (like a slow subscriber) but not the samples.
+        """
+        if self._collection is None:
+            return
+        try:
+            await self._collection.insert_many(events, ordered=False)
+            self.published += len(events)
+        except PyMongoError as e:
+            self.failures += 1
+            logger.warning(f"Failed publishing {len(events)} live events: "
+                           f"{e}")
+
+    async def _tail(self) -> None:
+        """
+        Follow the collection in natural (insertion) order with a tailable
+        cursor. ObjectIds of different workers aren't ordered by insertion,
+        so a new cursor is positioned by skipping the events up to the last
+        one seen instead of filtering on _id.
+        """
+        # Only events published from now on, None follows them all
+        last_id = None
+        positioned = False
+        while True:
+            try:
+                if not positioned:
+                    newest = await self._collection.find_one(
+                        sort=[("$natural", DESCENDING)])
+                    last_id = newest["_id"] if newest else None
+                    positioned = True
+                elif last_id is not None and not await \
+                        self._collection.find_one({"_id": last_id}):
+                    # Rolled out of the capped collection, the events left
+                    # are all newer (the ones between them were lost)
+                    logger.warning("Live events were dropped before being "
+                                   "read, resuming from the oldest one")
+                    last_id = None
+                skipping = last_id is not None
+                cursor = self._collection.find(
+                    cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        event_id = event.pop("_id")
+                        if skipping:
+                            skipping = event_id != last_id
+                            continue
+                        last_id = event_id
+                        self.received += 1
+                        self.broadcaster.publish(event)
+            except PyMongoError as e:
+                self.failures += 1
+                logger.warning(f"Tailing live events failed: {e}")
+            # The cursor dies right away on an empty collection
+            await asyncio.sleep(self.retry_seconds)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "subscribers": self.broadcaster.subscribers,
+            "published": self.published,
+            "received": self.received,
+            "failures": self.failures,
+        }
+
+
+broadcaster = SampleBroadcaster(max_queue_size=settings.STREAM_QUEUE_SIZE)
+shared_events = SharedEvents(
+    broadcaster=broadcaster,
+    collection_name=settings.STREAM_COLLECTION,
+    size=settings.STREAM_COLLECTION_SIZE,
+    retry_seconds=settings.STREAM_RETRY_SECONDS,
+    enabled=settings.WORKERS > 1,
+)
@@ -1,75 +1,95 @@
 """ Asynchronous tasks module """
 import asyncio
 import time
-from typing import cast, Dict, Tuple
 
-import loguru
-import psutil
-from fastapi_utils.tasks import repeat_every
 from loguru import logger
 
 from config import settings
-from exceptions import NicDownException
-from models import NIC, BandwidthSample
+from health import health
+from ingest import IngestedSample, ingest_pipeline
+from leader import leader_election
+from link_monitor import link_monitor
+from metrics import sampler_tick_duration, sampler_tick_lag
+from ring_buffer import recent_samples
+from rollups import rollups, save_rollups
+from sampler import NicSampler, Rates, adaptive_interval
+from thresholds import threshold_engine
 
+sampler = NicSampler()
+sampling_interval = adaptive_interval()
 
-async def populate_nics() -> None:
-    """ Populate NICs to db. """
-    relevant_interfaces = [k for k, v in psutil.net_if_stats().items() if
-                           v.isup]
-    interfaces = dict(
-        (k, v) for k, v in
-        dict(psutil.net_io_counters(pernic=True, nowrap=True)).items()
-        if k in relevant_interfaces
-    )
-    for inf in interfaces.keys():
-        result = await NIC.find_one(NIC.name == inf)
-        if not result:
-            result = await NIC(name=inf).create()
-            logger.debug(f"Populated {result.id} NIC id doc")
-        else:
-            logger.debug(f"{result.id} already populated")
-    logger.debug(f"Populated all NICs")
 
+async def sample_bandwidth() -> Rates:
+    """ Create bandwidth sample per up NIC from one counters snapshot. """
+    nic_names = [nic_name for nic_name, is_up in
+                 link_monitor.states().items() if is_up]
+    timestamp = time.time()
+    rates = sampler.sample(nic_names)
 
-@repeat_every(seconds=settings.INTERVAL_TASK_BW_SAMPLE, logger=loguru.logger)
-async def create_bandwidth_sample() -> None:
-    """ Redis task creates bandwidth sample per NIC. """
+    await ingest_pipeline.ingest(
+        IngestedSample(nic_name, settings.HOST_NAME, timestamp, net_sent,
+                       net_recv)
+        for nic_name, (net_sent, net_recv) in rates.items()
+    )
+    return rates
 
-    def get_net_info(interface: str) -> Tuple[float, int, int]:
-        """ :returns: The network info of specific interface. """
-        inf = cast(Dict, psutil.net_io_counters(pernic=True,
-                                                nowrap=True))
-        return (
-            time.time(), inf[interface].bytes_sent, inf[interface].bytes_recv,
-        )
 
-    async for nic in NIC.find_all():
-        t1, bytes_sent_1, bytes_recv_1 = get_net_info(interface=nic.name)
-        await asyncio.sleep(settings.NETWORK_SLEEP_TIME)
-        t2, bytes_sent_2, bytes_recv_2 = get_net_info(interface=nic.name)
+async def create_bandwidth_sample() -> None:
+    """
+    Task samples bandwidth every INTERVAL_TASK_BW_SAMPLE seconds, or
+    adaptively (ADAPTIVE_SAMPLING) down to sub-second intervals.
+    """
+    loop = asyncio.get_running_loop()
+    scheduled = loop.time()
+    while True:
+        started = loop.time()
+        sampler_tick_lag.observe(started - scheduled)
+        interval = sampling_interval.max_interval
+        if leader_election.is_leader:
+            try:
+                rates = await sample_bandwidth()
+                if rates:
+                    health.sampled()
+                interval = sampling_interval.next(rates)
+            except Exception as e:
+                logger.exception(f"Bandwidth sampling failed: {e}")
+            sampler_tick_duration.observe(loop.time() - started)
+        scheduled = started + interval
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
 
-        net_sent = (bytes_sent_2 - bytes_sent_1) / (t2 - t1)
-        net_recv = (bytes_recv_2 - bytes_recv_1) / (t2 - t1)
 
-        net_sent = round(net_sent / 1024 / 1024, 3)
-        net_recv = round(net_recv / 1024 / 1024, 3)
+async def flush_open_rollups() -> None:
+    """
+    Task persists the leader's open rollup buckets every
+    ROLLUP_FLUSH_SECONDS, so the other workers windows (served from db)
+    include the last bucket and a crash loses at most that interval.
+    """
+    while True:
+        await asyncio.sleep(settings.ROLLUP_FLUSH_SECONDS)
+        if not leader_election.is_leader:
+            continue
+        try:
+            await save_rollups(rollups.open_documents())
+        except Exception as e:
+            logger.exception(f"Open rollups flush failed: {e}")
 
-        logger.debug(f"Upload sample for nic: {nic.name} is {net_sent}Mbps")
-        logger.debug(f"Download sample for nic: {nic.name} is {net_recv}Mbps")
 
-        await BandwidthSample(
-            nic_name=nic.name, upload=net_sent, download=net_recv).insert()
+async def become_leader() -> None:
+    """ Take over the sampling and link monitoring of this host. """
+    if settings.LOCAL_SAMPLING:
+        await link_monitor.start()
 
 
-@repeat_every(seconds=settings.INTERVAL_TASK_MONITOR_NICS,
-              logger=loguru.logger)
-async def keep_alive_nics() -> None:
-    """ Task for checking that all nics are up. """
-    current_live_nics = [k for k, v in psutil.net_if_stats().items() if v.isup]
-    async for nic in NIC.find_all():
-        if nic.name not in current_live_nics:
-            logger.warning(f"Detected exception for nic: {nic}")
-            raise NicDownException(f"NIC {nic} is down")
-    else:
-        logger.debug("All nics alive")
+async def step_down() -> None:
+    """
+    Hand over the sampling tasks, the memory stores would miss the new
+    leader's samples so they are dropped (open rollups persisted first).
+    """
+    await link_monitor.stop()
+    health.sampling_stopped()
+    open_rollups = rollups.open_documents()
+    sampler.reset()
+    recent_samples.reset()
+    rollups.reset()
+    threshold_engine.reset()
+    await save_rollups(open_rollups)
@@ -0,0 +1,218 @@
+""" Sliding window thresholds engine module """
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from loguru import logger
+from pymongo.errors import PyMongoError
+
+from config import settings
+from models import RateThresholds
+from utils import threshold_verdict
+
+
+def window_verdict(nic_name: str, upload_sum: float, download_sum: float,
+                   count: int) -> Dict:
+    """
+    :param nic_name: The specific nic's name.
+    :param upload_sum: Sum of upload rates in the window.
+    :param download_sum: Sum of download rates in the window.
+    :param count: Number of samples in the window.
+    :return: Threshold verdict of the window average rates.
+    """
+    upload_avg = upload_sum / count
+    download_avg = download_sum / count
+    verdict = threshold_verdict(dl=download_avg, ul=upload_avg,
+                                nic_name=nic_name)
+    verdict.update({
+        "upload_avg": round(upload_avg, 3),
+        "download_avg": round(download_avg, 3),
+        "samples": count,
+    })
+    return verdict
+
+
+class NicWindow:
+    """ A nic's samples in the sliding window with their running sums. """
+    __slots__ = ("samples", "upload_sum", "download_sum", "last_timestamp",
+                 "verdict")
+
+    def __init__(self):
+        self.samples: Deque[Tuple[float, float, float]] = deque()
+        self.upload_sum = 0.0
+        self.download_sum = 0.0
+        self.last_timestamp = float("-inf")
+        self.verdict: Optional[Dict] = None
+
+
+class ThresholdEngine:
+    """
+    Evaluate nics thresholds once per sample at ingest time.
+
+    Every nic keeps running upload/download sums over the sliding window,
+    so a new sample updates its window average in O(1) (amortized) and the
+    latest verdict is cached for lookups.
+    """
+
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self._windows: Dict[str, NicWindow] = {}
+
+    def add(self, nic_name: str, timestamp: float, upload: float,
+            download: float) -> Dict:
+        """
+        Add sample to the nic's window and evaluate the thresholds.
+
+        :returns: The nic's new verdict.
+        """
+        window = self._windows.get(nic_name)
+        if window is None:
+            window = self._windows[nic_name] = NicWindow()
+        elif timestamp < window.last_timestamp:
+            # Late sample (e.g. buffered by an agent), the window moved on
+            return window.verdict
+
+        window.samples.append((timestamp, upload, download))
+        window.upload_sum += upload
+        window.download_sum += download
+        window.last_timestamp = timestamp
+
+        cutoff = timestamp - self.window_seconds
+        while window.samples[0][0] <= cutoff:
+            _, old_upload, old_download = window.samples.popleft()
+            window.upload_sum -= old_upload
+            window.download_sum -= old_download
+
+        was_valid = (window.verdict is None or
+                     window.verdict["valid_threshold_check"])
+        window.verdict = window_verdict(nic_name, window.upload_sum,
+                                        window.download_sum,
+                                        len(window.samples))
+        if was_valid and not window.verdict["valid_threshold_check"]:
+            logger.warning(window.verdict["message"])
+        return window.verdict
+
+    def verdict(self, nic_name: str, now: float) -> Optional[Dict]:
+        """
+        :param nic_name: The specific nic's name.
+        :param now: Current epoch timestamp.
+        :returns: The nic's latest verdict, None if it has no samples
+        in the last window.
+        """
+        window = self._windows.get(nic_name)
+        if (window is None or
+                window.last_timestamp <= now - self.window_seconds):
+            return None
+        return window.verdict
+
+    def reset(self) -> None:
+        """ Drop all windows, verdicts are evaluated from db meanwhile. """
+        self._windows.clear()
+
+    def reevaluate(self) -> None:
+        """ Evaluate all cached verdicts again (after thresholds change). """
+        for nic_name, window in self._windows.items():
+            if window.samples:
+                window.verdict = window_verdict(nic_name, window.upload_sum,
+                                                window.download_sum,
+                                                len(window.samples))
+
+
+def current_thresholds() -> Tuple[int, int, int, int]:
+    """ :returns: The (dl min, dl max, ul min, ul max) thresholds. """
+    return (settings.DL_MIN_NIC_RATE_THRESHOLD,
+            settings.DL_MAX_NIC_RATE_THRESHOLD,
+            settings.UL_MIN_NIC_RATE_THRESHOLD,
+            settings.UL_MAX_NIC_RATE_THRESHOLD)
+
+
+class ThresholdsStore:
+    """
+    Keep the thresholds in db, so an update survives restarts and reaches
+    every worker process (each serves its own updates and evaluates its
+    own samples): workers reload the thresholds document every reload
+    interval and evaluate their cached verdicts again when it changed.
+    """
+
+    def __init__(self, name: str, engine: ThresholdEngine,
+                 reload_seconds: float, enabled: bool):
+        self.name = name
+        self.engine = engine
+        self.reload_seconds = reload_seconds
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    async def start(self) -> None:
+        """ Apply the persisted thresholds, then keep reloading them. """
+        try:
+            await self.load()
+        except PyMongoError as e:
+            self.failed_reloads += 1
+            logger.warning(f"Failed loading thresholds: {e}")
+        if self.enabled and not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def load(self) -> None:
+        """ Apply the persisted thresholds (if any) to the settings. """
+        document = await RateThresholds.get(self.name)
+        if document is None:
+            return
+        thresholds = (document.dl_min, document.dl_max, document.ul_min,
+                      document.ul_max)
+        if thresholds == current_thresholds():
+            return
+
+        (settings.DL_MIN_NIC_RATE_THRESHOLD,
+         settings.DL_MAX_NIC_RATE_THRESHOLD,
+         settings.UL_MIN_NIC_RATE_THRESHOLD,
+         settings.UL_MAX_NIC_RATE_THRESHOLD) = thresholds
+        self.engine.reevaluate()
+        self.reloads += 1
+        logger.info(f"Loaded thresholds {thresholds}")
+
+    async def save(self) -> None:
+        """ Persist the settings thresholds for all workers. """
+        dl_min, dl_max, ul_min, ul_max = current_thresholds()
+        await RateThresholds(id=self.name, dl_min=dl_min, dl_max=dl_max,
+                             ul_min=ul_min, ul_max=ul_max).save()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.load()
+            except PyMongoError as e:
+                self.failed_reloads += 1
+                logger.warning(f"Failed reloading thresholds: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "thresholds": current_thresholds(),
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+        }
+
+
+threshold_engine = ThresholdEngine(
+    window_seconds=settings.THRESHOLD_WINDOW_SECONDS,
+)
+thresholds_store = ThresholdsStore(
+    name=settings.THRESHOLDS_NAME,
+    engine=threshold_engine,
+    reload_seconds=settings.THRESHOLDS_RELOAD_SECONDS,
+    enabled=settings.WORKERS > 1,
+)
@@ -1,47 +1,30 @@
 """ Utilities module """
 import sys
+from datetime import datetime, timezone
+from typing import Dict
 
-from fastapi.responses import JSONResponse
 from loguru import logger
 
 from config import settings
 
 
-def rate_calculator_to_json_response(dl: float, ul: float,
-                                     nic_name: str) -> JSONResponse:
+def utc_now() -> datetime:
     """
-    Calc the nic rate and if passes the threshold indicate with
-    json response.
+    :returns: The current time, timezone aware UTC, as db compares the TTL
+    and time-series expiry against UTC.
+    """
+    return datetime.now(timezone.utc)
+
+
+def threshold_verdict(dl: float, ul: float, nic_name: str) -> Dict:
+    """
+    Calc the nic rate and indicate if it passes the thresholds.
 
     :param nic_name: The specific nic's name.
-    :param dl: Download at the last minute.
-    :param ul: Upload at the last minute.
-    :return: JsonResponse of what happened to return to client
+    :param dl: Download rate.
+    :param ul: Upload rate.
+    :return: The verdict json content.
     """
-    mapping = {
-        # [Download threshold detected, Upload threshold detected]
-        "[True, True]": JSONResponse(
-            content={
-                "valid_threshold_check": False,
-                "message": f"Both download and upload are passing thresholds "
-                           f"for nic {nic_name}.",
-            }),
-        "[True, False]": JSONResponse(
-            content={
-                "valid_threshold_check": False,
-                "message": f"Download is passing threshold for nic {nic_name}",
-            }),
-        "[False, True]": JSONResponse(
-            content={
-                "valid_threshold_check": False,
-                "message": f"Upload are passing threshold for nic {nic_name}",
-            }),
-        "[False, False]": JSONResponse(
-            content={
-                "valid_threshold_check": True,
-                "message": f"NICs rate aren't passing the thresholds.",
-            })
-    }
     dl_condition = (
             dl > settings.DL_MAX_NIC_RATE_THRESHOLD or
             dl < settings.DL_MIN_NIC_RATE_THRESHOLD
@@ -51,7 +34,25 @@ def rate_calculator_to_json_response(dl: float, ul: float,
             ul < settings.UL_MIN_NIC_RATE_THRESHOLD
     )
 
-    return mapping[str([dl_condition, up_condition])]
+    if dl_condition and up_condition:
+        message = (f"Both download and upload are passing thresholds "
+                   f"for nic {nic_name}.")
+    elif dl_condition:
+        message = f"Download is passing threshold for nic {nic_name}"
+    elif up_condition:
+        message = f"Upload are passing threshold for nic {nic_name}"
+    else:
+        message = "NICs rate aren't passing the thresholds."
+
+    return {
+        "valid_threshold_check": not (dl_condition or up_condition),
+        "message": message,
+    }
+
+
+def log_enabled(level: str) -> bool:
+    """ :returns: Whether logs of that level are logged (LOG_LEVEL). """
+    return logger.level(level).no >= logger.level(settings.LOG_LEVEL).no
 
 
 def config_logger() -> None:
@@ -59,6 +60,7 @@ def config_logger() -> None:
     logger.remove()
     logger.add(
         sys.stdout,
+        level=settings.LOG_LEVEL,
         colorize=True,
         format="<green>{time:HH:mm:ss}</green> | {level} | "
                "<level>{message}</level>",
@@ -0,0 +1,79 @@
+""" Compact columnar wire formats of bandwidth series """
+import json
+import sys
+from array import array
+from typing import Dict, Optional
+
+import msgpack
+
+from ring_buffer import Series
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.networkmonitor.columns+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+COLUMNAR_MEDIA_TYPES = (COLUMNAR_JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE)
+# Columns dtype of the msgpack format (numpy notation)
+MSGPACK_DTYPE = "<f8"
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    :param accept: The request Accept header.
+    :return: The first supported media type listed, json by default.
+    """
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in COLUMNAR_MEDIA_TYPES:
+            return media_type
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            return JSON_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def series_columns(nic_name: str, resolution: Optional[int],
+                   series: Series) -> Dict:
+    """
+    :param nic_name: The nic name the series belongs to.
+    :param resolution: The rollups resolution, None for raw samples.
+    :param series: The nic series, oldest first (not empty).
+    :return: The columns, timestamps as offsets (seconds) from the base
+    epoch timestamp.
+    """
+    base = series.timestamps[0]
+    return {
+        "nic_name": nic_name,
+        "resolution": resolution,
+        "base": base,
+        "offsets": array("d", [timestamp - base
+                               for timestamp in series.timestamps]),
+        "upload": series.uploads,
+        "download": series.downloads,
+    }
+
+
+def encode_series(media_type: str, nic_name: str,
+                  resolution: Optional[int], series: Series) -> bytes:
+    """
+    :param media_type: One of the columnar media types.
+    :param nic_name: The nic name the series belongs to.
+    :param resolution: The rollups resolution, None for raw samples.
+    :param series: The nic series, oldest first (not empty).
+    :return: The encoded columns, msgpack columns are raw little endian
+    float64 arrays.
+    """
+    columns = series_columns(nic_name, resolution, series)
+    if media_type == COLUMNAR_JSON_MEDIA_TYPE:
+        columns["offsets"] = [round(offset, 3)
+                              for offset in columns["offsets"]]
+        columns["upload"] = columns["upload"].tolist()
+        columns["download"] = columns["download"].tolist()
+        return json.dumps(columns).encode()
+
+    for name in ("offsets", "upload", "download"):
+        column = columns[name]
+        if sys.byteorder == "big":
+            column = array("d", column)
+            column.byteswap()
+        columns[name] = column.tobytes()
+    columns["dtype"] = MSGPACK_DTYPE
+    return msgpack.packb(columns)
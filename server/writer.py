@@ -0,0 +1,195 @@
+""" Buffered batch writer module """
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from config import settings
+from models import BandwidthSample
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BandwidthSampleWriter:
+    """
+    Write-behind buffer for bandwidth samples.
+
+    Samples are queued and flushed to db with a single insert_many when the
+    batch is full or the flush interval passed, whichever comes first.
+    The queue is bounded so producers wait (backpressure) when db falls
+    behind instead of piling up samples in memory.
+
+    A flush which failed without telling which samples were written (e.g.
+    a network error after db applied it) is only retried when samples ids
+    are unique (a regular collection), time-series collections would store
+    them twice.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float,
+                 max_queue_size: int, max_retries: int,
+                 retry_unknown: bool = True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.retry_unknown = retry_unknown
+
+        # Created right away so samples can be queued before start()
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.flushed_samples = 0
+        self.dropped_samples = 0
+        # Not retried, they may or may not have been written
+        self.unconfirmed_samples = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        """ Start the background flushing task. """
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Bandwidth samples writer started")
+
+    async def stop(self) -> None:
+        """ Flush everything queued so far and stop the flushing task. """
+        if not self._task:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("Bandwidth samples writer stopped")
+
+    async def put(self, sample: BandwidthSample) -> None:
+        """
+        Queue sample to be written, waits while the queue is full.
+
+        :param sample: The bandwidth sample to write.
+        """
+        await self._queue.put(sample)
+
+    async def _run(self) -> None:
+        """ Collect samples into batches and flush them until stopped. """
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    sample = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        sample = await asyncio.wait_for(self._queue.get(),
+                                                        timeout=timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if sample is None:
+                    stopping = True
+                    break
+                batch.append(sample)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[BandwidthSample]) -> None:
+        """
+        Write batch to db with a single unordered insert_many. After a
+        partial failure only the samples which weren't written are retried,
+        after an unknown outcome the whole batch is (unless retry_unknown
+        is off).
+
+        :param batch: The samples to write.
+        """
+        pending = batch
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                await BandwidthSample.insert_many(pending, ordered=False)
+            except BulkWriteError as e:
+                # Unordered, all but the failed samples were written, a
+                # duplicate id was written by an earlier attempt
+                failed = sorted(
+                    error["index"] for error in e.details["writeErrors"]
+                    if error["code"] != DUPLICATE_KEY_ERROR)
+                self.flushed_samples += len(pending) - len(failed)
+                pending = [pending[index] for index in failed]
+                if not pending:
+                    self._flushed(time.perf_counter() - start)
+                    return
+                error = e
+            except ServerSelectionTimeoutError as e:
+                # No server was reached, nothing was written
+                error = e
+            except Exception as e:
+                if not self.retry_unknown:
+                    self.failed_flushes += 1
+                    self.unconfirmed_samples += len(pending)
+                    logger.error(f"Flush of {len(pending)} samples failed "
+                                 f"with an unknown outcome, not retried "
+                                 f"(they may be written already): {e}")
+                    return
+                error = e
+            else:
+                self.flushed_samples += len(pending)
+                self._flushed(time.perf_counter() - start)
+                return
+
+            self.failed_flushes += 1
+            logger.warning(f"Flush of {len(pending)} samples failed "
+                           f"(attempt {attempt}/{self.max_retries}): {error}")
+            await asyncio.sleep(self.flush_interval)
+
+        self.dropped_samples += len(pending)
+        logger.error(f"Dropped {len(pending)} samples after "
+                     f"{self.max_retries} failed flushes")
+
+    def _flushed(self, latency: float) -> None:
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.total_flush_latency += latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def stats(self) -> Dict:
+        """ :returns: The writer metrics. """
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self.max_queue_size,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_samples": self.flushed_samples,
+            "dropped_samples": self.dropped_samples,
+            "unconfirmed_samples": self.unconfirmed_samples,
+            "last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+            "avg_flush_latency_ms": round(
+                self.total_flush_latency / self.flushes * 1000, 3
+            ) if self.flushes else 0.0,
+            "max_flush_latency_ms": round(self.max_flush_latency * 1000, 3),
+        }
+
+
+sample_writer = BandwidthSampleWriter(
+    batch_size=settings.WRITER_BATCH_SIZE,
+    flush_interval=settings.WRITER_FLUSH_INTERVAL,
+    max_queue_size=settings.WRITER_MAX_QUEUE_SIZE,
+    max_retries=settings.WRITER_MAX_RETRIES,
+    # Time-series collections have no unique _id to catch a duplicate
+    retry_unknown=not settings.BW_TIMESERIES,
+)
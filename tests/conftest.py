@@ -0,0 +1,29 @@
+""" Test suite configuration, the packages import their modules flat """
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# pcap_parser goes first, its main module holds the rdpcap handlers (the
+# server's main isn't imported by the tests)
+for directory in ("benchmarks", "server", "pcap_parser"):
+    sys.path.insert(0, str(ROOT / directory))
+
+
+@pytest.fixture
+def documents():
+    """ The db documents models, initialized on an in-memory db. """
+    from beanie import init_beanie
+    from mongomock_motor import AsyncMongoMockClient
+
+    from models import (
+        NIC, BandwidthRollup, BandwidthSample, LeaderLease, NicLinkEvent,
+        RateThresholds,
+    )
+    asyncio.run(init_beanie(
+        database=AsyncMongoMockClient(tz_aware=True)["tests"],
+        document_models=[NIC, BandwidthSample, BandwidthRollup, LeaderLease,
+                         NicLinkEvent, RateThresholds]))
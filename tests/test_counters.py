@@ -0,0 +1,54 @@
+""" Nic byte counters tests """
+from counters import COUNTER_32_MODULO, ProcNetDevCounters, counter_delta
+
+PROC_NET_DEV_HEADER = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    \
+packets errs drop fifo colls carrier compressed
+"""
+PROC_NET_DEV_LINE = ("{name:>6}: {received} 10 0 0 0 0 0 0 {sent} 10 0 0 0 0 "
+                     "0 0\n")
+
+
+def write_proc_net_dev(path, counters):
+    """ :param counters: Mapping of nic name to its (sent, received). """
+    path.write_text(PROC_NET_DEV_HEADER + "".join(
+        PROC_NET_DEV_LINE.format(name=name, sent=sent, received=received)
+        for name, (sent, received) in counters.items()))
+
+
+def test_counter_delta_grows():
+    assert counter_delta(1500, 1000) == 500
+    assert counter_delta(1000, 1000) == 0
+
+
+def test_counter_delta_reset():
+    # The counter went back, it restarted from zero
+    assert counter_delta(300, 10 ** 12) == 300
+    assert counter_delta(300, 10 ** 12, is_32_bit=False) == 300
+
+
+def test_counter_delta_32_bit_wrap():
+    last = COUNTER_32_MODULO - 100
+    assert counter_delta(50, last, is_32_bit=True) == 150
+
+
+def test_proc_net_dev_counters(tmp_path):
+    path = tmp_path / "dev"
+    write_proc_net_dev(path, {"lo": (1000, 1000), "eth0": (2000, 5000)})
+    counters = ProcNetDevCounters(path=str(path), nics_32_bit=["eth1"])
+    try:
+        assert counters.read() == {"lo": (1000, 1000), "eth0": (2000, 5000)}
+
+        # eth0 was reset, eth1 (32 bit) is new
+        write_proc_net_dev(path, {"lo": (1500, 1200), "eth0": (100, 300),
+                                  "eth1": (COUNTER_32_MODULO - 10, 0)})
+        assert counters.read() == {"lo": (1500, 1200), "eth0": (2100, 5300),
+                                   "eth1": (COUNTER_32_MODULO - 10, 0)}
+
+        # eth1 wrapped around, lo was removed
+        write_proc_net_dev(path, {"eth0": (200, 300), "eth1": (20, 5)})
+        assert counters.read() == {"eth0": (2200, 5300),
+                                   "eth1": (COUNTER_32_MODULO + 20, 5)}
+    finally:
+        counters.close()
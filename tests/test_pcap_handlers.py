@@ -0,0 +1,104 @@
+""" Pcap handlers parity tests on synthetic captures """
+import mmap
+
+import pytest
+from scapy.all import rdpcap, wrpcapng
+
+from analytics import PcapAnalytics
+from fastpath import FastPcapHandler, RecordBoundaryError, chunk_boundaries
+from index import FlowIndex, IndexedPcapHandler, build
+from main import PcapHandler, StreamingPcapHandler
+from parallel import ParallelPcapHandler, scan_chunk
+from synthetic import write_pcap
+
+PACKETS = 1500
+
+
+def report(handler):
+    return (handler.packets_count, handler.sessions_count,
+            handler.dns_queries_count, handler.http_payload)
+
+
+@pytest.fixture(scope="module", params=["pcap", "pcapng"])
+def capture(request, tmp_path_factory):
+    """ :returns: A synthetic capture path and its rdpcap report. """
+    directory = tmp_path_factory.mktemp("captures")
+    path = write_pcap(directory / "synthetic.pcap", PACKETS, seed=7)
+    if request.param == "pcapng":
+        pcapng_path = directory / "synthetic.pcapng"
+        wrpcapng(str(pcapng_path), rdpcap(str(path)))
+        path = pcapng_path
+    return str(path), report(PcapHandler(str(path)))
+
+
+def test_rdpcap_report(capture):
+    _, (packets_count, sessions_count, dns_queries_count,
+        http_payload) = capture
+    assert packets_count == PACKETS
+    assert sessions_count and dns_queries_count and http_payload
+
+
+def test_streaming_matches_rdpcap(capture):
+    path, expected = capture
+    assert report(StreamingPcapHandler(path)) == expected
+
+
+def test_fast_path_matches_rdpcap(capture):
+    path, expected = capture
+    assert report(FastPcapHandler(path)) == expected
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_matches_rdpcap(capture, workers):
+    path, expected = capture
+    assert report(ParallelPcapHandler([path], workers=workers)) == expected
+
+
+@pytest.mark.parametrize("workers", [2, 5])
+def test_parallel_chunks_match_rdpcap(capture, workers):
+    path, expected = capture
+    handler = ParallelPcapHandler([path], workers=workers, chunk_min_bytes=0)
+    assert report(handler) == expected
+
+
+def test_parallel_many_files(capture):
+    path, _ = capture
+    chunked = ParallelPcapHandler([path, path], workers=3, chunk_min_bytes=0)
+    whole = ParallelPcapHandler([path, path], workers=3)
+    assert report(chunked) == report(whole)
+    assert chunked.packets_count == 2 * PACKETS
+
+
+def test_indexed_matches_rdpcap(capture, tmp_path):
+    path, expected = capture
+    index_path = build(path, str(tmp_path / "capture.idx"))
+    with FlowIndex(path, index_path) as flow_index:
+        assert report(IndexedPcapHandler(flow_index)) == expected
+
+
+def test_chunk_boundaries_are_records(capture):
+    path, (packets_count, *_) = capture
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            boundaries, section = chunk_boundaries(buf, 4)
+    assert len(boundaries) == 5
+    assert boundaries == sorted(set(boundaries))
+
+    counts = [scan_chunk(path, start, end, section)[0].packets_count
+              for start, end in zip(boundaries, boundaries[1:])]
+    assert all(counts)
+    assert sum(counts) == packets_count
+
+    # A chunk end which isn't the next record's start
+    with pytest.raises(RecordBoundaryError):
+        scan_chunk(path, boundaries[0], boundaries[1] + 4, section)
+
+
+def test_analytics_packets(capture):
+    path, (packets_count, *_) = capture
+    analytics = PcapAnalytics([path], interval=0.1)
+    assert analytics.packets_count == packets_count
+    throughput = analytics.throughput()
+    assert sum(row["packets"] for row in throughput) == packets_count
+    assert [row["time"] for row in throughput] == sorted(
+        row["time"] for row in throughput)
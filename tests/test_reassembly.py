@@ -0,0 +1,99 @@
+""" TCP stream reassembly tests """
+from reassembly import TCP_FIN, TCP_SYN, SEQ_MODULO, TcpReassembler
+
+SESSION = "TCP 10.0.0.1:1234 > 10.0.0.2:80"
+REQUEST = b"GET / HTTP/1.1\r\nHost: example.com\r\n\r\n"
+ACK = 0x10
+
+
+def segments(data: bytes, start_seq: int, size: int):
+    """ :returns: The (seq, payload) segments of data. """
+    return [((start_seq + offset) % SEQ_MODULO, data[offset:offset + size])
+            for offset in range(0, len(data), size)]
+
+
+def reassemble(packets, **kwargs):
+    """ :param packets: The (seq, flags, payload) of the request side. """
+    reassembler = TcpReassembler(**kwargs)
+    for index, (seq, flags, payload) in enumerate(packets):
+        reassembler.add(SESSION, seq, flags, payload, float(index),
+                        (0, index), True)
+    return reassembler.finish()[SESSION]
+
+
+def test_in_order():
+    packets = [(99, TCP_SYN, b"")] + [
+        (seq, ACK, payload) for seq, payload in segments(REQUEST, 100, 10)]
+    payload, endtime, is_request, position = reassemble(packets)
+
+    assert payload == REQUEST.split(b"\r\n")
+    assert endtime == float(len(packets) - 1)
+    assert is_request
+    assert position == (0, 0)
+
+
+def test_out_of_order_and_retransmitted():
+    parts = segments(REQUEST, 100, 8)
+    packets = [(99, TCP_SYN, b"")] + [
+        (seq, ACK, payload) for seq, payload in
+        [parts[1], parts[0], parts[0], parts[3], parts[2]] + parts[4:]]
+    payload, *_ = reassemble(packets)
+
+    assert payload == REQUEST.split(b"\r\n")
+
+
+def test_overlapping_segments():
+    packets = [(99, TCP_SYN, b""), (100, ACK, REQUEST[:20]),
+               (110, ACK, REQUEST[10:30]), (130, ACK, REQUEST[30:])]
+    payload, *_ = reassemble(packets)
+
+    assert payload == REQUEST.split(b"\r\n")
+
+
+def test_sequence_wraparound():
+    start = SEQ_MODULO - 15
+    packets = [(start - 1, TCP_SYN, b"")] + [
+        (seq, ACK, payload) for seq, payload in segments(REQUEST, start, 6)]
+    payload, *_ = reassemble(packets)
+
+    assert payload == REQUEST.split(b"\r\n")
+
+
+def test_messages_split_by_content_length():
+    body = b"x" * 5
+    message = (b"POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\n" + body +
+               REQUEST)
+    packets = [(99, TCP_SYN, b"")] + [
+        (seq, ACK, payload) for seq, payload in segments(message, 100, 7)]
+    payload, *_ = reassemble(packets)
+
+    assert payload == (b"POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\n" +
+                       body).split(b"\r\n") + REQUEST.split(b"\r\n")
+
+
+def test_lost_segment_skipped_on_fin():
+    parts = segments(REQUEST, 100, 10)
+    packets = [(99, TCP_SYN, b"")] + [
+        (seq, ACK, payload) for seq, payload in parts if seq != 110] + [
+        (100 + len(REQUEST), TCP_FIN, b"")]
+    payload, *_ = reassemble(packets)
+
+    missing = REQUEST[:10] + REQUEST[20:]
+    assert b"".join(payload) == missing.replace(b"\r\n", b"")
+
+
+def test_flow_memory_bound():
+    reassembler = TcpReassembler(max_flow_bytes=150)
+    packets = [(99, TCP_SYN, b""), (100, ACK, b"A" * 100),
+               (1100, ACK, b"B" * 100), (2100, ACK, b"C" * 100)]
+    for index, (seq, flags, payload) in enumerate(packets):
+        reassembler.add(SESSION, seq, flags, payload, float(index),
+                        (0, index), True)
+
+    # The gaps were given up on instead of buffering past the bound
+    stream = reassembler._streams[SESSION]
+    assert stream.pending_bytes + len(stream.buffer) <= 150
+    assert b"".join(reassembler.sessions[SESSION][0]) == b"A" * 100 + \
+        b"B" * 100
+    payload = reassembler.finish()[SESSION][0]
+    assert b"".join(payload) == b"A" * 100 + b"B" * 100 + b"C" * 100
@@ -0,0 +1,60 @@
+""" Recent samples ring buffers tests """
+from ring_buffer import NicRingBuffer, RingBufferStore
+
+
+def test_ring_buffer_evicts_oldest():
+    buffer = NicRingBuffer(capacity=3)
+    for timestamp in range(1, 6):
+        buffer.append(float(timestamp), timestamp * 10.0, timestamp * 20.0)
+
+    assert len(buffer) == 3
+    assert buffer.latest == 5.0
+    assert buffer.evicted_until == 2.0
+    window = buffer.window(float("-inf"))
+    assert list(window.timestamps) == [3.0, 4.0, 5.0]
+    assert list(window.uploads) == [30.0, 40.0, 50.0]
+    assert list(window.downloads) == [60.0, 80.0, 100.0]
+
+
+def test_ring_buffer_window_across_wrap():
+    buffer = NicRingBuffer(capacity=4)
+    for timestamp in range(1, 8):
+        buffer.append(float(timestamp), 0.0, 0.0)
+
+    assert list(buffer.window(4.0).timestamps) == [5.0, 6.0, 7.0]
+    assert list(buffer.window(3.5).timestamps) == [4.0, 5.0, 6.0, 7.0]
+    assert list(buffer.window(7.0).timestamps) == []
+
+
+def test_store_covers():
+    store = RingBufferStore(capacity=3)
+    assert not store.covers("eth0", 0.0)
+
+    for timestamp in (10.0, 11.0, 12.0):
+        store.append("eth0", timestamp, 1.0, 1.0)
+    # Samples before the first one appended may be only in db
+    assert not store.covers("eth0", 9.0)
+    assert store.covers("eth0", 10.0)
+    # A nic this process never sampled
+    assert not store.covers("eth1", 10.0)
+
+    # Windows start after since, 10 is no longer needed
+    store.append("eth0", 13.0, 1.0, 1.0)
+    assert store.covers("eth0", 10.0)
+    store.append("eth0", 14.0, 1.0, 1.0)
+    assert not store.covers("eth0", 10.5)
+    assert store.covers("eth0", 11.0)
+
+
+def test_store_invalidate_late_sample():
+    store = RingBufferStore(capacity=10)
+    for timestamp in (10.0, 11.0, 12.0):
+        store.append("eth0", timestamp, 1.0, 1.0)
+
+    store.invalidate("eth0", 11.5)
+    assert not store.covers("eth0", 11.0)
+    assert store.covers("eth0", 11.5)
+
+    store.reset()
+    assert not store.covers("eth0", 11.5)
+    assert len(store.window("eth0", 0.0).timestamps) == 0
@@ -0,0 +1,129 @@
+""" Rollup tiers tests """
+import pytest
+
+from config import settings
+from rollups import RollupStore, RollupTier
+
+
+def minute_tier(retention: int = 3, keep_sketches: bool = True) -> RollupTier:
+    return RollupTier(resolution=60, retention=retention,
+                      keep_sketches=keep_sketches)
+
+
+def test_tier_closes_buckets():
+    tier = minute_tier()
+    assert tier.add("eth0", 0.0, 1.0, 2.0) is None
+    assert tier.add("eth0", 30.0, 3.0, 4.0) is None
+
+    closed = tier.add("eth0", 60.0, 5.0, 6.0)
+    assert closed.start == 0.0
+    assert closed.count == 2
+    assert closed.upload_sum == 4.0
+    assert (closed.download_min, closed.download_max) == (2.0, 4.0)
+    assert tier.current("eth0").start == 60.0
+
+
+def test_late_sample_of_bucket_in_memory():
+    tier = minute_tier()
+    for timestamp in (0.0, 60.0, 120.0):
+        tier.add("eth0", timestamp, 1.0, 1.0)
+
+    late = tier.add("eth0", 65.0, 3.0, 3.0)
+    # The late bucket is persisted next to the closed one's document
+    assert (late.start, late.count, late.upload_sum) == (60.0, 1, 3.0)
+    bucket = tier.window("eth0", 60.0)[0]
+    assert (bucket.start, bucket.count, bucket.upload_sum) == (60.0, 2, 4.0)
+    assert tier.covers("eth0", 60.0)
+
+
+def test_late_sample_older_than_memory():
+    tier = minute_tier(retention=2)
+    for timestamp in (0.0, 60.0, 120.0, 180.0):
+        tier.add("eth0", timestamp, 1.0, 1.0)
+    # The 0 and 60 buckets were evicted
+    assert tier.covers("eth0", 120.0)
+    assert not tier.covers("eth0", 119.0)
+
+    tier.add("eth0", 130.0, 1.0, 1.0)
+    assert tier.window("eth0", 120.0)[0].count == 2
+    late = tier.add("eth0", 10.0, 1.0, 1.0)
+    assert late.start == 0.0
+
+
+def test_late_sample_of_bucket_never_in_memory():
+    tier = minute_tier()
+    tier.add("eth0", 0.0, 1.0, 1.0)
+    tier.add("eth0", 180.0, 1.0, 1.0)
+    assert tier.covers("eth0", 60.0)
+
+    # Its bucket (120) has its samples only in db
+    tier.add("eth0", 150.0, 1.0, 1.0)
+    assert not tier.covers("eth0", 120.0)
+    assert tier.covers("eth0", 180.0)
+
+
+def test_window_overlapping_buckets():
+    tier = minute_tier(retention=10)
+    for timestamp in range(0, 600, 60):
+        tier.add("eth0", float(timestamp), 1.0, 1.0)
+
+    starts = [bucket.start for bucket in tier.window("eth0", 400.0)]
+    assert starts == [360.0, 420.0, 480.0, 540.0]
+
+
+@pytest.mark.usefixtures("documents")
+def test_drop_sketches_of_closed_buckets():
+    store = RollupStore(tiers=[minute_tier(keep_sketches=False)])
+    store.add("eth0", 0.0, 1.0, 1.0)
+    documents = store.add("eth0", 60.0, 1.0, 1.0)
+
+    assert len(documents) == 1
+    assert documents[0].samples_count == 1
+    assert documents[0].upload_sketch
+    closed = store.tiers[60].window("eth0", -60.0)[0]
+    assert closed.upload_sketch is None
+    assert store.tiers[60].current("eth0").upload_sketch is not None
+
+
+@pytest.mark.usefixtures("documents")
+def test_batch_documents_of_every_tier():
+    store = RollupStore(tiers=[
+        minute_tier(), RollupTier(resolution=3600, retention=3,
+                                  keep_sketches=True)])
+    documents = store.batch_documents([("eth0", 0.0, 1.0, 2.0),
+                                       ("eth0", 70.0, 3.0, 4.0),
+                                       ("eth1", 10.0, 5.0, 6.0)])
+
+    buckets = {(document.nic_name, document.resolution,
+                document.timestamp.timestamp()): document.samples_count
+               for document in documents}
+    assert buckets == {("eth0", 60, 0.0): 1, ("eth0", 60, 60.0): 1,
+                       ("eth0", 3600, 0.0): 2, ("eth1", 60, 0.0): 1,
+                       ("eth1", 3600, 0.0): 1}
+    # Not kept in memory
+    assert store.tiers[60].current("eth0") is None
+
+
+def test_stats_resolution():
+    store = RollupStore(tiers=[
+        minute_tier(), RollupTier(resolution=3600, retention=3,
+                                  keep_sketches=True)])
+    assert store.stats_resolution(3600, max_buckets=100) == 60
+    assert store.stats_resolution(7 * 24 * 3600, max_buckets=100) == 3600
+    assert store.stats_resolution(365 * 24 * 3600, max_buckets=100) == 3600
+
+
+@pytest.mark.parametrize("window_seconds, max_points, resolution", [
+    (60, 100, None),
+    (3600, 100, 60),
+    (24 * 3600, 100, 3600),
+    (365 * 24 * 3600, 100, 3600),
+])
+def test_select_resolution(monkeypatch, window_seconds, max_points,
+                           resolution):
+    monkeypatch.setattr(settings, "ADAPTIVE_SAMPLING", False)
+    monkeypatch.setattr(settings, "INTERVAL_TASK_BW_SAMPLE", 5)
+    store = RollupStore(tiers=[
+        minute_tier(), RollupTier(resolution=3600, retention=3,
+                                  keep_sketches=True)])
+    assert store.select_resolution(window_seconds, max_points) == resolution
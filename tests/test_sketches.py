@@ -0,0 +1,87 @@
+""" Quantile sketches tests """
+import math
+import random
+
+import pytest
+
+from sketches import DDSketch
+
+RELATIVE_ACCURACY = 0.01
+QUANTILES = (0.0, 0.1, 0.5, 0.9, 0.95, 0.99, 1.0)
+
+
+def exact_quantile(values, q):
+    """ The value of the rank the sketch estimates. """
+    return sorted(values)[math.floor(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_quantiles_within_relative_accuracy(seed):
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(0, 2) for _ in range(5000)]
+    sketch = DDSketch(relative_accuracy=RELATIVE_ACCURACY, min_value=1e-9)
+    for value in values:
+        sketch.add(value)
+
+    for q in QUANTILES:
+        exact = exact_quantile(values, q)
+        assert sketch.quantile(q) == pytest.approx(
+            exact, rel=RELATIVE_ACCURACY * 1.001)
+
+
+def test_values_below_min_count_as_zero():
+    sketch = DDSketch(min_value=0.001)
+    for value in (0.0, 0.0005, 0.0, 5.0):
+        sketch.add(value)
+
+    assert sketch.count == 4
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(5.0, rel=0.01)
+    assert DDSketch().quantile(0.5) is None
+
+
+def test_merge_matches_single_sketch():
+    rng = random.Random(1)
+    values = [rng.uniform(0, 1000) for _ in range(2000)]
+    whole, first, second = DDSketch(), DDSketch(), DDSketch()
+    for value in values:
+        whole.add(value)
+    for value in values[:700]:
+        first.add(value)
+    for value in values[700:]:
+        second.add(value)
+
+    first.merge(second)
+    assert first.count == whole.count
+    assert first.zero_count == whole.zero_count
+    for q in QUANTILES:
+        assert first.quantile(q) == whole.quantile(q)
+
+    with pytest.raises(ValueError):
+        first.merge(DDSketch(relative_accuracy=0.05))
+
+
+def test_max_bins_collapse_lowest():
+    sketch = DDSketch(max_bins=256)
+    for exponent in range(-3, 12):
+        for _ in range(10):
+            sketch.add(10.0 ** exponent)
+
+    assert len(sketch.counts) <= 256
+    assert sketch.count == 150
+    # 256 bins span about 170x, only the lowest quantiles lose accuracy
+    assert sketch.quantile(1.0) == pytest.approx(1e11, rel=0.01)
+    assert sketch.quantile(0.9) == pytest.approx(1e10, rel=0.01)
+
+
+def test_document_round_trip():
+    sketch = DDSketch()
+    for value in (0.0, 0.5, 3.0, 3.0, 70.0):
+        sketch.add(value)
+
+    restored = DDSketch.from_document(sketch.to_document())
+    assert restored.count == sketch.count
+    for q in QUANTILES:
+        assert restored.quantile(q) == sketch.quantile(q)
+    assert DDSketch.from_document({}).count == 0
@@ -0,0 +1,66 @@
+""" Sliding window thresholds engine tests """
+import pytest
+
+from config import settings
+from thresholds import ThresholdEngine
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(settings, "DL_MIN_NIC_RATE_THRESHOLD", 0)
+    monkeypatch.setattr(settings, "DL_MAX_NIC_RATE_THRESHOLD", 5)
+    monkeypatch.setattr(settings, "UL_MIN_NIC_RATE_THRESHOLD", 0)
+    monkeypatch.setattr(settings, "UL_MAX_NIC_RATE_THRESHOLD", 3)
+
+
+def test_window_sums_slide():
+    engine = ThresholdEngine(window_seconds=30)
+    for timestamp, upload, download in ((0, 1.0, 2.0), (10, 2.0, 4.0),
+                                        (20, 3.0, 6.0)):
+        verdict = engine.add("eth0", timestamp, upload, download)
+    assert verdict["samples"] == 3
+    assert verdict["upload_avg"] == 2.0
+    assert verdict["download_avg"] == 4.0
+
+    # The sample at 0 leaves the window
+    verdict = engine.add("eth0", 30, 6.0, 12.0)
+    assert verdict["samples"] == 3
+    assert verdict["upload_avg"] == pytest.approx(11 / 3, abs=0.001)
+    assert verdict["download_avg"] == pytest.approx(22 / 3, abs=0.001)
+    assert not verdict["valid_threshold_check"]
+
+
+def test_window_of_each_nic():
+    engine = ThresholdEngine(window_seconds=60)
+    engine.add("eth0", 0, 10.0, 10.0)
+    verdict = engine.add("eth1", 0, 1.0, 1.0)
+
+    assert verdict["valid_threshold_check"]
+    assert not engine.verdict("eth0", 1)["valid_threshold_check"]
+
+
+def test_late_sample_ignored():
+    engine = ThresholdEngine(window_seconds=60)
+    engine.add("eth0", 100, 1.0, 1.0)
+    verdict = engine.add("eth0", 50, 100.0, 100.0)
+
+    assert verdict["samples"] == 1
+    assert verdict["valid_threshold_check"]
+
+
+def test_verdict_expires_with_window():
+    engine = ThresholdEngine(window_seconds=60)
+    assert engine.verdict("eth0", 0) is None
+    engine.add("eth0", 100, 1.0, 1.0)
+
+    assert engine.verdict("eth0", 159)["samples"] == 1
+    assert engine.verdict("eth0", 160) is None
+
+
+def test_reevaluate_after_thresholds_change(monkeypatch):
+    engine = ThresholdEngine(window_seconds=60)
+    assert engine.add("eth0", 0, 1.0, 4.0)["valid_threshold_check"]
+
+    monkeypatch.setattr(settings, "DL_MAX_NIC_RATE_THRESHOLD", 3)
+    engine.reevaluate()
+    assert not engine.verdict("eth0", 1)["valid_threshold_check"]
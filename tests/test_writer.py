@@ -0,0 +1,110 @@
+""" Buffered bandwidth samples writer tests """
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError, NetworkTimeout
+
+from models import BandwidthSample
+from writer import DUPLICATE_KEY_ERROR, BandwidthSampleWriter
+
+
+class FakeInsert:
+    """ BandwidthSample.insert_many failing with the given errors first. """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def __call__(self, documents, ordered=True):
+        self.calls.append([document.nic_name for document in documents])
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def bulk_write_error(*codes_by_index):
+    return BulkWriteError({"writeErrors": [
+        {"index": index, "code": code, "errmsg": "failed"}
+        for index, code in codes_by_index]})
+
+
+def samples(count):
+    return [BandwidthSample.construct(nic_name=f"eth{index}")
+            for index in range(count)]
+
+
+def flush(writer, insert, monkeypatch, batch):
+    monkeypatch.setattr(BandwidthSample, "insert_many", insert)
+    asyncio.run(writer._flush(batch))
+
+
+@pytest.fixture
+def writer():
+    return BandwidthSampleWriter(batch_size=10, flush_interval=0.001,
+                                 max_queue_size=10, max_retries=3)
+
+
+def test_retry_only_failed_samples(writer, monkeypatch):
+    insert = FakeInsert(bulk_write_error((1, 121), (3, 121)))
+    flush(writer, insert, monkeypatch, samples(4))
+
+    assert insert.calls == [["eth0", "eth1", "eth2", "eth3"],
+                            ["eth1", "eth3"]]
+    assert writer.flushed_samples == 4
+    assert writer.failed_flushes == 1
+    assert writer.dropped_samples == 0
+
+
+def test_duplicates_of_earlier_attempt_count_as_written(writer, monkeypatch):
+    insert = FakeInsert(bulk_write_error((0, DUPLICATE_KEY_ERROR),
+                                         (2, DUPLICATE_KEY_ERROR)))
+    flush(writer, insert, monkeypatch, samples(3))
+
+    assert len(insert.calls) == 1
+    assert writer.flushed_samples == 3
+    assert writer.failed_flushes == 0
+
+
+def test_drop_after_max_retries(writer, monkeypatch):
+    insert = FakeInsert(*[bulk_write_error((0, 121))] * 3)
+    flush(writer, insert, monkeypatch, samples(2))
+
+    assert insert.calls == [["eth0", "eth1"], ["eth0"], ["eth0"]]
+    assert writer.flushed_samples == 1
+    assert writer.dropped_samples == 1
+
+
+def test_unknown_outcome_retried_with_unique_ids(writer, monkeypatch):
+    insert = FakeInsert(NetworkTimeout("timed out"))
+    flush(writer, insert, monkeypatch, samples(2))
+
+    assert len(insert.calls) == 2
+    assert writer.flushed_samples == 2
+    assert writer.unconfirmed_samples == 0
+
+
+def test_unknown_outcome_not_retried_without_unique_ids(monkeypatch):
+    # Time-series collections
+    writer = BandwidthSampleWriter(batch_size=10, flush_interval=0.001,
+                                   max_queue_size=10, max_retries=3,
+                                   retry_unknown=False)
+    insert = FakeInsert(NetworkTimeout("timed out"))
+    flush(writer, insert, monkeypatch, samples(2))
+
+    assert len(insert.calls) == 1
+    assert writer.flushed_samples == 0
+    assert writer.unconfirmed_samples == 2
+
+
+def test_put_before_start_then_flush(writer, monkeypatch):
+    insert = FakeInsert()
+    monkeypatch.setattr(BandwidthSample, "insert_many", insert)
+
+    async def run():
+        for sample in samples(3):
+            await writer.put(sample)
+        await writer.start()
+        await writer.stop()
+
+    asyncio.run(run())
+    assert insert.calls == [["eth0", "eth1", "eth2"]]
+    assert writer.queue_depth == 0